@@ -0,0 +1,89 @@
+import bisect
+import logging
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, Tuple
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+PROMPT_LENGTH_BUCKETS = [500, 2000, 5000]  # characters; prompts up to each bound share latency samples
+SAMPLE_WINDOW = 200  # most recent attempt latencies kept per model, prompt length and mode
+MIN_SAMPLES = 20  # below this the caller's default timeout applies
+TIMEOUT_QUANTILE = 0.99
+TIMEOUT_HEADROOM = 2.0  # timeout = headroom x the observed quantile
+MIN_TIMEOUT = 5  # seconds
+MAX_TIMEOUT = 120  # seconds
+
+
+class AdaptiveTimeouts:
+    """
+    Per-attempt timeouts learned from observed latencies, per model and
+    prompt-length bucket. For streamed requests the latency is the wait for the
+    first token (the longest gap the read timeout has to cover), otherwise the
+    whole answer. Attempts that time out are recorded at their timeout, so a
+    bucket whose requests keep hitting it grows its timeout instead of retrying
+    work that was nearly done.
+    """
+
+    def __init__(self, min_timeout: float = MIN_TIMEOUT, max_timeout: float = MAX_TIMEOUT):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, int, bool], deque] = {}
+
+    @staticmethod
+    def _key(model_name: str, prompt_length: int, stream: bool) -> Tuple[str, int, bool]:
+        return model_name, bisect.bisect_left(PROMPT_LENGTH_BUCKETS, prompt_length), stream
+
+    def observe(self, model_name: str, prompt_length: int, stream: bool, seconds: float):
+        key = self._key(model_name, prompt_length, stream)
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=SAMPLE_WINDOW)
+            self._samples[key].append(seconds)
+
+    def _quantile(self, key: Tuple[str, int, bool], q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def _timeout(self, key: Tuple[str, int, bool]) -> Optional[float]:
+        observed = self._quantile(key, TIMEOUT_QUANTILE)
+        if observed is None:
+            return None
+        return min(self.max_timeout, max(self.min_timeout, TIMEOUT_HEADROOM * observed))
+
+    def timeout_for(self, model_name: str, prompt_length: int, stream: bool, default: float) -> float:
+        """Timeout for one attempt; default until the bucket has MIN_SAMPLES latencies"""
+        timeout = self._timeout(self._key(model_name, prompt_length, stream))
+        return default if timeout is None else timeout
+
+    def typical(self, model_name: str, prompt_length: int, stream: bool) -> Optional[float]:
+        """Median latency of the bucket, or None while it has too few samples"""
+        return self._quantile(self._key(model_name, prompt_length, stream), 0.5)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = {key: len(samples) for key, samples in self._samples.items()}
+        return {
+            "buckets": [
+                {
+                    "model": key[0],
+                    "max_prompt_length": PROMPT_LENGTH_BUCKETS[key[1]] if key[1] < len(PROMPT_LENGTH_BUCKETS) else None,
+                    "stream": key[2],
+                    "samples": count,
+                    "timeout": self._timeout(key),
+                }
+                for key, count in sorted(counts.items())
+            ]
+        }
+
+
+@st.cache_resource
+def get_adaptive_timeouts() -> AdaptiveTimeouts:
+    """Process-wide latency samples shared by every session"""
+    return AdaptiveTimeouts()
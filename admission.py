@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from typing import Optional, Dict, Any
+
+import streamlit as st
+
+from ollama_client import OLLAMA_BACKENDS
+
+logger = logging.getLogger(__name__)
+
+SESSION_TOKEN_RATE = 20  # tokens per second a session's budget refills; about one typical answer every 15 s
+SESSION_TOKEN_BURST = 1500  # tokens a session may spend at once, a handful of quick questions
+GLOBAL_TOKEN_RATE = 400  # tokens per second per backend, roughly what one Ollama server gets through
+GLOBAL_TOKEN_BURST = 8000  # tokens per backend that may be admitted at once
+MAX_QUEUE_DEPTH = 32  # requests waiting for a generation slot before new ones are turned away
+QUEUE_FULL_RETRY_AFTER = 5  # seconds suggested to requests turned away by a full queue
+EXPECTED_OUTPUT_TOKENS = 300  # answer length assumed for a model until its answers have been seen
+OUTPUT_ESTIMATE_WEIGHT = 0.1  # weight of each new answer in a model's expected output length
+IDLE_SESSION_SECONDS = 600  # session budgets untouched this long are forgotten
+
+
+class AdmissionRejected(Exception):
+    """The request was turned away; reason is the error_type to report"""
+
+    def __init__(self, reason: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Budget that refills at rate per second up to capacity; may go into debt when a request ran long"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.time()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, cost: float) -> float:
+        """Seconds until cost fits, after refill()"""
+        return max(0.0, (cost - self.tokens) / self.rate)
+
+    def adjust(self, amount: float):
+        self.tokens = max(-self.capacity, min(self.capacity, self.tokens + amount))
+
+
+class Admission:
+    """An admitted request and the tokens charged for it, to be settled once it finishes"""
+
+    def __init__(self, session_id: str, model_name: str, prompt_tokens: int, cost: float):
+        self.session_id = session_id
+        self.model_name = model_name
+        self.prompt_tokens = prompt_tokens
+        self.cost = cost
+
+
+class AdmissionControl:
+    """
+    Admission in front of the generation queue. Each request is charged its
+    prompt tokens plus the model's expected output tokens against a per-session
+    and a global token bucket; once it finishes the charge is corrected to what
+    it actually used. A request that either budget cannot cover, or that arrives
+    while MAX_QUEUE_DEPTH requests already wait for a slot, is turned away at
+    once with a retry-after estimate instead of queueing.
+    """
+
+    def __init__(self, session_rate: float = SESSION_TOKEN_RATE, session_burst: float = SESSION_TOKEN_BURST,
+                 global_rate: float = GLOBAL_TOKEN_RATE, global_burst: float = GLOBAL_TOKEN_BURST,
+                 max_queue_depth: int = MAX_QUEUE_DEPTH):
+        self.enabled = True
+        self.session_rate = session_rate
+        self.session_burst = session_burst
+        self.max_queue_depth = max_queue_depth
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst)
+        self._sessions: Dict[str, TokenBucket] = {}
+        self._expected_output: Dict[str, float] = {}
+        self._rejected = {"rate_limited": 0, "busy": 0}
+        self._last_prune = time.time()
+
+    def admit(self, session_id: str, model_name: str, prompt_tokens: int, queued: int) -> Admission:
+        """Charge the request or raise AdmissionRejected; queued is the current queue depth"""
+        with self._lock:
+            if not self.enabled:
+                return Admission(session_id, model_name, prompt_tokens, 0.0)
+            now = time.time()
+            self._prune(now)
+            cost = prompt_tokens + self._expected_output.get(model_name, EXPECTED_OUTPUT_TOKENS)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = TokenBucket(self.session_rate, self.session_burst)
+            session.refill(now)
+            self._global.refill(now)
+
+            if queued >= self.max_queue_depth:
+                raise self._reject("busy", QUEUE_FULL_RETRY_AFTER, session_id, f"{queued} requests already queued")
+            # A request larger than a bucket only needs the bucket to be full
+            session_wait = session.wait_for(min(cost, session.capacity))
+            if session_wait > 0:
+                raise self._reject("rate_limited", session_wait, session_id, f"session budget short for {cost:.0f} tokens")
+            global_wait = self._global.wait_for(min(cost, self._global.capacity))
+            if global_wait > 0:
+                raise self._reject("busy", global_wait, session_id, f"global budget short for {cost:.0f} tokens")
+
+            session.adjust(-cost)
+            self._global.adjust(-cost)
+            return Admission(session_id, model_name, prompt_tokens, cost)
+
+    def _reject(self, reason: str, retry_after: float, session_id: str, detail: str) -> AdmissionRejected:
+        self._rejected[reason] += 1
+        logger.debug(f"Turned away a request from session {session_id} ({reason}: {detail})")
+        return AdmissionRejected(reason, retry_after, detail)
+
+    def settle(self, admission: Admission, used_tokens: int, output_tokens: Optional[int] = None):
+        """
+        Refund or charge the difference between the estimate and the tokens the
+        request actually used; output_tokens, when known, refines the model's
+        expected answer length
+        """
+        with self._lock:
+            if output_tokens:
+                expected = self._expected_output.get(admission.model_name, EXPECTED_OUTPUT_TOKENS)
+                self._expected_output[admission.model_name] = (
+                    expected + OUTPUT_ESTIMATE_WEIGHT * (output_tokens - expected)
+                )
+            if not admission.cost:
+                return
+            refund = admission.cost - used_tokens
+            self._global.adjust(refund)
+            session = self._sessions.get(admission.session_id)
+            if session is not None:
+                session.adjust(refund)
+
+    def _prune(self, now: float):
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for session_id in [session_id for session_id, bucket in self._sessions.items()
+                           if now - bucket.updated > IDLE_SESSION_SECONDS]:
+            del self._sessions[session_id]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sessions": len(self._sessions),
+                "global_tokens": round(self._global.tokens),
+                "rejected": dict(self._rejected),
+                "expected_output_tokens": {name: round(value) for name, value in self._expected_output.items()},
+            }
+
+
+@st.cache_resource
+def get_admission_control() -> AdmissionControl:
+    """Process-wide admission control, with the global budget sized for every backend"""
+    backends = len(OLLAMA_BACKENDS)
+    return AdmissionControl(global_rate=GLOBAL_TOKEN_RATE * backends, global_burst=GLOBAL_TOKEN_BURST * backends)
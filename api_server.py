@@ -0,0 +1,402 @@
+"""
+Headless chat API for clients that don't need the Streamlit UI, such as the
+mobile app and kiosk screens. Requests take the same path as the web app
+(ollama_service.query_ollama): validation, caching, coalescing, scheduling,
+retries and error classification. Connections are served by asyncio, and
+blocking generations run on a thread pool, so there are no script reruns.
+
+    python api_server.py --host 0.0.0.0 --port 8600
+
+Endpoints:
+  GET  /health           Ollama status; 503 while no backend is reachable
+  GET  /api/models       installed models
+  POST /api/chat         JSON answer to {"message", "model", "temperature", "conversation_id", "context"}
+  POST /api/chat/stream  the same request answered as Server-Sent Events:
+                         "queue" {"position"}, "token" {"token"}, then "done" or "error"
+
+A conversation_id (32 hex characters, as in the web app's ?conversation= URL)
+makes the server load earlier turns from the conversation store and save the
+new ones. Clients can instead pass back the "context" of the previous answer.
+
+Admission control budgets each connection, never a client-chosen id. Every
+connection's first chat and every conversation_id the store has not seen yet
+spend one token of a per-peer budget (NEW_SESSION_RATE/BURST), so opening
+connections or inventing conversations does not buy fresh budgets either.
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+import streamlit as st
+import streamlit.logger
+
+from log_pipeline import setup_logging
+from model_catalog import get_model_catalog
+from admission import IDLE_SESSION_SECONDS, AdmissionRejected, TokenBucket
+from conversation_store import get_conversation_store
+from ollama_service import check_ollama_connection, query_ollama, rejected_result
+
+logger = logging.getLogger(__name__)
+
+API_HOST = "127.0.0.1"
+API_PORT = 8600
+API_WORKERS = 64  # threads running blocking generations; the scheduler still bounds what reaches Ollama
+DEFAULT_MODEL = "llama2"
+DEFAULT_TEMPERATURE = 0.7
+HISTORY_WINDOW = 20  # earlier messages loaded for a conversation_id
+MAX_BODY_BYTES = 64 * 1024
+KEEP_ALIVE_TIMEOUT = 30  # seconds an idle keep-alive connection stays open
+SSE_HEARTBEAT = 15  # seconds between comment lines that keep idle streams open through proxies
+CORS_ORIGIN = None  # e.g. "*" to let browser kiosks on other origins call the API
+NEW_SESSION_RATE = 1.0  # per second and peer address: connections starting to chat plus new conversations
+NEW_SESSION_BURST = 30  # generous, since clients behind one NAT address share it
+
+# error_type from query_ollama -> HTTP status
+ERROR_STATUS = {
+    "validation_error": 400,
+    "model_error": 404,
+    "circuit_open": 503,
+    "rate_limited": 429,
+    "busy": 503,
+    "connection_error": 502,
+    "server_error": 502,
+    "api_error": 502,
+    "json_error": 502,
+    "timeout_error": 504,
+}
+
+
+class HttpError(Exception):
+    """A request the API refuses, answered with status and message"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def parse_chat_request(body: bytes) -> Dict[str, Any]:
+    """Check the shape of a chat request; the message itself is validated by query_ollama"""
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        raise HttpError(400, "Request body must be JSON")
+    if not isinstance(data, dict) or not isinstance(data.get("message"), str):
+        raise HttpError(400, 'A string "message" is required')
+
+    model_name = data.get("model", DEFAULT_MODEL)
+    temperature = data.get("temperature", DEFAULT_TEMPERATURE)
+    conversation_id = data.get("conversation_id")
+    context = data.get("context")
+    if not isinstance(model_name, str) or not model_name:
+        raise HttpError(400, '"model" must be a model name')
+    if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not 0 <= temperature <= 2:
+        raise HttpError(400, '"temperature" must be a number between 0 and 2')
+    if conversation_id is not None and not (isinstance(conversation_id, str)
+                                            and re.fullmatch(r"[0-9a-f]{32}", conversation_id)):
+        raise HttpError(400, '"conversation_id" must be 32 hex characters')
+    if context is not None and not (isinstance(context, list)
+                                    and all(isinstance(token, int) for token in context)):
+        raise HttpError(400, '"context" must be the list of integers returned by the previous answer')
+    return {
+        "message": data["message"],
+        "model": model_name,
+        "temperature": float(temperature),
+        "conversation_id": conversation_id,
+        "context": context or None,
+    }
+
+
+class Connection:
+    """Server-side identity of one client connection, the key of its admission budget"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, peer: str):
+        self.peer = peer
+        self.session_id = f"api-{next(self._ids)}"
+        self.started = False  # whether a chat on it has been charged to the peer
+
+
+class SessionStarts:
+    """Per-peer token buckets limiting how fast a client address opens new budgets"""
+
+    def __init__(self, rate: float = NEW_SESSION_RATE, burst: float = NEW_SESSION_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._peers: Dict[str, TokenBucket] = {}
+
+    def take(self, peer: str, count: int) -> float:
+        """Spend count starts; 0 when allowed, otherwise seconds until they would be"""
+        with self._lock:
+            now = time.time()
+            for idle in [name for name, bucket in self._peers.items() if now - bucket.updated > IDLE_SESSION_SECONDS]:
+                del self._peers[idle]
+            bucket = self._peers.get(peer)
+            if bucket is None:
+                bucket = self._peers[peer] = TokenBucket(self.rate, self.burst)
+            bucket.refill(now)
+            wait = bucket.wait_for(count)
+            if wait == 0:
+                bucket.adjust(-count)
+            return wait
+
+
+@st.cache_resource
+def get_session_starts() -> SessionStarts:
+    """Process-wide per-peer start budgets"""
+    return SessionStarts()
+
+
+def answer(chat: Dict[str, Any], connection: Connection,
+           on_token: Optional[Callable[[str], None]] = None,
+           on_queue: Optional[Callable[[int], None]] = None,
+           cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """Run one chat turn (blocking), keeping the conversation store up to date"""
+    conversation_id = chat["conversation_id"]
+    store = get_conversation_store()
+    history = store.recent(conversation_id, HISTORY_WINDOW) if conversation_id else None
+    starts = (not connection.started) + bool(conversation_id and not history)
+    if starts:
+        wait = get_session_starts().take(connection.peer, starts)
+        if wait:
+            return rejected_result(chat["model"], connection.session_id, AdmissionRejected(
+                "rate_limited", wait, f"{connection.peer} is opening new sessions too quickly"
+            ))
+        connection.started = True
+    result = query_ollama(
+        chat["message"], chat["model"], chat["temperature"],
+        on_token=on_token,
+        context=chat["context"],
+        history=history,
+        session_id=connection.session_id,
+        on_queue=on_queue,
+        cancel=cancel
+    )
+    if conversation_id and result["success"]:
+        store.append(conversation_id, "user", chat["message"])
+        store.append(conversation_id, "assistant", result["response"])
+    return result
+
+
+def result_body(result: Dict[str, Any], conversation_id: Optional[str]) -> Dict[str, Any]:
+    """Client-facing fields of a query_ollama result"""
+    if result["success"]:
+        return {
+            "response": result["response"],
+            "context": result.get("context"),
+            "cached": bool(result.get("cached") or result.get("coalesced")),
+            "conversation_id": conversation_id,
+        }
+    return {
+        "error_type": result["error_type"],
+        "error": result["error_message"],
+        "response": result.get("response"),  # partial text of an interrupted stream
+        "retry_after": result.get("retry_after"),  # seconds, when admission control turned the request away
+    }
+
+
+class ChatApi:
+    """HTTP/1.1 server with keep-alive JSON endpoints and an SSE streaming endpoint"""
+
+    def __init__(self, workers: int = API_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-api")
+
+    async def serve(self, host: str = API_HOST, port: int = API_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Chat API listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        connection = Connection(peer[0] if peer else "unknown")
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as e:
+                    await self.send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    keep_alive = await self.dispatch(writer, method, path, body, connection, keep_alive)
+                except HttpError as e:
+                    await self.send_json(writer, e.status, {"error": e.message}, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client went away
+        except Exception as e:
+            logger.error(f"Chat API connection from {connection.peer} failed: {e}")
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """(method, path, headers, body) of the next request, or None once the client is done"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "Request headers too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "Send a Content-Length instead of a chunked body")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, f"Request body larger than {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], headers, body
+
+    async def dispatch(self, writer: asyncio.StreamWriter, method: str, path: str, body: bytes,
+                       connection: Connection, keep_alive: bool) -> bool:
+        """Answer one request; returns whether the connection stays open"""
+        loop = asyncio.get_running_loop()
+        if method == "OPTIONS" and CORS_ORIGIN:
+            await self.send(writer, 204, b"", "text/plain", keep_alive)
+        elif (method, path) == ("GET", "/health"):
+            is_connected, message = check_ollama_connection()
+            await self.send_json(writer, 200 if is_connected else 503,
+                                 {"connected": is_connected, "message": message}, keep_alive)
+        elif (method, path) == ("GET", "/api/models"):
+            names = await loop.run_in_executor(self.executor, get_model_catalog().names)
+            await self.send_json(writer, 200, {"models": names}, keep_alive)
+        elif (method, path) == ("POST", "/api/chat"):
+            chat = parse_chat_request(body)
+            result = await loop.run_in_executor(self.executor, functools.partial(answer, chat, connection))
+            status = 200 if result["success"] else ERROR_STATUS.get(result["error_type"], 500)
+            extra = {"Retry-After": str(result["retry_after"])} if result.get("retry_after") else None
+            await self.send_json(writer, status, result_body(result, chat["conversation_id"]), keep_alive, extra)
+        elif (method, path) == ("POST", "/api/chat/stream"):
+            await self.stream_chat(writer, parse_chat_request(body), connection)
+            return False
+        elif path in ("/health", "/api/models", "/api/chat", "/api/chat/stream"):
+            raise HttpError(405, f"{method} is not allowed on {path}")
+        else:
+            raise HttpError(404, f"No endpoint at {path}")
+        return keep_alive
+
+    async def stream_chat(self, writer: asyncio.StreamWriter, chat: Dict[str, Any], connection: Connection):
+        """Relay tokens from the generation thread as Server-Sent Events"""
+        loop = asyncio.get_running_loop()
+        events: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+        cancel = threading.Event()
+
+        def emit(event: str, data: Any):
+            loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+        generation = loop.run_in_executor(self.executor, functools.partial(
+            answer, chat, connection,
+            on_token=lambda token: emit("token", {"token": token}),
+            on_queue=lambda position: emit("queue", {"position": position}),
+            cancel=cancel
+        ))
+        generation.add_done_callback(lambda _: events.put_nowait(("finished", None)))
+
+        writer.write(self.head(200, "text/event-stream", None, keep_alive=False, extra={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # stop nginx from buffering the stream
+        }))
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                    continue
+                if event == "finished":
+                    break
+                writer.write(sse(event, data))
+                await writer.drain()
+            try:
+                result = generation.result()
+            except Exception as e:
+                # The stream is already open, so the failure can only be reported as an event
+                logger.error(f"Streamed chat for {connection.peer} failed: {e}")
+                result = {
+                    "success": False,
+                    "error_type": "unexpected_error",
+                    "error_message": "The answer failed unexpectedly",
+                    "response": None
+                }
+            writer.write(sse("done" if result["success"] else "error", result_body(result, chat["conversation_id"])))
+            await writer.drain()
+        except ConnectionError:
+            # Nobody is reading any more, so free the generation slot
+            logger.info(f"Stream client {connection.peer} disconnected before the answer finished")
+            cancel.set()
+
+    def head(self, status: int, content_type: str, length: Optional[int], keep_alive: bool,
+             extra: Optional[Dict[str, str]] = None) -> bytes:
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Type: {content_type}"]
+        if length is not None:
+            lines.append(f"Content-Length: {length}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        if CORS_ORIGIN:
+            lines += [
+                f"Access-Control-Allow-Origin: {CORS_ORIGIN}",
+                "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+                "Access-Control-Allow-Headers: Content-Type",
+            ]
+        lines += [f"{name}: {value}" for name, value in (extra or {}).items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def send(self, writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+                   keep_alive: bool, extra: Optional[Dict[str, str]] = None):
+        writer.write(self.head(status, content_type, len(body), keep_alive, extra) + body)
+        await writer.drain()
+
+    async def send_json(self, writer: asyncio.StreamWriter, status: int, body: Dict[str, Any], keep_alive: bool,
+                        extra: Optional[Dict[str, str]] = None):
+        await self.send(writer, status, json.dumps(body).encode("utf-8"), "application/json", keep_alive, extra)
+
+
+def sse(event: str, data: Any) -> bytes:
+    """One Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Headless HTTP/SSE chat API for the gym chatbot")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="threads running generations")
+    args = parser.parse_args(argv)
+
+    setup_logging(logging.INFO)
+    streamlit.logger.set_log_level("error")  # silence bare-mode cache warnings
+    try:
+        asyncio.run(ChatApi(args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,52 @@
 import streamlit as st
-import requests
 import json
 import logging
-import time
 from datetime import datetime
+import queue
+import re
+import threading
+import time
 import traceback
-from typing import Optional, Dict, Any
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('gym_chatbot.log'),
-        logging.StreamHandler()
-    ]
+import uuid
+from typing import Dict, Any, List
+
+from log_pipeline import setup_logging
+from ollama_client import get_ollama_client
+from health_monitor import HEALTH_CHECK_INTERVAL
+from backend_pool import get_backend_pool
+from adaptive_timeout import get_adaptive_timeouts
+from admission import get_admission_control
+from circuit_breaker import get_circuit_breakers
+from response_cache import get_response_cache
+from semantic_cache import get_semantic_cache
+from scheduler import get_scheduler
+from single_flight import get_single_flight
+from model_warmup import get_model_warmer
+from model_catalog import get_model_catalog
+from metrics import METRICS_PORT, get_metrics
+from conversation import (
+    CONTEXT_TOKEN_BUDGET, reusable_context, needs_compaction,
+    start_compaction, apply_compaction, get_history_compactor
 )
+from conversation_store import get_conversation_store
+from ollama_service import (
+    OLLAMA_BASE_URL, REQUEST_TIMEOUT, SEND_DEADLINE, MAX_RETRIES, log_user_interaction, check_ollama_connection,
+    query_ollama, get_generation_executor
+)
+
+# Configure logging (queued, written by a background thread; see log_pipeline.py)
+log_pipeline = setup_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Add default constants
 DEFAULT_MODEL = "llama2"
 DEFAULT_TEMPERATURE = 0.7
-OLLAMA_BASE_URL = "http://localhost:11434"
-REQUEST_TIMEOUT = 30  # seconds
-MAX_RETRIES = 3
+STREAM_RESPONSES = True  # Render tokens as Ollama produces them
+CONVERSATION_MODE = True  # Carry earlier turns into each request
+HISTORY_WINDOW = 20  # messages rendered per page of chat history
+HOT_MESSAGE_LIMIT = 50  # messages held in memory per session; older ones are paged from the store
+GENERATION_POLL_INTERVAL = 0.25  # seconds between page updates while waiting, so a Stop click lands quickly
+STOPPED_NOTE = "⏹️ Stopped, answer truncated"
 
 # Configure Streamlit page and initialization  
 st.set_page_config(
@@ -79,222 +102,121 @@ p, .stMarkdown, .stText {
 </style>
 """, unsafe_allow_html=True)
 
-def log_user_interaction(action: str, details: Dict[str, Any] = None):
-    """Log user interactions for monitoring and debugging"""
-    try:
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "action": action,
-            "details": details or {}
-        }
-        logger.info(f"User Interaction: {json.dumps(log_entry)}")
-    except Exception as e:
-        logger.error(f"Failed to log user interaction: {e}")
+@st.cache_data(max_entries=2000, show_spinner=False)
+def render_message(role: str, content: str, summarized_messages: int = 0) -> str:
+    """Markdown for one chat message; memoized because past messages never change"""
+    if role == "user":
+        return f"**🧑 You:** {content}"
+    if role == "summary":
+        return f"**📝 Summary of {summarized_messages} earlier messages:** {content}"
+    return f"**🤖 Assistant:** {content}"
 
-def check_ollama_connection() -> tuple[bool, str]:
-    """Check if Ollama service is available"""
-    try:
-        response = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
-        if response.status_code == 200:
-            logger.info("Ollama service is available")
-            return True, "Connected"
-        else:
-            logger.warning(f"Ollama service returned status code: {response.status_code}")
-            return False, f"Service unavailable (Status: {response.status_code})"
-    except requests.exceptions.ConnectionError:
-        logger.error("Cannot connect to Ollama service")
-        return False, "Cannot connect to Ollama service. Make sure it's running on localhost:11434"
-    except requests.exceptions.Timeout:
-        logger.error("Ollama service connection timeout")
-        return False, "Connection timeout. Ollama service may be slow to respond"
-    except Exception as e:
-        logger.error(f"Unexpected error checking Ollama connection: {e}")
-        return False, f"Unexpected error: {str(e)}"
+def load_earlier_messages():
+    st.session_state.history_window += HISTORY_WINDOW
 
-def validate_input(prompt: str) -> tuple[bool, str]:
-    """Validate user input"""
-    if not prompt or not prompt.strip():
-        return False, "Empty message"
-    
-    if len(prompt) > 10000:  # Reasonable limit
-        return False, "Message too long (max 10,000 characters)"
-    
-    # Check for potentially harmful content (basic filtering)
-    harmful_patterns = ['<script', '<?php', 'javascript:', 'eval(']
-    prompt_lower = prompt.lower()
-    for pattern in harmful_patterns:
-        if pattern in prompt_lower:
-            logger.warning(f"Potentially harmful input detected: {pattern}")
-            return False, "Input contains potentially harmful content"
-    
-    return True, "Valid"
+def add_message(role: str, content: str, truncated: bool = False) -> Dict[str, Any]:
+    """Append to the session's history and persist it; the oldest messages leave memory past the limit"""
+    messages = st.session_state.messages
+    message = get_conversation_store().append(st.session_state.session_id, role, content, truncated)
+    messages.append(message)
+    # A pending compaction refers to the current prefix, so only trim when none is running
+    while len(messages) > HOT_MESSAGE_LIMIT and st.session_state.pending_compaction is None:
+        del messages[1 if messages[0]["role"] == "summary" else 0]
+    return message
+
+def start_generation(prompt: str, model_name: str, temp: float, context, history) -> Dict[str, Any]:
+    """Run query_ollama on a worker thread; its tokens and queue positions arrive through a queue"""
+    events = queue.Queue()
+    cancel = threading.Event()
+    future = get_generation_executor().submit(
+        query_ollama, prompt, model_name, temp,
+        on_token=(lambda token: events.put(("token", token))) if STREAM_RESPONSES else None,
+        context=context,
+        history=history,
+        session_id=st.session_state.session_id,
+        on_queue=lambda position: events.put(("queue", position)),
+        cancel=cancel
+    )
+    return {"future": future, "events": events, "cancel": cancel, "parts": [], "model": model_name,
+            "started": time.time()}
+
+def stop_generation():
+    generation = st.session_state.generation
+    if generation is not None:
+        generation["cancel"].set()
 
-def query_ollama(prompt: str, model_name: str, temp: float) -> Dict[str, Any]:
+def wait_for_generation(generation: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Enhanced Ollama query function with comprehensive error handling and logging
-    Returns a dictionary with success status, response, and error details
+    Render tokens and queue positions until the worker finishes. Every poll
+    updates the page, so a Stop click interrupts this run right away; the
+    next run picks the same generation up again.
     """
-    start_time = time.time()
-    
-    # Log the request
-    log_user_interaction("ollama_request", {
-        "model": model_name,
-        "temperature": temp,
-        "prompt_length": len(prompt)
-    })
-    
-    # Validate input
-    is_valid, validation_message = validate_input(prompt)
-    if not is_valid:
-        logger.warning(f"Input validation failed: {validation_message}")
-        return {
-            "success": False,
-            "error_type": "validation_error",
-            "error_message": f"Input validation failed: {validation_message}",
-            "response": None
-        }
-    
-    # Check Ollama connection first
-    is_connected, connection_status = check_ollama_connection()
-    if not is_connected:
-        return {
-            "success": False,
-            "error_type": "connection_error",
-            "error_message": connection_status,
-            "response": None
-        }
-    
-    # Retry logic
-    for attempt in range(MAX_RETRIES):
+    response_placeholder = st.empty()
+    status_placeholder = st.empty()
+    parts = generation["parts"]
+    if parts:
+        response_placeholder.markdown(f"**🤖 Assistant:** {''.join(parts)}▌")
+    while True:
+        done = generation["future"].done()
         try:
-            logger.info(f"Ollama request attempt {attempt + 1}/{MAX_RETRIES}")
-            
-            response = requests.post(
-                f"{OLLAMA_BASE_URL}/api/generate",
-                json={
-                    "model": model_name,
-                    "prompt": prompt,
-                    "temperature": temp,
-                    "stream": False
-                },
-                timeout=REQUEST_TIMEOUT
-            )
-            
-            # Log response status
-            logger.info(f"Ollama response status: {response.status_code}")
-            
-            if response.status_code == 200:
-                try:
-                    response_data = response.json()
-                    response_time = time.time() - start_time
-                    
-                    # Log successful response
-                    log_user_interaction("ollama_response", {
-                        "model": model_name,
-                        "response_time": round(response_time, 2),
-                        "response_length": len(response_data.get("response", "")),
-                        "attempt": attempt + 1
-                    })
-                    
-                    logger.info(f"Ollama request successful in {response_time:.2f}s")
-                    return {
-                        "success": True,
-                        "response": response_data.get("response", ""),
-                        "error_type": None,
-                        "error_message": None
-                    }
-                    
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse Ollama response JSON: {e}")
-                    return {
-                        "success": False,
-                        "error_type": "json_error",
-                        "error_message": "Failed to parse response from Ollama service",
-                        "response": None
-                    }
-            
-            elif response.status_code == 404:
-                logger.error(f"Model '{model_name}' not found")
-                return {
-                    "success": False,
-                    "error_type": "model_error",
-                    "error_message": f"Model '{model_name}' not found. Please check if the model is installed.",
-                    "response": None
-                }
-            
-            elif response.status_code == 500:
-                logger.error("Ollama internal server error")
-                if attempt < MAX_RETRIES - 1:
-                    wait_time = 2 ** attempt  # Exponential backoff
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
-                    continue
-                else:
-                    return {
-                        "success": False,
-                        "error_type": "server_error",
-                        "error_message": "Ollama service is experiencing internal errors",
-                        "response": None
-                    }
-            
-            else:
-                logger.error(f"Ollama API error: {response.status_code}")
-                return {
-                    "success": False,
-                    "error_type": "api_error",
-                    "error_message": f"Ollama API returned error code: {response.status_code}",
-                    "response": None
-                }
-                
-        except requests.exceptions.Timeout:
-            logger.error(f"Ollama request timeout on attempt {attempt + 1}")
-            if attempt < MAX_RETRIES - 1:
-                continue
-            else:
-                return {
-                    "success": False,
-                    "error_type": "timeout_error",
-                    "error_message": f"Request timed out after {REQUEST_TIMEOUT} seconds. Ollama may be processing a heavy request.",
-                    "response": None
-                }
-        
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Connection error on attempt {attempt + 1}")
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(1)
-                continue
-            else:
-                return {
-                    "success": False,
-                    "error_type": "connection_error",
-                    "error_message": "Cannot connect to Ollama service. Please ensure it's running.",
-                    "response": None
-                }
-        
-        except Exception as e:
-            logger.error(f"Unexpected error on attempt {attempt + 1}: {e}")
-            logger.error(traceback.format_exc())
-            if attempt < MAX_RETRIES - 1:
-                continue
-            else:
-                return {
-                    "success": False,
-                    "error_type": "unexpected_error",
-                    "error_message": f"An unexpected error occurred: {str(e)}",
-                    "response": None
-                }
-    
-    return {
-        "success": False,
-        "error_type": "max_retries_exceeded",
-        "error_message": f"Failed after {MAX_RETRIES} attempts",
-        "response": None
-    }
+            kind, value = generation["events"].get(timeout=0 if done else GENERATION_POLL_INTERVAL)
+        except queue.Empty:
+            if done:
+                break
+            status_placeholder.caption(f"⏱️ {time.time() - generation['started']:.1f}s")
+            continue
+        if kind == "token":
+            parts.append(value)
+            response_placeholder.markdown(f"**🤖 Assistant:** {''.join(parts)}▌")
+        elif value:
+            status_placeholder.info(f"⏳ Waiting for a free model slot: you are #{value} in the queue")
+    status_placeholder.empty()
+    return generation["future"].result()
+
+def first_seq(messages: List[Dict[str, Any]]) -> int:
+    """Sequence number of the oldest stored message in the list (= how many precede it)"""
+    return next((m["seq"] for m in messages if "seq" in m), 0)
+
+@st.fragment
+def chat_history():
+    """Render only the newest messages; reruns on its own when loading earlier ones"""
+    messages = st.session_state.messages
+    if not messages:
+        return
+    st.markdown("### 💬 Chat History")
+    window = st.session_state.history_window
+    shown = messages[-window:]
+    if window > len(messages) and first_seq(messages):
+        # Messages no longer held in memory are paged in from the conversation store
+        shown = get_conversation_store().page(
+            st.session_state.session_id, first_seq(messages), window - len(messages)
+        ) + shown
+    hidden = first_seq(shown) or max(0, len(messages) - window)
+    if hidden:
+        st.button(f"⬆️ Load earlier messages ({hidden} hidden)", on_click=load_earlier_messages)
+    st.markdown("\n\n---\n\n".join(
+        render_message(m["role"], m["content"], m.get("summarized_messages", 0)) for m in shown
+    ))
 
 # Initialize session state for chat history and error tracking
+if 'session_id' not in st.session_state:
+    # The id lives in the URL, so a refresh or a server restart resumes the conversation
+    restored_id = st.query_params.get("conversation", "")
+    st.session_state.session_id = restored_id if re.fullmatch(r"[0-9a-f]{32}", restored_id) else uuid.uuid4().hex
+    st.query_params["conversation"] = st.session_state.session_id
+
 if 'messages' not in st.session_state:
-    st.session_state.messages = []
-    logger.info("Initialized new chat session")
+    st.session_state.messages = get_conversation_store().recent(st.session_state.session_id, HISTORY_WINDOW)
+    saved_summary = get_conversation_store().summary(st.session_state.session_id)
+    if saved_summary is not None:
+        # Resume from the stored summary; the turns it covers stay pageable from the store
+        st.session_state.messages = [saved_summary] + [
+            m for m in st.session_state.messages if m["seq"] > saved_summary["through_seq"]
+        ]
+    if st.session_state.messages:
+        logger.info(f"Restored chat session with {len(st.session_state.messages)} recent messages")
+    else:
+        logger.info("Initialized new chat session")
 
 if 'error_count' not in st.session_state:
     st.session_state.error_count = 0
@@ -302,19 +224,34 @@ if 'error_count' not in st.session_state:
 if 'last_error_time' not in st.session_state:
     st.session_state.last_error_time = None
 
+if 'ollama_context' not in st.session_state:
+    st.session_state.ollama_context = {}  # model name -> context tokens from the last turn
+
+if 'pending_compaction' not in st.session_state:
+    st.session_state.pending_compaction = None
+
+if 'history_window' not in st.session_state:
+    st.session_state.history_window = HISTORY_WINDOW
+
+if 'generation' not in st.session_state:
+    st.session_state.generation = None  # query_ollama running on a worker thread, see start_generation
+
 # Sidebar configuration
 with st.sidebar:
     st.title("⚙️ Configuration")
     
     # Connection status check
     is_connected, status_msg = check_ollama_connection()
+    status_age = get_backend_pool().status()[2] or 0
     if is_connected:
         st.success(f"🟢 Ollama: {status_msg}")
     else:
         st.error(f"🔴 Ollama: {status_msg}")
+    st.caption(f"Last checked {status_age:.0f}s ago")
     
     # Determine current values (use defaults if just reset or not set)
-    model_options = ["llama2", "mistral", "codellama"]
+    catalog = get_model_catalog()
+    model_options = catalog.names()
     
     # Get current values from widgets or use defaults
     current_model = st.session_state.get('model_widget', DEFAULT_MODEL)
@@ -344,9 +281,18 @@ with st.sidebar:
             "Select Model",
             model_options,
             index=model_index,
-            key="model_widget"
+            key="model_widget",
+            on_change=lambda: get_model_warmer().warm_up(st.session_state.model_widget)
         )
         
+        model_info = catalog.get(model)
+        if model_info:
+            details = [f"{model_info['size'] / 1e9:.1f} GB"]
+            if model_info["quantization"]:
+                details.append(model_info["quantization"])
+            details.append(f"ctx {model_info['num_ctx']}")
+            st.caption(f"📦 {' · '.join(details)}")
+        
         temperature = st.slider(
             "Temperature", 
             0.0, 2.0, 
@@ -358,10 +304,28 @@ with st.sidebar:
         # Show current settings info
         st.info(f"📊 Current Settings:\n- Model: {model}\n- Temperature: {temperature}")
         
+        # Response cache statistics
+        cache_stats = get_response_cache().snapshot()
+        semantic_stats = get_semantic_cache(OLLAMA_BASE_URL).snapshot()
+        st.caption(f"🗄️ Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        if semantic_stats["enabled"]:
+            st.caption(f"🧠 Semantic cache: {semantic_stats['hits']} hits / {semantic_stats['misses']} misses")
+        
         # Error statistics
         if st.session_state.error_count > 0:
             st.warning(f"⚠️ Errors this session: {st.session_state.error_count}")
         
+        # Older turns are summarized or paged out; the full transcript stays in the store
+        if first_seq(st.session_state.messages):
+            if st.button("📜 Prepare Full Transcript"):
+                transcript = get_conversation_store().transcript(st.session_state.session_id)
+                st.download_button(
+                    "⬇️ Download Transcript",
+                    data=json.dumps(transcript, indent=2),
+                    file_name=f"gym_chat_{st.session_state.session_id}.json",
+                    mime="application/json"
+                )
+        
     except Exception as e:
         logger.error(f"Error creating sidebar widgets: {e}")
         st.error("❌ Error configuring settings")
@@ -370,12 +334,76 @@ with st.sidebar:
     st.markdown("### About")
     st.markdown("This chatbot uses Ollama for local AI processing with enhanced error handling and logging.")
     
+    # Latency and throughput dashboard (collapsible)
+    with st.expander("📈 Performance Metrics"):
+        metrics_rows = get_metrics().summary()
+        if metrics_rows:
+            st.table(metrics_rows)
+        else:
+            st.caption("No generations recorded yet")
+        for error_type, count in sorted(get_metrics().counters("ollama_errors_total").items()):
+            st.text(f"{error_type}: {count:.0f}")
+        for model_name, count in sorted(get_metrics().counters("ollama_cancelled_total").items()):
+            st.text(f"stopped ({model_name}): {count:.0f}")
+        if METRICS_PORT:
+            st.caption(f"Prometheus metrics: http://localhost:{METRICS_PORT}/metrics")
+    
     # Debug info (collapsible)
     with st.expander("🔧 Debug Info"):
         st.text(f"Ollama URL: {OLLAMA_BASE_URL}")
-        st.text(f"Timeout: {REQUEST_TIMEOUT}s")
+        pool_stats = get_backend_pool().snapshot()
+        for backend in pool_stats["backends"]:
+            st.text(
+                f"Backend {backend['url']}: {'up' if backend['healthy'] else 'ejected'} | "
+                f"In flight: {backend['outstanding']} | Served: {backend['served']} | "
+                f"Loaded: {', '.join(backend['loaded']) or 'none'}"
+            )
+        if pool_stats["hedges_sent"]:
+            st.text(f"Hedged Requests: {pool_stats['hedges_sent']} | Won by hedge: {pool_stats['hedges_won']}")
+        learned_timeout = get_adaptive_timeouts().timeout_for(model, 0, STREAM_RESPONSES, REQUEST_TIMEOUT)
+        st.text(f"Timeout ({model}, short prompts): {learned_timeout:.1f}s | Send Deadline: {SEND_DEADLINE}s")
+        st.text(f"Connection Pool: {get_ollama_client(OLLAMA_BASE_URL).pool_size}")
         st.text(f"Max Retries: {MAX_RETRIES}")
+        st.text(f"Health Check Interval: {HEALTH_CHECK_INTERVAL}s")
+        st.text(f"Streaming: {'on' if STREAM_RESPONSES else 'off'}")
+        st.text(f"Context Tokens ({model}): {len(st.session_state.ollama_context.get(model, []))}/{catalog.context_budget(model, CONTEXT_TOKEN_BUDGET)}")
         st.text(f"Session Errors: {st.session_state.error_count}")
+        st.text(f"Log Backlog: {log_pipeline.backlog()} | Dropped: {log_pipeline.dropped}")
+        st.text(f"Unsaved Messages: {get_conversation_store().snapshot()['pending_writes']}")
+        scheduler_stats = get_scheduler().snapshot()
+        st.text(f"Generations Running: {sum(scheduler_stats['running'].values())} | Queued: {scheduler_stats['queued']}")
+        st.text(f"Coalesced Requests: {get_single_flight().snapshot()['followers']}")
+        admission_stats = get_admission_control().snapshot()
+        st.text(
+            f"Turned Away: {admission_stats['rejected']['rate_limited']} rate-limited | "
+            f"{admission_stats['rejected']['busy']} busy | Global Budget: {admission_stats['global_tokens']} tokens"
+        )
+        warmer_stats = get_model_warmer().snapshot()
+        st.text(f"Pinned Models: {', '.join(warmer_stats['pinned']) or 'none'}")
+        if warmer_stats["warming"]:
+            st.text(f"Warming Up: {', '.join(warmer_stats['warming'])}")
+        for breaker in get_circuit_breakers().snapshots():
+            retry_note = f", retry in {breaker['retry_after']:.0f}s" if breaker["state"] == "open" else ""
+            st.text(f"Circuit {breaker['name']}: {breaker['state']} ({breaker['failures']} failures{retry_note})")
+
+# Compact long histories in the background so prompts and memory stay flat
+pending = st.session_state.pending_compaction
+if pending is not None and pending["future"].done():
+    try:
+        get_conversation_store().flush()  # the summary records final sequence numbers
+        compacted = apply_compaction(st.session_state.messages, pending)
+        if compacted is not None:
+            st.session_state.messages = compacted
+            get_conversation_store().save_summary(st.session_state.session_id, compacted[0])
+            st.session_state.ollama_context = {}  # next turn rebuilds its window from the summary
+            log_user_interaction("history_compacted", {"messages_summarized": pending["count"]})
+    except Exception as e:
+        logger.error(f"Failed to apply history compaction: {e}")
+    st.session_state.pending_compaction = None
+elif pending is None and CONVERSATION_MODE and needs_compaction(st.session_state.messages):
+    st.session_state.pending_compaction = start_compaction(
+        get_history_compactor(), model, st.session_state.messages, st.session_state.session_id
+    )
 
 # Main chat interface
 st.title("🤖 personal gym chat bot")
@@ -386,16 +414,7 @@ if not is_connected:
     st.info("💡 **Troubleshooting Tips:**\n- Make sure Ollama is installed and running\n- Check if the service is available at http://localhost:11434\n- Try restarting the Ollama service")
 
 # Display chat history
-if st.session_state.messages:
-    st.markdown("### 💬 Chat History")
-    for i, message in enumerate(st.session_state.messages):
-        with st.container():
-            if message["role"] == "user":
-                st.markdown(f"**🧑 You:** {message['content']}")
-            else:
-                st.markdown(f"**🤖 Assistant:** {message['content']}")
-        if i < len(st.session_state.messages) - 1:  # Don't add separator after last message
-            st.markdown("---")
+chat_history()
 
 # Chat input section
 st.markdown("### 📝 Send a Message")
@@ -410,25 +429,69 @@ user_input = st.text_input(
 col1, col2 = st.columns([1, 1])
 
 with col1:
-    send_clicked = st.button("Send", type="primary", disabled=not is_connected)
+    send_clicked = st.button(
+        "Send", type="primary", disabled=not is_connected or st.session_state.generation is not None
+    )
 
 with col2:
     clear_clicked = st.button("Clear Chat")
 
 # Handle send button click
-if send_clicked and user_input.strip():
+if send_clicked and user_input.strip() and st.session_state.generation is not None:
+    st.warning("⚠️ Please wait for the current answer or stop it first.")
+elif send_clicked and user_input.strip():
     try:
         # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        add_message("user", user_input)
         log_user_interaction("user_message", {"message_length": len(user_input)})
         
-        # Get AI response with enhanced error handling
+        context = None
+        history = None
+        if CONVERSATION_MODE:
+            context = reusable_context(
+                st.session_state.ollama_context, model,
+                get_model_catalog().context_budget(model, CONTEXT_TOKEN_BUDGET)
+            )
+            history = st.session_state.messages[:-1]
+        
+        # Get AI response with enhanced error handling; followed below and across reruns
+        st.session_state.generation = start_generation(user_input, model, temperature, context, history)
+        
+    except Exception as e:
+        logger.error(f"Unexpected error in send handler: {e}")
+        logger.error(traceback.format_exc())
+        st.error(f"❌ An unexpected error occurred: {str(e)}")
+        st.session_state.error_count += 1
+
+elif send_clicked and not user_input.strip():
+    st.warning("⚠️ Please enter a message before sending.")
+    log_user_interaction("empty_message_attempt")
+
+# Follow the running generation until it finishes or Stop is clicked
+if st.session_state.generation is not None and not clear_clicked:
+    try:
+        generation = st.session_state.generation
+        model_name = generation["model"]
+        st.button("⏹️ Stop", on_click=stop_generation, key="stop_generation")
+        
         with st.spinner("🤔 Thinking..."):
-            result = query_ollama(user_input, model, temperature)
+            result = wait_for_generation(generation)
+            st.session_state.generation = None
             
             if result["success"]:
-                st.session_state.messages.append({"role": "assistant", "content": result["response"]})
+                add_message("assistant", result["response"])
+                if CONVERSATION_MODE and result.get("context"):
+                    st.session_state.ollama_context[model_name] = result["context"]
                 logger.info("Successfully processed user message")
+            elif result["error_type"] == "cancelled":
+                # Keep what was streamed, marked as cut short
+                partial = result.get("response") or ""
+                add_message(
+                    "assistant", f"{partial}\n\n_{STOPPED_NOTE}_" if partial else f"_{STOPPED_NOTE}_", truncated=True
+                )
+                # Ollama's context lacks the stopped turn, so the next turn rebuilds a window from history
+                st.session_state.ollama_context.pop(model_name, None)
+                log_user_interaction("generation_stopped", {"model": model_name, "partial_length": len(partial)})
             else:
                 # Handle different types of errors
                 error_type = result["error_type"]
@@ -443,6 +506,7 @@ if send_clicked and user_input.strip():
                 
                 # Show user-friendly error message
                 if error_type == "connection_error":
+                    get_backend_pool().request_refresh()
                     st.error(f"🔌 **Connection Error**: {error_msg}")
                     st.info("💡 Try refreshing the page or check if Ollama is running")
                 elif error_type == "timeout_error":
@@ -453,13 +517,23 @@ if send_clicked and user_input.strip():
                     st.info("💡 Try selecting a different model from the sidebar")
                 elif error_type == "validation_error":
                     st.error(f"✏️ **Input Error**: {error_msg}")
+                elif error_type == "circuit_open":
+                    st.error(f"🚧 **Service Recovering**: {error_msg}")
+                    st.info("💡 Requests are paused briefly so Ollama can recover")
+                elif error_type == "rate_limited":
+                    st.warning(f"🐢 **Slow Down**: {error_msg}")
+                elif error_type == "busy":
+                    st.warning(f"🚦 **Assistant Busy**: {error_msg}")
+                    st.info("💡 Many members are chatting right now")
                 else:
                     st.error(f"❌ **Error**: {error_msg}")
                     st.info("💡 Please try again or contact support if the issue persists")
                 
-                # Add error message to chat for context
+                # Add error message to chat for context, keeping any partially streamed answer
                 error_response = f"Sorry, I encountered an error: {error_msg}"
-                st.session_state.messages.append({"role": "assistant", "content": error_response})
+                if result.get("response"):
+                    error_response = f"{result['response']}\n\n_{error_response}_"
+                add_message("assistant", error_response)
         
         st.rerun()
         
@@ -468,18 +542,22 @@ if send_clicked and user_input.strip():
         logger.error(traceback.format_exc())
         st.error(f"❌ An unexpected error occurred: {str(e)}")
         st.session_state.error_count += 1
-
-elif send_clicked and not user_input.strip():
-    st.warning("⚠️ Please enter a message before sending.")
-    log_user_interaction("empty_message_attempt")
+        st.session_state.generation = None
 
 # Handle clear chat button click
 if clear_clicked:
     try:
         message_count = len(st.session_state.messages)
+        stop_generation()
+        st.session_state.generation = None
         st.session_state.messages = []
         st.session_state.error_count = 0  # Reset error counter too
         st.session_state.last_error_time = None
+        st.session_state.ollama_context = {}
+        st.session_state.pending_compaction = None
+        st.session_state.session_id = uuid.uuid4().hex
+        st.query_params["conversation"] = st.session_state.session_id
+        st.session_state.history_window = HISTORY_WINDOW
         
         log_user_interaction("chat_cleared", {"messages_cleared": message_count})
         st.success("💬 Chat history cleared!")
@@ -492,4 +570,5 @@ if clear_clicked:
 # Footer with session info
 if st.session_state.messages:
     st.markdown("---")
-    st.caption(f"💬 {len(st.session_state.messages)} messages in this session | 🚨 {st.session_state.error_count} errors")
\ No newline at end of file
+    message_total = st.session_state.messages[-1].get("seq", len(st.session_state.messages) - 1) + 1
+    st.caption(f"💬 {message_total} messages in this session | 🚨 {st.session_state.error_count} errors")
\ No newline at end of file
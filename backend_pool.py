@@ -0,0 +1,272 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+
+import requests
+import streamlit as st
+
+from ollama_client import OLLAMA_BACKENDS, get_ollama_client
+from health_monitor import get_health_monitor
+from circuit_breaker import get_circuit_breakers
+from model_catalog import display_name, get_model_catalog
+from scheduler import CANCEL_POLL_INTERVAL, MAX_CONCURRENT_GENERATIONS, GenerationCancelled
+
+logger = logging.getLogger(__name__)
+
+LOADED_MODELS_INTERVAL = 15  # seconds between /api/ps polls of each backend
+AFFINITY_SLACK = 2  # extra requests in flight tolerated to stay on a backend that has the model loaded
+HEDGE_AFTER = None  # seconds without a response before the request also goes to a second backend; None disables
+
+
+class BackendPool:
+    """
+    Routes generations across several Ollama backends. A request goes to a
+    backend that already has its model loaded unless that one is noticeably
+    busier, otherwise to the backend with the fewest requests in flight.
+    Backends that fail their health probe or whose circuit is open are ejected
+    until the probe succeeds again or the circuit lets a half-open probe through.
+    """
+
+    def __init__(self, urls: List[str], hedge_after: Optional[float] = HEDGE_AFTER):
+        self.urls = list(urls)
+        self.hedge_after = hedge_after
+        self._lock = threading.Lock()
+        self._outstanding = {url: 0 for url in self.urls}
+        self._served = {url: 0 for url in self.urls}
+        self._loaded: Dict[str, set] = {url: set() for url in self.urls}
+        self._hedges = {"sent": 0, "won": 0}
+        self._executor = ThreadPoolExecutor(
+            max_workers=2 * MAX_CONCURRENT_GENERATIONS * len(self.urls), thread_name_prefix="ollama-hedge"
+        )
+        self._poller = None
+
+    def start(self):
+        """Start a health monitor per backend and poll which models each has loaded"""
+        if self._poller is not None:
+            return
+        for url in self.urls:
+            get_health_monitor(url)
+        self._poller = threading.Thread(target=self._poll_loaded_models, name="backend-ps-poller", daemon=True)
+        self._poller.start()
+
+    def _poll_loaded_models(self):
+        while True:
+            for url in self.urls:
+                self.refresh_loaded(url)
+            time.sleep(LOADED_MODELS_INTERVAL)
+
+    def refresh_loaded(self, url: str):
+        try:
+            response = get_ollama_client(url).get("ps")
+            response.raise_for_status()
+            loaded = {display_name(entry.get("name", "")) for entry in response.json().get("models", [])}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.debug(f"Could not list loaded models on {url}: {e}")
+            return
+        with self._lock:
+            self._loaded[url] = loaded
+
+    def is_healthy(self, url: str, model_name: Optional[str] = None) -> bool:
+        """Passing its health probe with no open circuit for the backend (or the model on it)"""
+        return (get_health_monitor(url).status()["is_connected"]
+                and not get_circuit_breakers().is_open(url, model_name))
+
+    def acquire(self, model_name: str, exclude: Iterable[str] = ()) -> str:
+        """
+        Pick a backend for one request and count it as in flight until release().
+        Only backends the model catalogue lists the model on are considered
+        (all of them while it doesn't know the model). Backends in exclude (e.g.
+        ones that just failed) are only used when no other usable backend is
+        left; with none usable at all the least busy backend is returned and its
+        circuit breaker decides.
+        """
+        candidates = self._candidates(model_name, exclude)
+        with self._lock:
+            chosen = self._pick(model_name, candidates)
+            self._outstanding[chosen] += 1
+        return chosen
+
+    def preferred(self, model_name: str) -> str:
+        """The backend acquire() would pick for the model right now, without counting a request on it"""
+        candidates = self._candidates(model_name, ())
+        with self._lock:
+            return self._pick(model_name, candidates)
+
+    def _candidates(self, model_name: str, exclude: Iterable[str]) -> List[str]:
+        exclude = set(exclude)
+        info = get_model_catalog().get(model_name)
+        hosts = [url for url in self.urls if info and url.rstrip("/") in info["backends"]] or self.urls
+        usable = [url for url in hosts if self.is_healthy(url, model_name)]
+        return ([url for url in usable if url not in exclude] or usable
+                or [url for url in hosts if url not in exclude] or hosts)
+
+    def _pick(self, model_name: str, candidates: List[str]) -> str:
+        """Least busy candidate, or one with the model loaded if not much busier (caller holds the lock)"""
+        model_name = display_name(model_name)
+        chosen = min(candidates, key=self._outstanding.__getitem__)
+        warm = [url for url in candidates if model_name in self._loaded[url]]
+        if warm:
+            best_warm = min(warm, key=self._outstanding.__getitem__)
+            if self._outstanding[best_warm] <= self._outstanding[chosen] + AFFINITY_SLACK:
+                chosen = best_warm
+        return chosen
+
+    def release(self, url: str):
+        with self._lock:
+            self._outstanding[url] -= 1
+
+    def is_idle(self, url: str) -> bool:
+        """No request in flight on the backend"""
+        with self._lock:
+            return self._outstanding[url] == 0
+
+    def has_loaded(self, url: str, model_name: str) -> bool:
+        """Whether the backend was last seen with the model in memory"""
+        with self._lock:
+            return display_name(model_name) in self._loaded[url]
+
+    def post(self, url: str, model_name: str, endpoint: str, payload: Dict[str, Any],
+             cancel: Optional[threading.Event] = None, **kwargs: Any) -> Tuple[str, requests.Response]:
+        """
+        POST to an acquired backend. With hedging on, a request that has no
+        response after hedge_after seconds is also sent to a second backend; the
+        first response wins and the other one is closed and released. Returns the
+        answering backend, which the caller still has to release. Setting cancel
+        abandons the wait (GenerationCancelled); a late response is closed unread,
+        which for a streamed request (stream=True, as generations always are)
+        also stops Ollama from generating the rest of the answer.
+        """
+        hedging = self.hedge_after is not None and len(self.urls) > 1
+        if not hedging and cancel is None:
+            return url, self._send(url, model_name, endpoint, payload, kwargs)
+
+        primary = self._executor.submit(self._send, url, model_name, endpoint, payload, kwargs)
+        hedge_url, hedge = None, None
+        try:
+            if hedging and not self._wait([primary], self.hedge_after, cancel):
+                hedge_url = self._acquire_hedge(url, model_name)
+            if hedge_url is None:
+                self._wait([primary], None, cancel)
+                return url, primary.result()
+
+            hedge = self._executor.submit(self._send, hedge_url, model_name, endpoint, payload, kwargs)
+            requests_by_url = {url: primary, hedge_url: hedge}
+            done = self._wait(requests_by_url.values(), None, cancel)
+            winners = [candidate for candidate, future in requests_by_url.items()
+                       if future in done and future.exception() is None]
+            if winners:
+                winner = winners[0]
+            else:
+                # The first one to finish failed, so the other one gets its chance;
+                # when both fail the primary's error is raised
+                self._wait([future for future in requests_by_url.values() if not future.done()], None, cancel)
+                winner = hedge_url if primary.exception() is not None and hedge.exception() is None else url
+        except GenerationCancelled:
+            primary.add_done_callback(close_response)
+            if hedge is not None:
+                hedge.add_done_callback(lambda future: self._discard(hedge_url, model_name, future))
+            raise
+        loser = hedge_url if winner == url else url
+        requests_by_url[loser].add_done_callback(lambda future: self._discard(loser, model_name, future))
+        with self._lock:
+            self._hedges["won"] += winner == hedge_url
+        return winner, requests_by_url[winner].result()
+
+    def _wait(self, futures: Iterable[Future], timeout: Optional[float],
+              cancel: Optional[threading.Event]) -> set:
+        """Wait for the first of futures to finish, up to timeout; raises GenerationCancelled once cancel is set"""
+        futures = list(futures)
+        deadline = None if timeout is None else time.time() + timeout
+        while futures:
+            step = None if cancel is None else CANCEL_POLL_INTERVAL
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.time())
+                step = remaining if step is None else min(step, remaining)
+            done, _ = wait(futures, timeout=step, return_when=FIRST_COMPLETED)
+            if done:
+                return done
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled("Stopped while waiting for Ollama to respond")
+            if deadline is not None and time.time() >= deadline:
+                break
+        return set()
+
+    def _send(self, url: str, model_name: str, endpoint: str, payload: Dict[str, Any],
+              kwargs: Dict[str, Any]) -> requests.Response:
+        response = get_ollama_client(url).post(endpoint, payload, **kwargs)
+        if response.status_code == 200:
+            with self._lock:
+                self._served[url] += 1
+                self._loaded[url].add(display_name(model_name))
+        return response
+
+    def _acquire_hedge(self, url: str, model_name: str) -> Optional[str]:
+        """A second healthy backend whose circuits admit the request, or None"""
+        hedge_url = self.acquire(model_name, exclude={url})
+        if hedge_url == url or not self.is_healthy(hedge_url, model_name):
+            self.release(hedge_url)
+            return None
+        allowed, _ = get_circuit_breakers().allow_request(hedge_url, model_name)
+        if not allowed:
+            self.release(hedge_url)
+            return None
+        with self._lock:
+            self._hedges["sent"] += 1
+        logger.info(f"Hedging slow request for '{model_name}' from {url} to {hedge_url}")
+        return hedge_url
+
+    def _discard(self, url: str, model_name: str, future: Future):
+        """Drop the losing response of a hedged pair without a circuit verdict"""
+        close_response(future)
+        get_circuit_breakers().release(url, model_name)
+        self.release(url)
+
+    def status(self) -> Tuple[bool, str, Optional[float]]:
+        """(any backend connected, message, age in seconds of the oldest probe)"""
+        statuses = [get_health_monitor(url).status() for url in self.urls]
+        connected = [status for status in statuses if status["is_connected"]]
+        ages = [status["age"] for status in statuses if status["age"] is not None]
+        age = max(ages) if ages else None
+        if len(self.urls) == 1:
+            return statuses[0]["is_connected"], statuses[0]["message"], age
+        if connected:
+            return True, f"Connected ({len(connected)}/{len(self.urls)} backends)", age
+        return False, f"No Ollama backend reachable ({statuses[0]['message']})", age
+
+    def request_refresh(self):
+        for url in self.urls:
+            get_health_monitor(url).request_refresh()
+
+    def snapshot(self) -> Dict[str, Any]:
+        healthy = {url: self.is_healthy(url) for url in self.urls}
+        with self._lock:
+            return {
+                "backends": [
+                    {
+                        "url": url,
+                        "healthy": healthy[url],
+                        "outstanding": self._outstanding[url],
+                        "served": self._served[url],
+                        "loaded": sorted(self._loaded[url]),
+                    }
+                    for url in self.urls
+                ],
+                "hedges_sent": self._hedges["sent"],
+                "hedges_won": self._hedges["won"],
+            }
+
+
+def close_response(future: Future):
+    """Close the response of a finished request nobody is going to read"""
+    if future.exception() is None:
+        future.result().close()
+
+
+@st.cache_resource
+def get_backend_pool() -> BackendPool:
+    """Process-wide backend pool over OLLAMA_BACKENDS, started on first use"""
+    pool = BackendPool(OLLAMA_BACKENDS)
+    pool.start()
+    return pool
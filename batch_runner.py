@@ -0,0 +1,249 @@
+"""
+Runs a JSONL file of prompts through the app's request path (query_ollama)
+offline, e.g. to regenerate the curated FAQ answers with another model.
+
+    python batch_runner.py faqs.jsonl --output answers.jsonl --models llama2,mistral --concurrency 8
+
+Each input line is a JSON object with the prompt in "prompt" or "body" (the
+shape of requests.jsonl) and an id in "id" or "request_id"; lines without an
+id are numbered. An item's own "model" restricts it to that model.
+
+Models are run one after another, so Ollama keeps a single model loaded. The
+input is read lazily once per model, and at most --concurrency prompts are in
+flight at a time. Every result is appended to --output as soon as it arrives,
+with latency and token stats. The output doubles as the checkpoint: after a
+crash or Ctrl-C, the same command skips the (id, model) pairs already written.
+Failed items are skipped too unless --retry-failed is given; the last line
+written for a pair is the one that counts.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, Any, List, Tuple, Iterator, TextIO
+
+import streamlit.logger
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS = "llama2"
+DEFAULT_TEMPERATURE = 0.7  # same default as the chat UI
+DEFAULT_CONCURRENCY = 4
+BATCH_SESSION_ID = "batch"  # the scheduler sees the whole run as one session
+PROGRESS_EVERY = 50  # results between progress lines on stderr
+
+
+def read_items(path: str) -> Iterator[Dict[str, Any]]:
+    """Prompts of the input file, one at a time; malformed lines are reported and skipped"""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                prompt = data.get("prompt") or data.get("body")
+                if not isinstance(prompt, str):
+                    raise ValueError('no "prompt" or "body"')
+            except (ValueError, AttributeError) as e:
+                print(f"{path}:{number}: skipping malformed line ({e})", file=sys.stderr)
+                continue
+            yield {
+                "id": str(data.get("id") or data.get("request_id") or f"line-{number}"),
+                "prompt": prompt,
+                "model": data.get("model"),
+            }
+
+
+def load_checkpoint(path: str) -> Dict[Tuple[str, str], bool]:
+    """
+    (id, model) -> success of the results already in the output file. A line
+    cut off by a crash is removed so that appending continues cleanly.
+    """
+    done: Dict[Tuple[str, str], bool] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            print(f"Dropping an incomplete last line from {path}", file=sys.stderr)
+            f.truncate(complete)
+    for line in data[:complete].splitlines():
+        try:
+            record = json.loads(line)
+            done[(record["id"], record["model"])] = bool(record["success"])
+        except (ValueError, KeyError):
+            continue
+    return done
+
+
+def run_item(item: Dict[str, Any], model_name: str, temperature: float,
+             cancel: threading.Event) -> Optional[Dict[str, Any]]:
+    """Answer one prompt (blocking); None when the run was interrupted before it finished"""
+    from ollama_service import query_ollama
+
+    first_token_at = None
+
+    def on_token(token: str):
+        nonlocal first_token_at
+        if first_token_at is None:
+            first_token_at = time.time()
+
+    started = time.time()
+    result = query_ollama(
+        item["prompt"], model_name, temperature, on_token=on_token, session_id=BATCH_SESSION_ID, cancel=cancel
+    )
+    finished = time.time()
+    if result["error_type"] == "cancelled":
+        return None
+    stats = result.get("stats") or {}
+    eval_count, eval_duration = stats.get("eval_count"), stats.get("eval_duration")
+    return {
+        "id": item["id"],
+        "model": model_name,
+        "prompt": item["prompt"],
+        "success": result["success"],
+        "response": result["response"],
+        "error_type": result["error_type"],
+        "error": result["error_message"],
+        "cached": bool(result.get("cached") or result.get("coalesced")),
+        "latency_s": round(finished - started, 4),
+        "ttft_s": round(first_token_at - started, 4) if first_token_at else None,
+        "prompt_tokens": stats.get("prompt_eval_count"),
+        "output_tokens": eval_count,
+        "tokens_per_s": round(eval_count / (eval_duration / 1e9), 2) if eval_count and eval_duration else None,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(finished)),
+    }
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+class ModelRun:
+    """Counters and latencies of one model's pass, for progress lines and the summary"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.started = time.time()
+        self.skipped = 0
+        self.errors: Dict[str, int] = {}
+        self.latencies: List[float] = []
+        self.output_tokens = 0
+
+    def add(self, record: Dict[str, Any]):
+        self.latencies.append(record["latency_s"])
+        self.output_tokens += record["output_tokens"] or 0
+        if not record["success"]:
+            self.errors[record["error_type"]] = self.errors.get(record["error_type"], 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        wall = time.time() - self.started
+        return {
+            "model": self.model_name,
+            "completed": len(self.latencies),
+            "skipped": self.skipped,
+            "errors": dict(self.errors),
+            "wall_s": round(wall, 2),
+            "items_per_s": round(len(self.latencies) / wall, 2) if wall else None,
+            "output_tokens_per_s": round(self.output_tokens / wall, 1) if wall else None,
+            "latency_p50_s": percentile(self.latencies, 0.5),
+            "latency_p95_s": percentile(self.latencies, 0.95),
+        }
+
+
+def run_model(args: argparse.Namespace, model_name: str, done: Dict[Tuple[str, str], bool],
+              executor: ThreadPoolExecutor, output: TextIO, cancel: threading.Event) -> ModelRun:
+    """Feed one model's prompts through the executor, writing each result as it arrives"""
+    run = ModelRun(model_name)
+    pending: Dict[Future, Dict[str, Any]] = {}
+
+    def collect(finished: set):
+        for future in finished:
+            pending.pop(future)
+            record = future.result()
+            if record is None:
+                continue  # interrupted; the next run picks it up again
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            run.add(record)
+            if len(run.latencies) % PROGRESS_EVERY == 0:
+                print(f"[{model_name}] {len(run.latencies)} done, {sum(run.errors.values())} failed, "
+                      f"{len(run.latencies) / (time.time() - run.started):.2f}/s", file=sys.stderr)
+
+    try:
+        for item in read_items(args.input):
+            if item["model"] and item["model"] != model_name:
+                continue
+            previous = done.get((item["id"], model_name))
+            if previous or (previous is False and not args.retry_failed):
+                run.skipped += 1
+                continue
+            while len(pending) >= args.concurrency:
+                collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+            pending[executor.submit(run_item, item, model_name, args.temperature, cancel)] = item
+        while pending:
+            collect(wait(pending, return_when=FIRST_COMPLETED)[0])
+    except KeyboardInterrupt:
+        print("Interrupted; stopping the prompts in flight. Rerun the same command to resume.", file=sys.stderr)
+        cancel.set()
+        collect(wait(pending)[0])
+        raise
+    return run
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of prompts with one or more models")
+    parser.add_argument("input", help="JSONL prompts, e.g. curated FAQs")
+    parser.add_argument("--output", required=True, help="JSONL results; also the checkpoint for resuming")
+    parser.add_argument("--models", default=DEFAULT_MODELS, help="comma-separated, run one after another")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="prompts in flight at once")
+    parser.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE)
+    parser.add_argument("--retry-failed", action="store_true", help="run items whose earlier result was an error")
+    parser.add_argument("--verbose", action="store_true", help="show the request path's log output")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    streamlit.logger.set_log_level("error")  # silence bare-mode cache warnings
+    from scheduler import get_scheduler
+    from admission import get_admission_control
+
+    # This process has no other users, so the scheduler may admit every prompt in flight
+    # and --concurrency alone bounds the load instead of the per-session token budgets
+    scheduler = get_scheduler()
+    scheduler.max_concurrent = max(scheduler.max_concurrent, args.concurrency)
+    scheduler.per_model_limit = max(scheduler.per_model_limit, args.concurrency)
+    get_admission_control().enabled = False
+
+    done = load_checkpoint(args.output)
+    if done:
+        print(f"Resuming: {len(done)} results already in {args.output}", file=sys.stderr)
+    cancel = threading.Event()
+    runs = []
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="batch") as executor, \
+            open(args.output, "a", encoding="utf-8") as output:
+        try:
+            for model_name in [name.strip() for name in args.models.split(",") if name.strip()]:
+                runs.append(run_model(args, model_name, done, executor, output, cancel))
+        except KeyboardInterrupt:
+            sys.exit(130)
+
+    for run in runs:
+        print(json.dumps(run.summary()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Multi-session load test: N simulated browser sessions drive a real
+`streamlit run app.py` server over Streamlit's websocket protocol, replaying
+scripted conversations against the stub Ollama server.
+
+    python -m benchmarks.load_test --sessions 1,5,10,25 --output bench_load.json
+
+AppTest swaps a process-global runtime on every run, so it can't drive
+concurrent sessions in one process; a real server also gives real memory
+numbers. Needs the 'websockets' package (pip install websockets).
+
+Reported per session count:
+  rerun_ms        round trip of a plain rerun (typing a message), i.e. script time
+  send_ms         click Send -> script finished, including the streamed answer
+  first_token_ms  click Send -> first streamed token rendered
+  rss_mb          server resident memory before and after, and the delta per session
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.run_benchmarks import git_commit, latency_stats  # noqa: E402
+from benchmarks.stub_ollama import StubConfig, StubOllama  # noqa: E402
+from streamlit.proto.Alert_pb2 import Alert  # noqa: E402
+from streamlit.proto.BackMsg_pb2 import BackMsg  # noqa: E402
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg  # noqa: E402
+from streamlit.proto.WidgetStates_pb2 import WidgetState  # noqa: E402
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+DEFAULT_CONVERSATIONS = Path(__file__).resolve().parent / "conversations.jsonl"
+MESSAGE_LABEL = "Your message:"
+SEND_LABEL = "Send"
+STREAM_CURSOR = "▌"  # app.py appends it to the answer while tokens arrive
+
+
+def load_conversations(path: Path) -> List[List[str]]:
+    """One conversation per line: {"prompts": [...]} or a single {"prompt": ...}"""
+    conversations = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            prompts = entry.get("prompts") or [entry["prompt"]]
+            conversations.append([str(prompt) for prompt in prompts])
+    if not conversations:
+        raise ValueError(f"No conversations in {path}")
+    return conversations
+
+
+def rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Resident memory of a process from /proc (Linux only)"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+class RunResult:
+    """What one script run sent back"""
+
+    def __init__(self):
+        self.widgets: Dict[str, str] = {}  # label -> widget id
+        self.first_token_at: Optional[float] = None
+        self.errors: List[str] = []
+        self.finished_at: Optional[float] = None
+
+
+class SimulatedSession:
+    """One browser tab: a websocket, the widget ids it has seen, and its timings"""
+
+    def __init__(self, url: str, prompts: List[str], think_time: float):
+        self.url = url
+        self.prompts = prompts
+        self.think_time = think_time
+        self.ws = None
+        self.widgets: Dict[str, str] = {}
+        self.timings: Dict[str, List[float]] = {"initial": [], "rerun": [], "send": [], "first_token": []}
+        self.failed_sends: List[str] = []
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, states: Optional[List[WidgetState]] = None) -> RunResult:
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        if states:
+            message.rerun_script.widget_states.widgets.extend(states)
+        await self.ws.send(message.SerializeToString())
+
+        result = RunResult()
+        while result.finished_at is None:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.ws.recv())
+            kind = forward.WhichOneof("type")
+            # Send ends in st.rerun(), so the interrupted run is followed by another one
+            if kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                result.finished_at = time.perf_counter()
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                self._inspect(forward.delta.new_element, result)
+        self.widgets.update(result.widgets)
+        return result
+
+    @staticmethod
+    def _inspect(element, result: RunResult):
+        kind = element.WhichOneof("type")
+        if kind in ("text_input", "button"):
+            widget = getattr(element, kind)
+            result.widgets[widget.label] = widget.id
+        elif kind == "markdown" and element.markdown.body.endswith(STREAM_CURSOR):
+            if result.first_token_at is None:
+                result.first_token_at = time.perf_counter()
+        elif kind == "alert" and element.alert.format == Alert.ERROR:
+            result.errors.append(element.alert.body)
+        elif kind == "exception":
+            result.errors.append(element.exception.message)
+
+    async def run(self, session_number: int, unique_prompts: bool):
+        await self.connect()
+        started = time.perf_counter()
+        await self.rerun()
+        self.timings["initial"].append(time.perf_counter() - started)
+
+        for prompt in self.prompts:
+            await asyncio.sleep(self.think_time * random.uniform(0.5, 1.5))
+            if unique_prompts:
+                prompt = f"{prompt} (session {session_number})"
+            text = WidgetState(id=self.widgets[MESSAGE_LABEL], string_value=prompt)
+
+            # Typing the message triggers a plain rerun, as in the browser
+            started = time.perf_counter()
+            await self.rerun([text])
+            self.timings["rerun"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            result = await self.rerun([text, WidgetState(id=self.widgets[SEND_LABEL], trigger_value=True)])
+            self.timings["send"].append(result.finished_at - started)
+            if result.first_token_at is not None:
+                self.timings["first_token"].append(result.first_token_at - started)
+            if result.errors:
+                self.failed_sends.append(result.errors[0])
+
+
+def wait_until_healthy(base_url: str, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/_stcore/health", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Streamlit server at {base_url} did not become healthy within {timeout}s")
+
+
+def launch_server(app: Path, port: int, ollama_url: str) -> subprocess.Popen:
+    """Start `streamlit run` in a scratch directory so its caches and logs stay out of the repo"""
+    command = [
+        sys.executable, "-m", "streamlit", "run", str(app),
+        "--server.headless", "true",
+        "--server.port", str(port),
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ]
+    return subprocess.Popen(
+        command,
+        cwd=tempfile.mkdtemp(prefix="ollama-load-"),
+        env={**os.environ, "OLLAMA_BASE_URL": ollama_url},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def run_level(ws_url: str, conversations: List[List[str]], count: int, think_time: float,
+                    unique_prompts: bool, server_pid: Optional[int]) -> Dict[str, Any]:
+    rss_before = rss_mb(server_pid)
+    sessions = [
+        SimulatedSession(ws_url, conversations[number % len(conversations)], think_time)
+        for number in range(count)
+    ]
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(session.run(number, unique_prompts) for number, session in enumerate(sessions)),
+        return_exceptions=True
+    )
+    wall = time.perf_counter() - started
+    # Sample memory while every session is still connected
+    rss_after = rss_mb(server_pid)
+    await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+
+    def collect(name: str) -> List[float]:
+        return [value for session in sessions for value in session.timings[name]]
+
+    sends = collect("send")
+    failures = [failure for session in sessions for failure in session.failed_sends]
+    crashed = [repr(outcome) for outcome in outcomes if isinstance(outcome, Exception)]
+    per_session = None
+    if rss_before is not None and rss_after is not None:
+        per_session = round((rss_after - rss_before) / count, 2)
+    return {
+        "sessions": count,
+        "wall_s": round(wall, 3),
+        "sends": len(sends),
+        "sends_per_s": round(len(sends) / wall, 2) if wall else None,
+        "failed_sends": len(failures),
+        "failure_examples": sorted(set(failures))[:5],
+        "crashed_sessions": len(crashed),
+        "crash_examples": crashed[:3],
+        "initial_load": latency_stats(collect("initial")),
+        "rerun": latency_stats(collect("rerun")),
+        "send": latency_stats(sends),
+        "first_token": latency_stats(collect("first_token")),
+        "rss_mb": {"before": rss_before, "after": rss_after, "per_session": per_session},
+    }
+
+
+def print_level(level: Dict[str, Any]):
+    print(
+        f"{level['sessions']:>4} sessions | rerun p50 {level['rerun'].get('p50_ms', '-')} ms"
+        f" p95 {level['rerun'].get('p95_ms', '-')} ms"
+        f" | send p50 {level['send'].get('p50_ms', '-')} ms p95 {level['send'].get('p95_ms', '-')} ms"
+        f" | failed {level['failed_sends'] + level['crashed_sessions']}"
+        f" | {level['rss_mb']['per_session'] if level['rss_mb']['per_session'] is not None else '-'} MB/session",
+        flush=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated sessions through a Streamlit chat app")
+    parser.add_argument("--app", default=str(REPO_ROOT / "app.py"))
+    parser.add_argument("--sessions", default="1,5,10,20", help="comma-separated concurrent session counts")
+    parser.add_argument("--conversations", default=str(DEFAULT_CONVERSATIONS), help="JSONL of scripted prompts")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds between a session's turns")
+    parser.add_argument("--replay-verbatim", action="store_true",
+                        help="send identical prompts from different sessions (lets them coalesce)")
+    parser.add_argument("--port", type=int, default=8599, help="port for the launched Streamlit server")
+    parser.add_argument("--server-url", help="use an already running server instead of launching one")
+    parser.add_argument("--server-pid", type=int, help="pid of --server-url's process, for memory numbers")
+    parser.add_argument("--prefill-delay", type=float, default=0.1)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--output", default="bench_load.json")
+    args = parser.parse_args()
+    if websockets is None:
+        parser.error("the load test needs the 'websockets' package: pip install websockets")
+
+    conversations = load_conversations(Path(args.conversations))
+    stub = None
+    server = None
+    if args.server_url:
+        base_url, server_pid = args.server_url.rstrip("/"), args.server_pid
+    else:
+        stub = StubOllama(StubConfig(
+            prefill_delay=args.prefill_delay, token_delay=args.token_delay, response_tokens=args.response_tokens
+        )).start()
+        server = launch_server(Path(args.app).resolve(), args.port, stub.url)
+        base_url, server_pid = f"http://127.0.0.1:{args.port}", server.pid
+    ws_url = base_url.replace("http", "ws", 1) + "/_stcore/stream"
+
+    levels = []
+    try:
+        wait_until_healthy(base_url, timeout=60)
+        # One untimed session first, so imports and process-wide caches aren't charged to level one
+        asyncio.run(run_level(ws_url, [conversations[0][:1]], 1, 0, True, None))
+        for count in (int(value) for value in args.sessions.split(",")):
+            level = asyncio.run(run_level(
+                ws_url, conversations, count, args.think_time, not args.replay_verbatim, server_pid
+            ))
+            levels.append(level)
+            print_level(level)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if stub is not None:
+            stub.stop()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "app": args.app,
+            "conversations": args.conversations,
+            "think_time_s": args.think_time,
+            "stub": stub.config.to_dict() if stub else None,
+        },
+        "levels": levels,
+    }
+    output = Path(args.output).resolve()
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
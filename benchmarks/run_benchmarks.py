@@ -0,0 +1,425 @@
+"""
+Benchmarks for the Ollama request path (ollama_service.query_ollama) against a
+local stub server, so they run without a GPU, a model or network access.
+
+    python -m benchmarks.run_benchmarks --output bench_results.json
+    python -m benchmarks.run_benchmarks --quick --baseline bench_results.json
+    python -m benchmarks.run_benchmarks --backends 3 --scenarios backends
+
+Scenarios:
+  overhead    client-side cost per request: query_ollama vs a bare HTTP call
+  faults      retry behavior and error classification with injected 404/500/timeouts
+  throughput  requests/s and latency at several concurrency levels
+  backends    routing across --backends stubs: balanced, one failing, one slow with and without hedging
+  admission   one session flooding requests while members chat, with admission control off and on
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable
+
+import streamlit.logger
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.stub_ollama import StubConfig, StubOllama  # noqa: E402
+
+MODEL = "llama2"
+TEMPERATURE = 0.7  # above the cacheable range, so every request reaches the stub
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16]
+FAULT_TIMEOUT = 0.5  # seconds; request timeout used while injecting hangs
+BACKEND_CONCURRENCY = 8  # concurrent requests in the backends scenario
+HEDGE_AFTER = 0.15  # seconds; hedging delay tried in the backends scenario
+ADMISSION_SECONDS = 15  # length of each admission case; long enough that the flooder's initial burst is a small share
+FLOOD_CONCURRENCY = 8  # back-to-back requests the flooding session keeps in flight
+FLOOD_RETRY_DELAY = 0.03  # seconds a flooding thread pauses after a rejection, like key repeat on a held-down Enter
+MEMBERS = 4  # well-behaved sessions sending one request...
+MEMBER_INTERVAL = 1.0  # ...every this many seconds
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of raw samples"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def latency_stats(values: List[float]) -> Dict[str, Any]:
+    """Milliseconds, rounded for readable diffs"""
+    if not values:
+        return {"count": 0}
+
+    def ms(value: float) -> float:
+        return round(value * 1000, 3)
+
+    return {
+        "count": len(values),
+        "mean_ms": ms(sum(values) / len(values)),
+        "p50_ms": ms(percentile(values, 0.5)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(max(values)),
+    }
+
+
+def timed(call: Callable[[], Any]) -> tuple:
+    started = time.perf_counter()
+    result = call()
+    return time.perf_counter() - started, result
+
+
+class Bench:
+    """Runs the scenarios against the stubs, resetting shared state between them"""
+
+    def __init__(self, stubs: List[StubOllama], requests_per_run: int):
+        # Imported after OLLAMA_BACKENDS points at the stubs
+        import ollama_service
+        from admission import get_admission_control
+        from circuit_breaker import get_circuit_breakers
+
+        self.stubs = stubs
+        self.stub = stubs[0]
+        self.service = ollama_service
+        self.requests_per_run = requests_per_run
+        self._reset_breakers = get_circuit_breakers.clear
+        # Only the admission scenario measures with admission control; the rest would be rate-limited
+        self.admission_control = get_admission_control()
+        self.admission_control.enabled = False
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+
+    def unique_prompt(self) -> str:
+        # Distinct prompts keep caching and request coalescing out of the measurements
+        with self._counter_lock:
+            self._counter += 1
+            return f"benchmark prompt {self._counter}: how many sets should I do?"
+
+    def configure(self, **settings: Any):
+        for stub in self.stubs:
+            stub.config = StubConfig(**settings)
+        self._reset_breakers()  # failures from the previous scenario must not open circuits here
+        self.reset_stats()
+
+    def reset_stats(self) -> Dict[str, int]:
+        """Counters of all stubs added together"""
+        totals: Dict[str, int] = {}
+        for stub in self.stubs:
+            for key, value in stub.reset_stats().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def query(self, stream: bool, session_id: str = "default") -> Dict[str, Any]:
+        on_token = (lambda token: None) if stream else None
+        return self.service.query_ollama(
+            self.unique_prompt(), MODEL, TEMPERATURE, on_token=on_token, session_id=session_id
+        )
+
+    def raw_call(self, session, stream: bool):
+        """The same generation as a bare HTTP request, with no app logic around it"""
+        response = session.post(
+            f"{self.stub.url}/api/generate",
+            json={"model": MODEL, "prompt": self.unique_prompt(), "temperature": TEMPERATURE, "stream": stream},
+            stream=stream,
+            timeout=30
+        )
+        with response:
+            if stream:
+                for _ in response.iter_lines():
+                    pass
+            else:
+                response.json()
+
+    def overhead(self) -> Dict[str, Any]:
+        import requests
+
+        results = {}
+        for tokens in (1, 256):
+            self.configure(response_tokens=tokens)
+            for stream in (False, True):
+                session = requests.Session()
+                for _ in range(5):  # warm both connection pools
+                    self.raw_call(session, stream)
+                    self.query(stream)
+                raw = [timed(lambda: self.raw_call(session, stream))[0] for _ in range(self.requests_per_run)]
+                app = [timed(lambda: self.query(stream))[0] for _ in range(self.requests_per_run)]
+                session.close()
+                raw_stats, app_stats = latency_stats(raw), latency_stats(app)
+                results[f"{'stream' if stream else 'blocking'}_{tokens}_tokens"] = {
+                    "raw_http": raw_stats,
+                    "query_ollama": app_stats,
+                    "overhead_p50_ms": round(app_stats["p50_ms"] - raw_stats["p50_ms"], 3),
+                    "overhead_mean_ms": round(app_stats["mean_ms"] - raw_stats["mean_ms"], 3),
+                }
+        return results
+
+    def faults(self) -> Dict[str, Any]:
+        cases = {
+            "error_500_20pct": {"error_500_rate": 0.2},
+            "error_404_20pct": {"error_404_rate": 0.2},
+            "timeout_10pct": {"timeout_rate": 0.1, "hang_seconds": FAULT_TIMEOUT * 2},
+        }
+        results = {}
+        # Hangs should hit the same short timeout on every attempt, learned or not
+        timeouts = self.service.get_adaptive_timeouts()
+        original_timeout, original_max = self.service.REQUEST_TIMEOUT, timeouts.max_timeout
+        self.service.REQUEST_TIMEOUT = timeouts.max_timeout = FAULT_TIMEOUT
+        try:
+            for name, settings in cases.items():
+                self.configure(response_tokens=16, seed=42, **settings)
+                latencies = []
+                outcomes: Dict[str, int] = {}
+                for _ in range(self.requests_per_run):
+                    elapsed, result = timed(lambda: self.query(stream=True))
+                    latencies.append(elapsed)
+                    outcome = "success" if result["success"] else result["error_type"]
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                stub_stats = self.reset_stats()
+                results[name] = {
+                    "stub": settings,
+                    "request_timeout_s": FAULT_TIMEOUT,
+                    "outcomes": outcomes,
+                    "success_rate": round(outcomes.get("success", 0) / self.requests_per_run, 3),
+                    "generate_calls_per_request": round(stub_stats.get("generate", 0) / self.requests_per_run, 3),
+                    "injected_faults": {key: value for key, value in stub_stats.items() if key.startswith("fault_")},
+                    "latency": latency_stats(latencies),
+                }
+        finally:
+            self.service.REQUEST_TIMEOUT, timeouts.max_timeout = original_timeout, original_max
+        return results
+
+    def throughput(self, levels: List[int]) -> Dict[str, Any]:
+        from scheduler import get_scheduler
+
+        scheduler = get_scheduler()
+        results = {"scheduler_limits": {
+            "backends": len(self.stubs),
+            "max_concurrent_generations": scheduler.max_concurrent,
+            "per_model_concurrency": scheduler.per_model_limit,
+        }}
+        for level in levels:
+            self.configure(prefill_delay=0.05, token_delay=0.002, response_tokens=64)
+            total = max(self.requests_per_run, level * 4)
+            latencies = []
+            failures = 0
+
+            def one(_):
+                return timed(lambda: self.query(stream=True))
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                for elapsed, result in pool.map(one, range(total)):
+                    latencies.append(elapsed)
+                    failures += 0 if result["success"] else 1
+            wall = time.perf_counter() - started
+            results[f"concurrency_{level}"] = {
+                "requests": total,
+                "failures": failures,
+                "wall_s": round(wall, 3),
+                "requests_per_s": round(total / wall, 2),
+                "tokens_per_s": round((total - failures) * 64 / wall, 1),
+                "latency": latency_stats(latencies),
+            }
+        return results
+
+    def backends(self) -> Dict[str, Any]:
+        if len(self.stubs) < 2:
+            return {"skipped": "needs --backends 2 or more"}
+        from backend_pool import get_backend_pool
+
+        pool = get_backend_pool()
+        normal = {"prefill_delay": 0.05, "token_delay": 0.002, "response_tokens": 64}
+        cases = {
+            "balanced": ({}, None),
+            "one_failing": ({"error_500_rate": 1.0}, None),
+            "one_slow": ({"prefill_delay": 0.5}, None),
+            "one_slow_hedged": ({"prefill_delay": 0.5}, HEDGE_AFTER),
+        }
+        results = {"backends": len(self.stubs)}
+        original_hedge_after = pool.hedge_after
+        try:
+            for name, (first_stub, hedge_after) in cases.items():
+                self.configure(**normal)
+                self.stub.config = StubConfig(**{**normal, **first_stub})
+                pool.hedge_after = hedge_after
+                total = max(self.requests_per_run, BACKEND_CONCURRENCY * 4)
+                latencies = []
+                failures = 0
+                with ThreadPoolExecutor(max_workers=BACKEND_CONCURRENCY) as executor:
+                    for elapsed, result in executor.map(lambda _: timed(lambda: self.query(stream=True)), range(total)):
+                        latencies.append(elapsed)
+                        failures += 0 if result["success"] else 1
+                pool_stats = pool.snapshot()
+                results[name] = {
+                    "first_backend": first_stub,
+                    "hedge_after_s": hedge_after,
+                    "requests": total,
+                    "failures": failures,
+                    # generate calls, including retries and hedges, received by each stub
+                    "generate_calls": [stub.reset_stats().get("generate", 0) for stub in self.stubs],
+                    "hedges_sent": pool_stats["hedges_sent"],
+                    "hedges_won": pool_stats["hedges_won"],
+                    "latency": latency_stats(latencies),
+                }
+        finally:
+            pool.hedge_after = original_hedge_after
+        return results
+
+    def admission(self) -> Dict[str, Any]:
+        results = {}
+        try:
+            for name, enabled in (("admission_off", False), ("admission_on", True)):
+                self.configure(prefill_delay=0.05, token_delay=0.002, response_tokens=64)
+                self.admission_control.enabled = enabled
+                deadline = time.perf_counter() + ADMISSION_SECONDS
+                outcomes: Dict[str, Dict[str, int]] = {"flooder": {}, "members": {}}
+                member_latencies = []
+                lock = threading.Lock()
+
+                def record(who: str, result: Dict[str, Any]):
+                    outcome = "success" if result["success"] else result["error_type"]
+                    with lock:
+                        outcomes[who][outcome] = outcomes[who].get(outcome, 0) + 1
+
+                def flood(worker: int):
+                    while time.perf_counter() < deadline:
+                        result = self.query(stream=True, session_id=f"{name}-flooder")
+                        record("flooder", result)
+                        if not result["success"]:
+                            time.sleep(FLOOD_RETRY_DELAY)
+
+                def member(index: int):
+                    # Members don't type in lockstep; spread their first requests over one interval
+                    time.sleep(index * MEMBER_INTERVAL / MEMBERS)
+                    while time.perf_counter() < deadline:
+                        elapsed, result = timed(lambda: self.query(stream=True, session_id=f"{name}-member-{index}"))
+                        record("members", result)
+                        with lock:
+                            member_latencies.append(elapsed)
+                        time.sleep(max(0.0, MEMBER_INTERVAL - elapsed))
+
+                with ThreadPoolExecutor(max_workers=FLOOD_CONCURRENCY + MEMBERS) as executor:
+                    futures = [executor.submit(flood, i) for i in range(FLOOD_CONCURRENCY)]
+                    futures += [executor.submit(member, i) for i in range(MEMBERS)]
+                    for future in futures:
+                        future.result()
+                results[name] = {
+                    "flooder": outcomes["flooder"],
+                    "members": outcomes["members"],
+                    "generate_calls": self.reset_stats().get("generate", 0),
+                    "member_latency": latency_stats(member_latencies),
+                }
+        finally:
+            self.admission_control.enabled = False
+        return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the headline numbers of two runs side by side"""
+    def rows(results: Dict[str, Any]) -> Dict[str, float]:
+        flat = {}
+        for name, case in results["scenarios"].get("overhead", {}).items():
+            flat[f"overhead {name} p50 ms"] = case["overhead_p50_ms"]
+        for name, case in results["scenarios"].get("faults", {}).items():
+            flat[f"faults {name} success rate"] = case["success_rate"]
+        for name, case in results["scenarios"].get("throughput", {}).items():
+            if name.startswith("concurrency_"):
+                flat[f"throughput {name} req/s"] = case["requests_per_s"]
+                flat[f"throughput {name} p95 ms"] = case["latency"]["p95_ms"]
+        for name, case in results["scenarios"].get("backends", {}).items():
+            if isinstance(case, dict) and "latency" in case:
+                flat[f"backends {name} p95 ms"] = case["latency"]["p95_ms"]
+        for name, case in results["scenarios"].get("admission", {}).items():
+            flat[f"admission {name} member p95 ms"] = case["member_latency"]["p95_ms"]
+        return flat
+
+    now, before = rows(current), rows(baseline)
+    print(f"\n{'metric':<48} {baseline['meta']['commit'] or 'baseline':>12} {current['meta']['commit'] or 'current':>12}")
+    for metric, value in now.items():
+        print(f"{metric:<48} {before.get(metric, '-'):>12} {value:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query_ollama against a local stub Ollama server")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--requests", type=int, default=50, help="requests per measurement")
+    parser.add_argument("--concurrency", default=",".join(map(str, CONCURRENCY_LEVELS)))
+    parser.add_argument("--scenarios", default="overhead,faults,throughput")
+    parser.add_argument("--quick", action="store_true", help="10 requests per measurement")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--backends", type=int, default=1, help="number of stub servers to spread requests across")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log output")
+    args = parser.parse_args()
+    requests_per_run = 10 if args.quick else args.requests
+    output = Path(args.output).resolve()
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+
+    stubs = [StubOllama().start() for _ in range(args.backends)]
+    os.environ["OLLAMA_BASE_URL"] = stubs[0].url
+    os.environ["OLLAMA_BACKENDS"] = ",".join(stub.url for stub in stubs)
+    # Caches, transcripts and logs of the app go to a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix="ollama-bench-"))
+    # Injected faults are logged as errors by the app, so its logs are off unless asked for
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.CRITICAL,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    streamlit.logger.set_log_level("error")  # silence bare-mode cache warnings
+    bench = Bench(stubs, requests_per_run)
+
+    scenarios = {}
+    for name in args.scenarios.split(","):
+        print(f"Running {name}...", flush=True)
+        if name == "overhead":
+            scenarios[name] = bench.overhead()
+        elif name == "faults":
+            scenarios[name] = bench.faults()
+        elif name == "throughput":
+            scenarios[name] = bench.throughput([int(level) for level in args.concurrency.split(",")])
+        elif name == "backends":
+            scenarios[name] = bench.backends()
+        elif name == "admission":
+            scenarios[name] = bench.admission()
+        else:
+            parser.error(f"unknown scenario '{name}'")
+    for stub in stubs:
+        stub.stop()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests_per_run": requests_per_run,
+            "backends": args.backends,
+        },
+        "scenarios": scenarios,
+    }
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List
+
+STUB_MODELS = ["llama2", "mistral", "codellama", "nomic-embed-text"]
+STUB_NUM_CTX = 4096
+EMBEDDING_DIM = 64
+
+
+class QuietServer(ThreadingHTTPServer):
+    """Ignores clients that hang up early, e.g. after their read timeout"""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class StubConfig:
+    """Latency, size and fault settings of the stub; can be changed while it runs"""
+
+    def __init__(self, prefill_delay: float = 0.0, token_delay: float = 0.0, response_tokens: int = 32,
+                 error_404_rate: float = 0.0, error_500_rate: float = 0.0, timeout_rate: float = 0.0,
+                 hang_seconds: float = 5.0, models: Optional[List[str]] = None, seed: Optional[int] = None):
+        self.prefill_delay = prefill_delay  # seconds before the first token
+        self.token_delay = token_delay  # seconds between tokens
+        self.response_tokens = response_tokens
+        self.error_404_rate = error_404_rate  # fraction of generations answered with 404
+        self.error_500_rate = error_500_rate  # ...with 500
+        self.timeout_rate = timeout_rate  # ...that hang for hang_seconds before answering
+        self.hang_seconds = hang_seconds
+        self.models = list(models or STUB_MODELS)
+        self.random = random.Random(seed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: value for key, value in vars(self).items() if key != "random"}
+
+
+class StubOllama:
+    """
+    Local HTTP server speaking enough of the Ollama API for the app and the
+    benchmarks: /api/tags, /api/ps, /api/show, /api/generate, /api/chat and
+    /api/embeddings. Generations produce fake tokens at the configured speed,
+    and faults are injected only into /api/generate and /api/chat. Every model
+    that was generated with is reported as loaded by /api/ps.
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {}
+        self.loaded: Dict[str, float] = {}  # model -> last use, reported by /api/ps
+        self.server = QuietServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllama":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def reset_stats(self) -> Dict[str, int]:
+        """Return the counters collected so far and start over"""
+        with self._lock:
+            stats, self.stats = self.stats, {}
+        return stats
+
+    def pick_fault(self) -> Optional[str]:
+        config = self.config
+        draw = config.random.random()
+        for fault, rate in (("404", config.error_404_rate), ("500", config.error_500_rate),
+                            ("timeout", config.timeout_rate)):
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like Ollama
+            disable_nagle_algorithm = True  # small writes would otherwise stall on delayed ACKs
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, status: int, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def read_json(self) -> Dict[str, Any]:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    stub.count("tags")
+                    self.send_json(200, {"models": [
+                        {"name": f"{name}:latest", "size": 3825819519,
+                         "details": {"parameter_size": "7B", "quantization_level": "Q4_0"}}
+                        for name in stub.config.models
+                    ]})
+                elif self.path == "/api/ps":
+                    stub.count("ps")
+                    self.send_json(200, {"models": [
+                        {"name": f"{name}:latest", "size": 3825819519, "size_vram": 3825819519}
+                        for name in list(stub.loaded)
+                    ]})
+                elif self.path == "/":
+                    self.send_json(200, {"status": "Ollama is running"})
+                else:
+                    self.send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                endpoint = self.path.rsplit("/", 1)[-1]
+                try:
+                    payload = self.read_json()
+                except ValueError:
+                    self.send_json(400, {"error": "invalid JSON"})
+                    return
+                stub.count(endpoint)
+                if endpoint == "show":
+                    self.send_json(200, {
+                        "parameters": f"num_ctx {STUB_NUM_CTX}",
+                        "model_info": {"llama.context_length": STUB_NUM_CTX}
+                    })
+                elif endpoint == "embeddings":
+                    if payload.get("model", "").removesuffix(":latest") not in stub.config.models:
+                        self.send_json(404, {"error": f"model '{payload.get('model')}' not found"})
+                        return
+                    self.send_json(200, {"embedding": embed(payload.get("prompt", ""))})
+                elif endpoint in ("generate", "chat"):
+                    self.generate(endpoint, payload)
+                else:
+                    self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+            def generate(self, endpoint: str, payload: Dict[str, Any]):
+                config = stub.config
+                model = payload.get("model", "").removesuffix(":latest")
+                if model not in config.models:
+                    self.send_json(404, {"error": f"model '{model}' not found"})
+                    return
+                stub.loaded[model] = time.time()
+                if endpoint == "generate" and not payload.get("prompt"):
+                    # Load-only request, as sent by the model warmer
+                    self.send_json(200, {"model": model, "response": "", "done": True})
+                    return
+                fault = stub.pick_fault()
+                if fault:
+                    stub.count(f"fault_{fault}")
+                if fault == "404":
+                    self.send_json(404, {"error": f"model '{model}' not found"})
+                    return
+                if fault == "500":
+                    self.send_json(500, {"error": "injected server error"})
+                    return
+                if fault == "timeout":
+                    time.sleep(config.hang_seconds)
+
+                started = time.time()
+                time.sleep(config.prefill_delay)
+                prefilled = time.time()
+                tokens = [f"tok{i} " for i in range(config.response_tokens)]
+                final = {
+                    "model": model,
+                    "done": True,
+                    "done_reason": "stop",
+                    "total_duration": 0,
+                    "load_duration": 0,
+                    "prompt_eval_count": max(1, len(json.dumps(payload)) // 4),
+                    "prompt_eval_duration": max(1, int((prefilled - started) * 1e9)),
+                    "eval_count": len(tokens),
+                }
+                if endpoint == "generate":
+                    final["context"] = list(range(final["prompt_eval_count"] + len(tokens)))
+
+                if payload.get("stream", True):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    try:
+                        for token in tokens:
+                            time.sleep(config.token_delay)
+                            self.write_chunk(chunk_for(endpoint, model, token, done=False))
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client closed the stream, which stops a real Ollama generating
+                        stub.count(f"{endpoint}_aborted")
+                        self.close_connection = True
+                        return
+                    final["eval_duration"] = max(1, int((time.time() - prefilled) * 1e9))
+                    final["total_duration"] = int((time.time() - started) * 1e9)
+                    self.write_chunk({**chunk_for(endpoint, model, "", done=True), **final})
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    time.sleep(config.token_delay * len(tokens))
+                    final["eval_duration"] = max(1, int((time.time() - prefilled) * 1e9))
+                    final["total_duration"] = int((time.time() - started) * 1e9)
+                    self.send_json(200, {**chunk_for(endpoint, model, "".join(tokens), done=True), **final})
+
+            def write_chunk(self, body: Dict[str, Any]):
+                data = json.dumps(body).encode("utf-8") + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def chunk_for(endpoint: str, model: str, text: str, done: bool) -> Dict[str, Any]:
+    """One streamed chunk in the shape of /api/generate or /api/chat"""
+    if endpoint == "chat":
+        return {"model": model, "message": {"role": "assistant", "content": text}, "done": done}
+    return {"model": model, "response": text, "done": done}
+
+
+def embed(text: str) -> List[float]:
+    """Deterministic pseudo-embedding, so identical prompts get identical vectors"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIM)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stub Ollama server for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--prefill-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--error-404-rate", type=float, default=0.0)
+    parser.add_argument("--error-500-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        prefill_delay=args.prefill_delay, token_delay=args.token_delay, response_tokens=args.response_tokens,
+        error_404_rate=args.error_404_rate, error_500_rate=args.error_500_rate,
+        timeout_rate=args.timeout_rate, hang_seconds=args.hang_seconds
+    )
+    stub = StubOllama(config, args.host, args.port)
+    print(f"Stub Ollama listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import streamlit as st
-import requests
 import json
+import logging
+import time
 from datetime import datetime
 
+from log_pipeline import setup_logging
+from ollama_client import OLLAMA_BASE_URL, get_ollama_client
+from model_warmup import get_model_warmer
+from model_catalog import get_model_catalog
+
+# Configure logging (queued, written by a background thread; see log_pipeline.py)
+setup_logging(logging.INFO)
+
 # Configure Streamlit page and initialization  
 st.set_page_config(
     page_title="AI Chatbot",
@@ -94,13 +103,24 @@ if 'messages' not in st.session_state:
 if 'form_key' not in st.session_state:
     st.session_state.form_key = 0
 
+# Number of most recent messages rendered in the chat history
+HISTORY_WINDOW = 20
+
+# Seconds between re-renders of a streaming answer; each one redraws the whole text
+STREAM_RENDER_INTERVAL = 0.05
+if 'history_window' not in st.session_state:
+    st.session_state.history_window = HISTORY_WINDOW
+
 # Sidebar configuration
 with st.sidebar:
     st.title("⚙️ Configuration")
     model = st.selectbox(
         "Select Model",
-        ["llama2", "mistral", "codellama"],
-        index=0
+        get_model_catalog().names(),
+        index=0,
+        key="model_widget",
+        # Preload the newly selected model so the next Send skips the cold start
+        on_change=lambda: get_model_warmer().warm_up(st.session_state.model_widget)
     )
     temperature = st.slider("Temperature", 0.0, 2.0, 0.7)
     
@@ -111,6 +131,7 @@ with st.sidebar:
     if st.button("🗑️ Clear Chat History", type="secondary"):
         st.session_state.messages = []
         st.session_state.form_key += 1
+        st.session_state.history_window = HISTORY_WINDOW
         st.rerun() # ✅ fixed
 
     # Chat statistics
@@ -126,47 +147,78 @@ with st.sidebar:
 # Main chat interface
 st.title("🤖 Personal Gym Chat Bot")
 
-# Function to query Ollama
-def query_ollama(prompt, model_name, temp):
+# Error text for the chat, after whatever part of the answer was already shown
+def error_reply(parts, error):
+    return f"{''.join(parts)}\n\n_{error}_" if parts else error
+
+# Function to query Ollama (streams tokens to on_token when given)
+def query_ollama(prompt, model_name, temp, on_token=None):
+    parts = []
     try:
-        response = requests.post(
-            "http://localhost:11434/api/generate",
-            json={
+        get_model_warmer().record_use(model_name)
+        response = get_ollama_client(OLLAMA_BASE_URL).post(
+            "generate",
+            {
                 "model": model_name,
                 "prompt": prompt,
                 "temperature": temp,
-                "stream": False
-            }
+                "stream": on_token is not None,
+                "keep_alive": get_model_warmer().keep_alive_for(model_name)
+            },
+            stream=on_token is not None
         )
-        if response.status_code == 200:
-            return response.json()["response"]
-        else:
+        if response.status_code != 200:
             return f"Error: {response.status_code}"
+        if on_token is None:
+            return response.json()["response"]
+        with response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    return error_reply(parts, f"Error: {chunk['error']}")
+                token = chunk.get("response", "")
+                if token:
+                    parts.append(token)
+                    on_token(token)
+                if chunk.get("done"):
+                    break
+        return "".join(parts)
     except Exception as e:
-        return f"Error: {str(e)}"
+        return error_reply(parts, f"Error: {str(e)}")
 
-# Display chat history with improved styling
-if st.session_state.messages:
+# Memoized HTML for a single message (past messages never change)
+@st.cache_data(max_entries=2000, show_spinner=False)
+def render_message(role, content, timestamp):
+    css_class = "user-message" if role == "user" else "assistant-message"
+    speaker = "You" if role == "user" else "Assistant"
+    return f"""
+    <div class="{css_class}">
+        <strong>{speaker}:</strong> {content}
+        <div class="message-time">{timestamp}</div>
+    </div>
+    """
+
+def load_earlier_messages():
+    st.session_state.history_window += HISTORY_WINDOW
+
+# Display the newest messages; the fragment reruns alone when loading earlier ones
+@st.fragment
+def chat_history():
+    messages = st.session_state.messages
+    if not messages:
+        st.info("👋 Start a conversation by typing a message below!")
+        return
     st.markdown("### 💬 Chat History")
-    
-    for i, message in enumerate(st.session_state.messages):
-        with st.container():
-            if message["role"] == "user":
-                st.markdown(f"""
-                <div class="user-message">
-                    <strong>You:</strong> {message['content']}
-                    <div class="message-time">{message.get('timestamp', '')}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="assistant-message">
-                    <strong>Assistant:</strong> {message['content']}
-                    <div class="message-time">{message.get('timestamp', '')}</div>
-                </div>
-                """, unsafe_allow_html=True)
-else:
-    st.info("👋 Start a conversation by typing a message below!")
+    hidden = max(0, len(messages) - st.session_state.history_window)
+    if hidden:
+        st.button(f"⬆️ Load earlier messages ({hidden} hidden)", on_click=load_earlier_messages)
+    st.markdown("".join(
+        render_message(m["role"], m["content"], m.get("timestamp", "")) for m in messages[hidden:]
+    ), unsafe_allow_html=True)
+
+chat_history()
 
 # Form for chat input (prevents rerun on every keystroke)
 with st.form(key=f"chat_form_{st.session_state.form_key}", clear_on_submit=True):
@@ -199,9 +251,24 @@ with st.form(key=f"chat_form_{st.session_state.form_key}", clear_on_submit=True)
             "timestamp": timestamp
         })
         
-        # Get AI response
+        # Get AI response, rendering tokens as they stream in
+        response_placeholder = st.empty()
+        streamed = {"text": "", "rendered_at": 0.0}
+
+        def render_token(token):
+            streamed["text"] += token
+            now = time.time()
+            if now - streamed["rendered_at"] < STREAM_RENDER_INTERVAL:
+                return  # the rerun after the answer shows the complete text
+            streamed["rendered_at"] = now
+            response_placeholder.markdown(f"""
+            <div class="assistant-message">
+                <strong>Assistant:</strong> {streamed["text"]}▌
+            </div>
+            """, unsafe_allow_html=True)
+
         with st.spinner("🤔 Thinking..."):
-            response = query_ollama(user_input.strip(), model, temperature)
+            response = query_ollama(user_input.strip(), model, temperature, on_token=render_token)
             st.session_state.messages.append({
                 "role": "assistant", 
                 "content": response,
@@ -218,20 +285,15 @@ with st.form(key=f"chat_form_{st.session_state.form_key}", clear_on_submit=True)
 # Display connection status
 st.markdown("---")
 with st.expander("🔧 Connection Status"):
-    try:
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
-        if response.status_code == 200:
-            st.success("✅ Connected to Ollama server")
-            models = response.json().get("models", [])
-            if models:
-                st.markdown("**Available models:**")
-                for model_info in models:
-                    st.markdown(f"- {model_info.get('name', 'Unknown')}")
-            else:
-                st.warning("No models found. Please install models using `ollama pull <model_name>`")
+    catalog = get_model_catalog()
+    if catalog.is_loaded():
+        st.success("✅ Connected to Ollama server")
+        models = catalog.models()
+        if models:
+            st.markdown("**Available models:**")
+            for model_info in models.values():
+                st.markdown(f"- {model_info['name']} ({model_info['size'] / 1e9:.1f} GB, {model_info['quantization'] or 'unknown quantization'})")
         else:
-            st.error(f"❌ Ollama server error: {response.status_code}")
-    except requests.exceptions.ConnectionError:
+            st.warning("No models found. Please install models using `ollama pull <model_name>`")
+    else:
         st.error("❌ Cannot connect to Ollama server. Make sure Ollama is running on localhost:11434")
-    except Exception as e:
-        st.error(f"❌ Error checking connection: {str(e)}")
@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 3  # consecutive failures before a circuit opens
+RECOVERY_TIMEOUT = 30  # seconds an open circuit waits before letting a probe through
+HALF_OPEN_MAX_CALLS = 1  # probe requests allowed while half-open
+
+
+class CircuitBreaker:
+    """
+    Classic closed/open/half-open circuit breaker.
+    Closed: requests flow and consecutive failures are counted.
+    Open: requests fail fast until RECOVERY_TIMEOUT has passed.
+    Half-open: a trickle of probe requests decides whether to close or re-open.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD,
+                 recovery_timeout: float = RECOVERY_TIMEOUT, half_open_max_calls: int = HALF_OPEN_MAX_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+    def _refresh_state(self):
+        if self._state == self.OPEN and time.time() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probes_in_flight = 0
+            logger.info(f"Circuit '{self.name}' half-open, allowing probe requests")
+
+    def allow_request(self) -> bool:
+        """Whether a request may go out now; in half-open this takes a probe slot"""
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.time() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed after successful probe")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes_in_flight = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._probes_in_flight = 0
+
+    def release(self):
+        """Return a half-open probe slot when the request produced no verdict"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh_state()
+            return {
+                "name": self.name,
+                "state": self._state,
+                "failures": self._failures,
+                "retry_after": max(0.0, self.recovery_timeout - (time.time() - self._opened_at))
+                if self._state == self.OPEN else 0.0
+            }
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers tracked per backend and per (backend, model)"""
+
+    def __init__(self, **breaker_options: Any):
+        self.breaker_options = breaker_options
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def _get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, **self.breaker_options)
+            return self._breakers[name]
+
+    def for_backend(self, backend: str) -> CircuitBreaker:
+        return self._get(backend)
+
+    def for_model(self, backend: str, model_name: str) -> CircuitBreaker:
+        return self._get(f"{backend} [{model_name}]")
+
+    def is_open(self, backend: str, model_name: Optional[str] = None) -> bool:
+        """True while the backend circuit, or the model's circuit on it, rejects requests; takes no probe slot"""
+        names = [backend] if model_name is None else [backend, f"{backend} [{model_name}]"]
+        with self._lock:
+            breakers = [self._breakers[name] for name in names if name in self._breakers]
+        return any(breaker.snapshot()["state"] == CircuitBreaker.OPEN for breaker in breakers)
+
+    def allow_request(self, backend: str, model_name: str) -> Tuple[bool, float]:
+        """Check both circuits; returns (allowed, seconds until retry is worthwhile)"""
+        backend_breaker = self.for_backend(backend)
+        model_breaker = self.for_model(backend, model_name)
+        # A half-open circuit with its probe slots taken reports a short wait
+        if not backend_breaker.allow_request():
+            return False, max(1.0, backend_breaker.retry_after())
+        if not model_breaker.allow_request():
+            backend_breaker.release()
+            return False, max(1.0, model_breaker.retry_after())
+        return True, 0.0
+
+    def record_success(self, backend: str, model_name: str):
+        self.for_backend(backend).record_success()
+        self.for_model(backend, model_name).record_success()
+
+    def record_backend_failure(self, backend: str, model_name: str):
+        """The backend could not be reached; the model gets no verdict"""
+        self.for_backend(backend).record_failure()
+        self.for_model(backend, model_name).release()
+
+    def record_model_failure(self, backend: str, model_name: str):
+        """The backend answered but the model failed (500s, timeouts)"""
+        self.for_backend(backend).record_success()
+        self.for_model(backend, model_name).record_failure()
+
+    def release(self, backend: str, model_name: str):
+        """Neither circuit gets a verdict (e.g. validation or 404 errors)"""
+        self.for_backend(backend).release()
+        self.for_model(backend, model_name).release()
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [breaker.snapshot() for breaker in breakers]
+
+
+@st.cache_resource
+def get_circuit_breakers() -> CircuitBreakerRegistry:
+    """Process-wide circuit breakers shared by every session"""
+    return CircuitBreakerRegistry()
@@ -0,0 +1,150 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = 2048  # tokens of conversation carried into each turn
+CHARS_PER_TOKEN = 4  # rough estimate used when only text is available
+COMPACTION_MESSAGE_THRESHOLD = 40  # compact once this many messages are held
+COMPACTION_TOKEN_THRESHOLD = 6000  # ...or once they add up to this many tokens
+KEEP_RECENT_MESSAGES = 6  # newest messages always kept verbatim
+SUMMARY_TEMPERATURE = 0.2
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for budgeting text we have not tokenized"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def reusable_context(contexts: Dict[str, List[int]], model_name: str,
+                     budget: int = CONTEXT_TOKEN_BUDGET) -> Optional[List[int]]:
+    """
+    The context tokens Ollama returned for this model's last turn, if they still
+    fit the budget. Returning None makes the next turn rebuild a sliding window.
+    """
+    context = contexts.get(model_name)
+    if not context:
+        return None
+    if len(context) > budget:
+        logger.info(f"Context for '{model_name}' reached {len(context)} tokens, rebuilding window")
+        contexts.pop(model_name, None)
+        return None
+    return context
+
+
+def speaker_label(message: Dict[str, Any]) -> str:
+    if message["role"] == "user":
+        return "User"
+    if message["role"] == "summary":
+        return "Summary of earlier conversation"
+    return "Assistant"
+
+
+def build_window_prompt(history: List[Dict[str, Any]], prompt: str,
+                        budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Prefix the prompt with as many recent turns as fit in the token budget"""
+    remaining = budget - estimate_tokens(prompt)
+    lines = []
+    for message in reversed(history):
+        line = f"{speaker_label(message)}: {message['content']}"
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    if not lines:
+        return prompt
+    lines.reverse()
+    transcript = "\n\n".join(lines)
+    return f"Conversation so far:\n\n{transcript}\n\nUser: {prompt}\nAssistant:"
+
+
+def needs_compaction(messages: List[Dict[str, Any]]) -> bool:
+    """Whether the held history has outgrown the message or token threshold"""
+    if len(messages) <= KEEP_RECENT_MESSAGES + 1:
+        return False
+    if len(messages) > COMPACTION_MESSAGE_THRESHOLD:
+        return True
+    return sum(estimate_tokens(m["content"]) for m in messages) > COMPACTION_TOKEN_THRESHOLD
+
+
+def build_summary_prompt(messages: List[Dict[str, Any]]) -> str:
+    transcript = "\n\n".join(f"{speaker_label(m)}: {m['content']}" for m in messages)
+    return (
+        "Summarize the following gym chat between a user and a fitness assistant. "
+        "Keep the user's goals, stats, injuries, preferences and any plans or numbers "
+        "the assistant gave. Write at most 200 words.\n\n"
+        f"{transcript}\n\nSummary:"
+    )
+
+
+def summarize_messages(model_name: str, messages: List[Dict[str, Any]], session_id: str) -> Optional[str]:
+    """
+    Ask the model for a rolling summary (blocking; run it off the script thread).
+    It is a generation like any other, so it goes through query_ollama:
+    admission, the scheduler, the backend pool and the circuit breakers.
+    """
+    from ollama_service import query_ollama  # ollama_service imports this module
+
+    result = query_ollama(build_summary_prompt(messages), model_name, SUMMARY_TEMPERATURE, session_id=session_id)
+    if not result["success"]:
+        logger.warning(f"History summary failed: {result['error_type']} - {result['error_message']}")
+        return None
+    return result["response"].strip() or None
+
+
+class HistoryCompactor:
+    """
+    Summarizes old turns on a background thread. Sessions submit work and pick
+    up the finished Future on a later rerun, since worker threads must not touch
+    st.session_state.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history-compactor")
+
+    def submit(self, model_name: str, messages: List[Dict[str, Any]], session_id: str) -> Future:
+        return self._executor.submit(summarize_messages, model_name, list(messages), session_id)
+
+
+def start_compaction(compactor: HistoryCompactor, model_name: str,
+                     messages: List[Dict[str, Any]], session_id: str) -> Dict[str, Any]:
+    """Summarize everything but the newest messages; returns the pending job"""
+    count = len(messages) - KEEP_RECENT_MESSAGES
+    logger.info(f"Compacting {count} messages into a summary")
+    return {"future": compactor.submit(model_name, messages[:count], session_id), "count": count}
+
+
+def apply_compaction(messages: List[Dict[str, Any]],
+                     pending: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Replace the summarized prefix with the summary once the job is done; the
+    originals stay in the conversation store. Returns the compacted history,
+    or None when the job failed. The summary carries "through_seq", the
+    sequence number of the last message it covers.
+    """
+    summary = pending["future"].result()
+    if not summary:
+        return None
+    count = pending["count"]
+    summarized = [m for m in messages[:count] if m["role"] != "summary"]
+    previously_summarized = sum(
+        m.get("summarized_messages", 0) for m in messages[:count] if m["role"] == "summary"
+    )
+    summarized_total = previously_summarized + len(summarized)
+    logger.info(f"History compacted: {count} messages replaced by a summary")
+    return [{
+        "role": "summary",
+        "content": summary,
+        "summarized_messages": summarized_total,
+        "through_seq": max(m["seq"] for m in summarized)
+    }] + messages[count:]
+
+
+@st.cache_resource
+def get_history_compactor() -> HistoryCompactor:
+    """Process-wide background summarizer"""
+    return HistoryCompactor()
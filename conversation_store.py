@@ -0,0 +1,199 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_DB_PATH = "conversations.db"
+CONVERSATION_RETENTION = 30 * 24 * 3600  # seconds; older conversations are pruned at startup
+WRITE_BATCH_SIZE = 100  # messages per transaction
+WRITE_FLUSH_INTERVAL = 0.5  # seconds the writer waits to fill a batch
+
+
+class ConversationStore:
+    """
+    Every chat message, one row each, keyed by conversation id and sequence
+    number. Sessions keep only their newest messages in memory and page older
+    ones from here. Appends return at once; a writer thread commits them in
+    batches. Safe to share between sessions and between processes on one
+    database (the web app and the API): sequence numbers are allocated inside
+    the insert, so concurrent writers never overwrite each other's messages.
+    Each conversation also keeps its latest history summary, so a restored
+    session starts from it instead of summarizing the same turns again.
+    """
+
+    def __init__(self, db_path: str = CONVERSATION_DB_PATH, retention: float = CONVERSATION_RETENTION):
+        self._lock = threading.Lock()
+        self._next_seq: Dict[str, int] = {}
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "conversation_id TEXT, seq INTEGER, role TEXT, content TEXT, created_at REAL, "
+            "truncated INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (conversation_id, seq))"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(messages)")}
+        if "truncated" not in columns:
+            # Databases written before answers could be stopped
+            self._db.execute("ALTER TABLE messages ADD COLUMN truncated INTEGER NOT NULL DEFAULT 0")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "conversation_id TEXT PRIMARY KEY, content TEXT, summarized_messages INTEGER, through_seq INTEGER)"
+        )
+        self._db.execute(
+            "DELETE FROM messages WHERE conversation_id IN ("
+            "SELECT conversation_id FROM messages GROUP BY conversation_id HAVING MAX(created_at) < ?)",
+            (time.time() - retention,)
+        )
+        self._db.execute(
+            "DELETE FROM summaries WHERE conversation_id NOT IN (SELECT DISTINCT conversation_id FROM messages)"
+        )
+        self._db.commit()
+
+        self._writer = threading.Thread(target=self._write_batches, name="conversation-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def append(self, conversation_id: str, role: str, content: str, truncated: bool = False) -> Dict[str, Any]:
+        """
+        Queue a message for writing and return it. Its "seq" is provisional
+        until the writer has stored it and put the allocated number in place,
+        which differs only when another process wrote to the conversation.
+        truncated marks an answer that was stopped before it finished.
+        """
+        with self._lock:
+            seq = self._next_seq.get(conversation_id)
+            if seq is None:
+                seq = self._max_seq(conversation_id) + 1
+            self._next_seq[conversation_id] = seq + 1
+        message = {"role": role, "content": content, "seq": seq}
+        if truncated:
+            message["truncated"] = True
+        self._queue.put({"message": message, "conversation_id": conversation_id, "created_at": time.time()})
+        return message
+
+    def _max_seq(self, conversation_id: str) -> int:
+        row = self._db.execute(
+            "SELECT MAX(seq) FROM messages WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def _write_batches(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+            try:
+                with self._lock:
+                    stored = [self._insert(entry) for entry in batch]
+                    self._db.commit()
+                    for entry, seq in zip(batch, stored):
+                        entry["message"]["seq"] = seq
+                        self._next_seq[entry["conversation_id"]] = max(
+                            self._next_seq.get(entry["conversation_id"], 0), seq + 1
+                        )
+            except sqlite3.Error as e:
+                self._db.rollback()
+                logger.error(f"Failed to write {len(batch)} chat messages: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _insert(self, entry: Dict[str, Any]) -> int:
+        """
+        Store one message under the next free sequence number of its
+        conversation, taken in the same statement so no other writer can claim
+        it; a collision violates the primary key and fails instead of replacing
+        """
+        message = entry["message"]
+        return self._db.execute(
+            "INSERT INTO messages (conversation_id, seq, role, content, created_at, truncated) "
+            "SELECT ?, COALESCE(MAX(seq), -1) + 1, ?, ?, ?, ? FROM messages WHERE conversation_id = ? "
+            "RETURNING seq",
+            (entry["conversation_id"], message["role"], message["content"], entry["created_at"],
+             message.get("truncated", False), entry["conversation_id"])
+        ).fetchone()[0]
+
+    def flush(self):
+        """Block until every queued message is written"""
+        self._queue.join()
+
+    def _rows(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        messages = []
+        for seq, role, content, truncated in rows:
+            message = {"role": role, "content": content, "seq": seq}
+            if truncated:
+                message["truncated"] = True
+            messages.append(message)
+        return messages
+
+    def recent(self, conversation_id: str, limit: int) -> List[Dict[str, Any]]:
+        """The newest messages, oldest first, e.g. to restore a session after a refresh"""
+        self.flush()
+        rows = self._rows(
+            "SELECT seq, role, content, truncated FROM messages WHERE conversation_id = ? ORDER BY seq DESC LIMIT ?",
+            (conversation_id, limit)
+        )
+        return rows[::-1]
+
+    def page(self, conversation_id: str, before_seq: int, limit: int) -> List[Dict[str, Any]]:
+        """Up to limit messages that precede before_seq, oldest first"""
+        rows = self._rows(
+            "SELECT seq, role, content, truncated FROM messages WHERE conversation_id = ? AND seq < ? "
+            "ORDER BY seq DESC LIMIT ?",
+            (conversation_id, before_seq, limit)
+        )
+        return rows[::-1]
+
+    def transcript(self, conversation_id: str) -> List[Dict[str, Any]]:
+        """Full transcript, oldest first"""
+        self.flush()
+        return self._rows(
+            "SELECT seq, role, content, truncated FROM messages WHERE conversation_id = ? ORDER BY seq",
+            (conversation_id,)
+        )
+
+    def save_summary(self, conversation_id: str, summary: Dict[str, Any]):
+        """Keep a summary message (see conversation.apply_compaction) as the conversation's latest"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (conversation_id, content, summarized_messages, through_seq) "
+                "VALUES (?, ?, ?, ?)",
+                (conversation_id, summary["content"], summary["summarized_messages"], summary["through_seq"])
+            )
+            self._db.commit()
+
+    def summary(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """The latest summary message of the conversation, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content, summarized_messages, through_seq FROM summaries WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"role": "summary", "content": row[0], "summarized_messages": row[1], "through_seq": row[2]}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"pending_writes": self._queue.qsize()}
+
+
+@st.cache_resource
+def get_conversation_store(db_path: str = CONVERSATION_DB_PATH) -> ConversationStore:
+    """Process-wide conversation store shared by every session"""
+    return ConversationStore(db_path)
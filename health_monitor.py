@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from typing import Dict, Any
+
+import requests
+import streamlit as st
+
+from ollama_client import OLLAMA_BASE_URL, OllamaClient, get_ollama_client
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_INTERVAL = 10  # seconds between background probes
+
+
+def probe_ollama(client: OllamaClient) -> tuple[bool, str]:
+    """Check if Ollama service is available (blocking network call)"""
+    try:
+        response = client.get("tags")
+        if response.status_code == 200:
+            return True, "Connected"
+        else:
+            return False, f"Service unavailable (Status: {response.status_code})"
+    except requests.exceptions.ConnectionError:
+        return False, f"Cannot connect to Ollama service. Make sure it's running on {client.base_url}"
+    except requests.exceptions.Timeout:
+        return False, "Connection timeout. Ollama service may be slow to respond"
+    except Exception as e:
+        return False, f"Unexpected error: {str(e)}"
+
+
+class HealthMonitor:
+    """
+    Probes Ollama on a background thread and publishes the latest result, so
+    reruns can read the connection status without doing any network I/O.
+    """
+
+    def __init__(self, client: OllamaClient, interval: float = HEALTH_CHECK_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._is_connected = False
+        self._message = "Checking Ollama service..."
+        self._checked_at = None
+        self._thread = None
+
+    def start(self):
+        """Run one probe synchronously, then keep probing in the background"""
+        if self._thread is not None:
+            return
+        self.check_now()
+        self._thread = threading.Thread(target=self._run, name="ollama-health-monitor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.check_now()
+            except Exception as e:
+                logger.error(f"Health monitor probe failed: {e}")
+
+    def check_now(self):
+        """Probe Ollama and publish the result, logging only state changes"""
+        is_connected, message = probe_ollama(self.client)
+        with self._lock:
+            changed = (is_connected, message) != (self._is_connected, self._message)
+            self._is_connected = is_connected
+            self._message = message
+            self._checked_at = time.time()
+        if changed:
+            if is_connected:
+                logger.info("Ollama service is available")
+            else:
+                logger.error(f"Ollama service unavailable: {message}")
+
+    def request_refresh(self):
+        """Ask the background thread to probe again without waiting for the interval"""
+        self._wake.set()
+
+    def status(self) -> Dict[str, Any]:
+        """Latest cached status with its age in seconds"""
+        with self._lock:
+            checked_at = self._checked_at
+            return {
+                "is_connected": self._is_connected,
+                "message": self._message,
+                "checked_at": checked_at,
+                "age": time.time() - checked_at if checked_at is not None else None
+            }
+
+
+@st.cache_resource
+def get_health_monitor(base_url: str = OLLAMA_BASE_URL, interval: float = HEALTH_CHECK_INTERVAL) -> HealthMonitor:
+    """Process-wide health monitor, started on first use"""
+    monitor = HealthMonitor(get_ollama_client(base_url), interval)
+    monitor.start()
+    return monitor
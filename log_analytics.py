@@ -0,0 +1,326 @@
+"""
+Streaming analytics over gym_chatbot.log in constant memory.
+
+    python log_analytics.py gym_chatbot.log
+    python log_analytics.py gym_chatbot.log --model mistral --since 2025-08-24 --until 2025-08-31
+    python log_analytics.py gym_chatbot.log --state log_analytics_state.json   # incremental
+    python log_analytics.py gym_chatbot.log.1 gym_chatbot.log --json
+
+Reads "<asctime> - <LEVEL> - <message>" lines, including the JSON payloads of
+"User Interaction:" lines. Latencies go into fixed log-spaced histograms and
+sessions into a HyperLogLog sketch, so memory does not grow with the file.
+With --state, the byte offset reached in each file and the aggregates so far
+are saved, and the next run only reads what was appended since. Offsets
+belong to a file's identity rather than its path, so after rotation
+gym_chatbot.log.1 resumes where gym_chatbot.log stopped and the new
+gym_chatbot.log is read from the start.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from metrics import Histogram
+
+LINE_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),\d{3} - ([A-Z]+) - (.*)$")
+INTERACTION_PREFIX = "User Interaction: "
+QUERY_FAILED_PATTERN = re.compile(r"^Ollama query failed: (\w+) - ")
+SESSION_START_MESSAGES = ("Initialized new chat session", "Restored chat session")
+# 1 ms to ~25 min in 10% steps, so percentiles are within ~5%
+ANALYTICS_BUCKETS = [0.001 * 1.1 ** i for i in range(150)]
+SKETCH_PRECISION = 12  # 4096 HyperLogLog registers, ~1.6% error on distinct sessions
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class DistinctCounter:
+    """HyperLogLog estimate of how many distinct values were added"""
+
+    def __init__(self, precision: int = SKETCH_PRECISION, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.registers = bytearray(registers or bytes(1 << precision))
+
+    def add(self, value: str):
+        digest = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        index = digest >> (64 - self.precision)
+        rest = (digest << self.precision) & ((1 << 64) - 1)
+        rank = 64 - self.precision + 1 if rest == 0 else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        raw = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0 ** -r for r in self.registers)
+        empty = self.registers.count(0)
+        if raw <= 2.5 * m and empty:
+            return round(m * math.log(m / empty))  # linear counting for small sets
+        return round(raw)
+
+
+class LogStats:
+    """Aggregates of one or more log files; serializable for incremental runs"""
+
+    def __init__(self, model: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None):
+        self.model = model
+        self.since = since
+        self.until = until
+        self.lines = 0
+        self.matched = 0
+        self.first_time: Optional[str] = None
+        self.last_time: Optional[str] = None
+        self.levels: Dict[str, int] = {}
+        self.actions: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.requests_per_day: Dict[str, int] = {}
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self.session_starts = 0
+        self.sessions = DistinctCounter()
+
+    def _model(self, name: str) -> Dict[str, Any]:
+        if name not in self.models:
+            self.models[name] = {
+                "requests": 0, "responses": 0, "retried": 0, "cache_hits": 0, "coalesced": 0,
+                "response_chars": 0, "latency": Histogram(ANALYTICS_BUCKETS)
+            }
+        return self.models[name]
+
+    def add_line(self, line: str):
+        self.lines += 1
+        match = LINE_PATTERN.match(line)
+        if not match:
+            return  # traceback and other continuation lines
+        timestamp, level, message = match.groups()
+        if (self.since and timestamp < self.since) or (self.until and timestamp >= self.until):
+            return
+        self.matched += 1
+        self.first_time = min(self.first_time or timestamp, timestamp)
+        self.last_time = max(self.last_time or timestamp, timestamp)
+        self.levels[level] = self.levels.get(level, 0) + 1
+
+        if message.startswith(INTERACTION_PREFIX):
+            try:
+                entry = json.loads(message[len(INTERACTION_PREFIX):])
+            except ValueError:
+                return
+            self._add_interaction(timestamp, entry.get("action", "unknown"), entry.get("details") or {})
+        elif message.startswith(SESSION_START_MESSAGES):
+            self.session_starts += 1
+        elif not self.model:
+            failed = QUERY_FAILED_PATTERN.match(message)
+            if failed:
+                self.errors[failed.group(1)] = self.errors.get(failed.group(1), 0) + 1
+
+    def _add_interaction(self, timestamp: str, action: str, details: Dict[str, Any]):
+        model_name = details.get("model") or "unknown"
+        if self.model and model_name != self.model:
+            return
+        self.actions[action] = self.actions.get(action, 0) + 1
+        if action == "ollama_request":
+            self._model(model_name)["requests"] += 1
+            day = timestamp[:10]
+            self.requests_per_day[day] = self.requests_per_day.get(day, 0) + 1
+            if details.get("session_id"):
+                self.sessions.add(details["session_id"])
+        elif action == "ollama_response":
+            stats = self._model(model_name)
+            stats["responses"] += 1
+            stats["response_chars"] += details.get("response_length", 0)
+            if details.get("attempt", 1) > 1:
+                stats["retried"] += 1
+            if details.get("response_time") is not None:
+                stats["latency"].observe(details["response_time"])
+        elif action in ("ollama_cache_hit", "ollama_semantic_cache_hit"):
+            self._model(model_name)["cache_hits"] += 1
+        elif action == "ollama_coalesced":
+            self._model(model_name)["coalesced"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        models = {}
+        for name, stats in self.models.items():
+            latency = stats["latency"]
+            models[name] = {**stats, "latency": {"counts": latency.counts, "sum": latency.sum, "count": latency.count}}
+        return {
+            "filters": {"model": self.model, "since": self.since, "until": self.until},
+            "lines": self.lines, "matched": self.matched,
+            "first_time": self.first_time, "last_time": self.last_time,
+            "levels": self.levels, "actions": self.actions, "errors": self.errors,
+            "requests_per_day": self.requests_per_day, "models": models,
+            "session_starts": self.session_starts,
+            "sessions": base64.b64encode(bytes(self.sessions.registers)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogStats":
+        stats = cls(**data["filters"])
+        for key in ("lines", "matched", "first_time", "last_time", "levels", "actions", "errors",
+                    "requests_per_day", "session_starts"):
+            setattr(stats, key, data[key])
+        stats.sessions = DistinctCounter(registers=base64.b64decode(data["sessions"]))
+        for name, saved in data["models"].items():
+            model_stats = stats._model(name)
+            model_stats.update({key: value for key, value in saved.items() if key != "latency"})
+            latency = model_stats["latency"]
+            latency.counts, latency.sum, latency.count = (
+                saved["latency"]["counts"], saved["latency"]["sum"], saved["latency"]["count"]
+            )
+        return stats
+
+    def summary(self) -> Dict[str, Any]:
+        hours = None
+        if self.first_time and self.last_time:
+            elapsed = datetime.strptime(self.last_time, TIME_FORMAT) - datetime.strptime(self.first_time, TIME_FORMAT)
+            hours = max(elapsed.total_seconds() / 3600, 1 / 60)
+        total_requests = sum(stats["requests"] for stats in self.models.values())
+
+        def seconds(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(value, 3)
+
+        models = {}
+        for name, stats in sorted(self.models.items(), key=lambda item: str(item[0])):
+            latency = stats["latency"]
+            models[str(name)] = {
+                "requests": stats["requests"],
+                "responses": stats["responses"],
+                "retried": stats["retried"],
+                "cache_hits": stats["cache_hits"],
+                "coalesced": stats["coalesced"],
+                "requests_per_hour": round(stats["requests"] / hours, 2) if hours else None,
+                "mean_response_chars": round(stats["response_chars"] / stats["responses"]) if stats["responses"] else None,
+                "latency_p50_s": seconds(latency.percentile(0.5)),
+                "latency_p95_s": seconds(latency.percentile(0.95)),
+                "latency_p99_s": seconds(latency.percentile(0.99)),
+                "latency_mean_s": seconds(latency.sum / latency.count) if latency.count else None,
+            }
+        return {
+            "filters": {"model": self.model, "since": self.since, "until": self.until},
+            "lines": self.lines,
+            "matched_lines": self.matched,
+            "first_time": self.first_time,
+            "last_time": self.last_time,
+            "requests": total_requests,
+            "requests_per_hour": round(total_requests / hours, 2) if hours else None,
+            "sessions_started": self.session_starts,
+            "distinct_sessions": self.sessions.estimate(),
+            "levels": self.levels,
+            "errors": dict(sorted(self.errors.items(), key=lambda item: -item[1])),
+            "actions": dict(sorted(self.actions.items(), key=lambda item: -item[1])),
+            "models": models,
+            "requests_per_day": dict(sorted(self.requests_per_day.items())),
+        }
+
+
+def file_identity(path: str) -> str:
+    """Inode plus a hash of the first line, which stay the same when the file is renamed by rotation"""
+    with open(path, "rb") as f:
+        head = f.readline(4096)
+    return f"{os.stat(path).st_ino}:{hashlib.sha256(head).hexdigest()}"
+
+
+def scan(path: str, stats: LogStats, offset: int = 0) -> int:
+    """Feed complete lines from offset onwards into stats; returns the offset reached"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break  # partial last line, still being written
+            stats.add_line(raw.decode("utf-8", errors="replace").rstrip("\r\n"))
+            offset += len(raw)
+    return offset
+
+
+def print_report(summary: Dict[str, Any]):
+    filters = ", ".join(f"{key}={value}" for key, value in summary["filters"].items() if value)
+    print(f"Lines: {summary['lines']} ({summary['matched_lines']} in range{'; ' + filters if filters else ''})")
+    print(f"Period: {summary['first_time']} .. {summary['last_time']}")
+    print(f"Requests: {summary['requests']} ({summary['requests_per_hour']}/hour)")
+    print(f"Sessions: {summary['sessions_started']} started, ~{summary['distinct_sessions']} distinct with requests")
+    print(f"Levels: {', '.join(f'{level} {count}' for level, count in sorted(summary['levels'].items()))}")
+
+    if summary["models"]:
+        print(f"\n{'model':<20} {'requests':>8} {'answers':>8} {'retried':>7} {'cached':>6}"
+              f" {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'req/h':>8}")
+        for name, row in summary["models"].items():
+            def cell(value):
+                return "-" if value is None else value
+            print(f"{name:<20} {row['requests']:>8} {row['responses']:>8} {row['retried']:>7} {row['cache_hits']:>6}"
+                  f" {cell(row['latency_p50_s']):>8} {cell(row['latency_p95_s']):>8}"
+                  f" {cell(row['latency_p99_s']):>8} {cell(row['requests_per_hour']):>8}")
+
+    if summary["errors"]:
+        print("\nErrors by type:")
+        for error_type, count in summary["errors"].items():
+            print(f"  {error_type:<24} {count}")
+
+    if summary["requests_per_day"]:
+        print("\nRequests per day:")
+        for day, count in summary["requests_per_day"].items():
+            print(f"  {day}  {count}")
+
+
+def parse_bound(value: Optional[str]) -> Optional[str]:
+    """Accept YYYY-MM-DD or YYYY-MM-DD HH:MM[:SS]; returned in the log's sortable format"""
+    if not value:
+        return None
+    for fmt in ("%Y-%m-%d", "%Y-%m-%d %H:%M", TIME_FORMAT, "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return datetime.strptime(value, fmt).strftime(TIME_FORMAT)
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f"invalid date '{value}'")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Latency, error and session statistics from gym_chatbot.log")
+    parser.add_argument("paths", nargs="*", default=["gym_chatbot.log"], help="log files, oldest first")
+    parser.add_argument("--model", help="only this model")
+    parser.add_argument("--since", type=parse_bound, help="start, inclusive (YYYY-MM-DD[ HH:MM[:SS]])")
+    parser.add_argument("--until", type=parse_bound, help="end, exclusive")
+    parser.add_argument("--state", help="state file for incremental runs")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    filters = {"model": args.model, "since": args.since, "until": args.until}
+    stats = LogStats(**filters)
+    offsets: Dict[str, Dict[str, Any]] = {}
+    if args.state and os.path.exists(args.state):
+        with open(args.state, encoding="utf-8") as f:
+            state = json.load(f)
+        if state["stats"]["filters"] != filters:
+            parser.error(f"{args.state} was built with filters {state['stats']['filters']}; use another state file")
+        stats = LogStats.from_dict(state["stats"])
+        offsets = state["files"]
+
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"Skipping missing file {path}", file=sys.stderr)
+            continue
+        identity = file_identity(path)
+        saved = offsets.get(identity)
+        offset = 0
+        if saved and saved["offset"] <= os.path.getsize(path):
+            offset = saved["offset"]
+        elif saved or any(entry["path"] == os.path.abspath(path) for entry in offsets.values()):
+            print(f"{path} was rotated or truncated; reading it from the start", file=sys.stderr)
+        offset = scan(path, stats, offset)
+        offsets[identity] = {"path": os.path.abspath(path), "offset": offset}
+
+    if args.state:
+        temporary = f"{args.state}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"files": offsets, "stats": stats.to_dict()}, f)
+        os.replace(temporary, args.state)
+
+    summary = stats.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+LOG_FILE = "gym_chatbot.log"
+EVENT_LOG_FILE = "gym_chatbot_events.jsonl"  # one structured JSON event per line
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+LOG_QUEUE_SIZE = 10000  # records buffered for the writer thread; extra records are dropped
+LOG_MAX_BYTES = 50 * 1024 * 1024  # size-based rotation
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_WHEN = None  # e.g. "midnight" for time-based rotation instead of size-based
+# Fraction of records kept for high-volume messages, matched on message prefix
+LOG_SAMPLE_RATES = {
+    "Ollama service is available": 0.1,
+    "Ollama request attempt": 0.1,
+    "Ollama response status": 0.1,
+}
+
+
+class LazyJson:
+    """Defers json.dumps to the writer thread when used as a logging argument"""
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+
+    def __str__(self) -> str:
+        return json.dumps(self.payload)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of records whose message starts with a sampled prefix"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not isinstance(record.msg, str):
+            return True
+        for prefix, rate in self.rates.items():
+            if record.msg.startswith(prefix):
+                return random.random() < rate
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records without blocking; when the buffer is full they are counted and dropped"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the writer thread, not on the request path
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class FlushingQueueListener(logging.handlers.QueueListener):
+    """Waits for room in the buffer when stopping, so queued records are written before exit"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Structured record per line; an 'event' dict passed via extra replaces the message"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName
+        }
+        event = getattr(record, "event", None)
+        if event:
+            entry.update(event)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def file_handler(path: str) -> logging.Handler:
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT)
+    return logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+
+
+class LogPipeline:
+    """Root logger -> bounded queue -> background listener writing text and JSONL logs"""
+
+    def __init__(self, level: int = logging.INFO):
+        text_formatter = logging.Formatter(LOG_FORMAT)
+        text_file = file_handler(LOG_FILE)
+        text_file.setFormatter(text_formatter)
+        console = logging.StreamHandler()
+        console.setFormatter(text_formatter)
+        events = file_handler(EVENT_LOG_FILE)
+        events.setFormatter(JsonLinesFormatter())
+
+        self.queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        self.queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+        self.listener = FlushingQueueListener(
+            self.queue_handler.queue, text_file, console, events, respect_handler_level=True
+        )
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Flush buffered records and stop the writer thread"""
+        try:
+            self.listener.stop()
+        except queue.Full:
+            pass
+
+    @property
+    def dropped(self) -> int:
+        return self.queue_handler.dropped
+
+    def backlog(self) -> int:
+        return self.queue_handler.queue.qsize()
+
+
+_pipeline: Optional[LogPipeline] = None
+
+
+def setup_logging(level: int = logging.INFO) -> LogPipeline:
+    """Install the pipeline once per process; later calls (e.g. reruns) return the same one"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = LogPipeline(level)
+    return _pipeline
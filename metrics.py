@@ -0,0 +1,196 @@
+import bisect
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List, Tuple
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = 9464  # Prometheus text endpoint at http://<host>:9464/metrics; None disables it
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")  # e.g. 0.0.0.0 for a Prometheus on another machine
+LATENCY_BUCKETS = [0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120]  # seconds
+RATE_BUCKETS = [1, 2, 5, 10, 20, 30, 50, 75, 100, 200, 500, 1000]  # tokens per second
+
+# name -> (help text, buckets)
+HISTOGRAMS = {
+    "ollama_queue_wait_seconds": ("Time spent waiting for a generation slot", LATENCY_BUCKETS),
+    "ollama_time_to_first_token_seconds": ("Time from request to first streamed token", LATENCY_BUCKETS),
+    "ollama_request_duration_seconds": ("End-to-end generation latency", LATENCY_BUCKETS),
+    "ollama_prompt_eval_tokens_per_second": ("Prompt processing (prefill) speed", RATE_BUCKETS),
+    "ollama_eval_tokens_per_second": ("Generation speed", RATE_BUCKETS),
+    "ollama_model_load_seconds": ("Time Ollama spent loading the model", LATENCY_BUCKETS),
+}
+COUNTERS = {
+    "ollama_requests_total": "Generation requests by model",
+    "ollama_errors_total": "Failed requests by error_type",
+    "ollama_cache_hits_total": "Requests answered from a cache or a coalesced request",
+    "ollama_cancelled_total": "Generations stopped by the user before they finished",
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a sum and count, like Prometheus"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estimate by linear interpolation within the bucket holding the q-th observation"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Thread-safe, in-process histograms per model plus labelled counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, name: str, model_name: str, value: float):
+        with self._lock:
+            key = (name, model_name)
+            if key not in self._histograms:
+                self._histograms[key] = Histogram(HISTOGRAMS[name][1])
+            self._histograms[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def record_ollama_stats(self, model_name: str, response_data: Dict[str, Any]):
+        """Observe the timing fields Ollama returns in its final response"""
+        prompt_tokens = response_data.get("prompt_eval_count")
+        prompt_ns = response_data.get("prompt_eval_duration")
+        if prompt_tokens and prompt_ns:
+            self.observe("ollama_prompt_eval_tokens_per_second", model_name, prompt_tokens / (prompt_ns / 1e9))
+        eval_tokens = response_data.get("eval_count")
+        eval_ns = response_data.get("eval_duration")
+        if eval_tokens and eval_ns:
+            self.observe("ollama_eval_tokens_per_second", model_name, eval_tokens / (eval_ns / 1e9))
+        load_ns = response_data.get("load_duration")
+        if load_ns:
+            self.observe("ollama_model_load_seconds", model_name, load_ns / 1e9)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-model rows for the sidebar dashboard"""
+        with self._lock:
+            histograms = dict(self._histograms)
+        rows: Dict[str, Dict[str, Any]] = {}
+
+        def fmt(value: Optional[float], digits: int = 2) -> str:
+            return "-" if value is None else f"{value:.{digits}f}"
+
+        for (name, model_name), histogram in histograms.items():
+            row = rows.setdefault(model_name, {"model": model_name})
+            if name == "ollama_request_duration_seconds":
+                row["requests"] = histogram.count
+                row["p50 s"] = fmt(histogram.percentile(0.5))
+                row["p95 s"] = fmt(histogram.percentile(0.95))
+            elif name == "ollama_time_to_first_token_seconds":
+                row["TTFT p50 s"] = fmt(histogram.percentile(0.5))
+            elif name == "ollama_queue_wait_seconds":
+                row["queue p95 s"] = fmt(histogram.percentile(0.95))
+            elif name == "ollama_eval_tokens_per_second":
+                row["tok/s"] = fmt(histogram.sum / histogram.count, 1)
+            elif name == "ollama_model_load_seconds":
+                row["load p50 s"] = fmt(histogram.percentile(0.5))
+        return sorted(rows.values(), key=lambda row: row["model"])
+
+    def counters(self, name: str) -> Dict[str, float]:
+        """Counter values for one metric, keyed by their label values"""
+        with self._lock:
+            return {
+                ",".join(value for _, value in labels): count
+                for (counter, labels), count in self._counters.items() if counter == name
+            }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name, (help_text, _) in HISTOGRAMS.items():
+            series = [(model_name, data) for (metric, model_name), data in histograms.items() if metric == name]
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for model_name, (buckets, counts, total, count) in series:
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{model="{model_name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{model="{model_name}"}} {total}')
+                lines.append(f'{name}_count{{model="{model_name}"}} {count}')
+        for name, help_text in COUNTERS.items():
+            series = [(labels, value) for (metric, labels), value in counters.items() if metric == name]
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(registry: MetricsRegistry, port: int,
+                         host: str = METRICS_HOST) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on {host}:{port}")
+    return server
+
+
+@st.cache_resource
+def get_metrics(port: Optional[int] = METRICS_PORT) -> MetricsRegistry:
+    """Process-wide metrics registry, with its /metrics endpoint started on first use"""
+    registry = MetricsRegistry()
+    if port:
+        start_metrics_server(registry, port)
+    return registry
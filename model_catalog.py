@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+
+import requests
+import streamlit as st
+
+from ollama_client import OLLAMA_BACKENDS, OllamaClient, get_ollama_client
+from health_monitor import HEALTH_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL = 300  # seconds before installed models are re-fetched
+FALLBACK_MODELS = ["llama2", "mistral", "codellama"]  # offered when Ollama can't be reached
+DEFAULT_NUM_CTX = 2048  # Ollama's runtime context unless the Modelfile sets num_ctx
+MISS_REFRESH_INTERVAL = 10  # seconds; an unknown model triggers at most one refetch this often
+FAILED_FETCH_BACKOFF = HEALTH_CHECK_INTERVAL  # seconds after a fetch no backend answered before the next one
+
+
+def display_name(name: str) -> str:
+    """Ollama resolves bare names to ':latest', so drop that tag for display and requests"""
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+def parse_num_ctx(parameters: str) -> Optional[int]:
+    """num_ctx from the Modelfile parameter block returned by /api/show"""
+    for line in (parameters or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == "num_ctx":
+            try:
+                return int(parts[1])
+            except ValueError:
+                return None
+    return None
+
+
+class ModelCatalog:
+    """
+    Installed models and their metadata from /api/tags and /api/show, merged
+    over every backend; each entry lists the backends that have the model.
+    Loaded once, then refreshed in the background whenever it is older than
+    CATALOG_TTL, so reruns never wait on Ollama for it. Only one fetch runs at
+    a time, and none for FAILED_FETCH_BACKOFF after one that no backend answered.
+    """
+
+    def __init__(self, clients: List[OllamaClient], ttl: float = CATALOG_TTL):
+        self.clients = list(clients)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}
+        self._fetched_at: Optional[float] = None
+        self._fetch_done = threading.Condition(self._lock)
+        self._refreshing = False
+        self._failed_at = 0.0
+        self._miss_refreshed_at = 0.0
+
+    def refresh(self):
+        """
+        Fetch the catalogue from every backend now (blocking); kept as it was
+        when none answers. If a fetch is already running, waits for that one.
+        """
+        with self._lock:
+            if self._refreshing:
+                self._fetch_done.wait_for(lambda: not self._refreshing)
+                return
+            self._refreshing = True
+        self._fetch()
+
+    def _backing_off(self) -> bool:
+        """A recent fetch reached no backend (caller holds the lock)"""
+        return time.time() - self._failed_at < FAILED_FETCH_BACKOFF
+
+    def _fetch(self):
+        """Run one fetch; the caller has set _refreshing"""
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.clients)) as executor:
+                listings = list(executor.map(self._list, self.clients))
+            if all(listing is None for listing in listings):
+                with self._lock:
+                    self._failed_at = time.time()
+                return
+            models = {}
+            for client, listing in zip(self.clients, listings):
+                for entry in listing or []:
+                    name = display_name(entry.get("name", ""))
+                    if not name:
+                        continue
+                    if name not in models:
+                        models[name] = self._describe(client, name, entry)
+                    models[name]["backends"].append(client.base_url)
+            with self._lock:
+                self._models = models
+                self._fetched_at = time.time()
+            logger.info(f"Model catalogue refreshed: {', '.join(models) or 'no models installed'}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+                self._fetch_done.notify_all()
+
+    def _list(self, client: OllamaClient) -> Optional[List[Dict[str, Any]]]:
+        """/api/tags entries of one backend, or None when it can't be reached"""
+        try:
+            response = client.get("tags")
+            if response.status_code != 200:
+                logger.warning(f"Model catalogue refresh from {client.base_url} returned status {response.status_code}")
+                return None
+            return response.json().get("models", [])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Model catalogue refresh from {client.base_url} failed: {e}")
+            return None
+
+    def _describe(self, client: OllamaClient, name: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        details = entry.get("details") or {}
+        info = {
+            "name": name,
+            "size": entry.get("size", 0),
+            "parameter_size": details.get("parameter_size"),
+            "quantization": details.get("quantization_level"),
+            "context_length": None,
+            "num_ctx": DEFAULT_NUM_CTX,
+            "backends": []
+        }
+        try:
+            response = client.post("show", {"model": name})
+            if response.status_code == 200:
+                show = response.json()
+                model_info = show.get("model_info") or {}
+                for key, value in model_info.items():
+                    if key.endswith(".context_length"):
+                        info["context_length"] = value
+                        break
+                info["num_ctx"] = parse_num_ctx(show.get("parameters")) or DEFAULT_NUM_CTX
+                if info["context_length"]:
+                    info["num_ctx"] = min(info["num_ctx"], info["context_length"])
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning(f"Could not fetch metadata for '{name}': {e}")
+        return info
+
+    def _refresh_if_stale(self):
+        with self._lock:
+            fresh = self._fetched_at is not None and time.time() - self._fetched_at < self.ttl
+            if fresh or self._refreshing or self._backing_off():
+                return
+            self._refreshing = True
+        threading.Thread(target=self._fetch, name="model-catalog-refresh", daemon=True).start()
+
+    def is_loaded(self) -> bool:
+        with self._lock:
+            return self._fetched_at is not None
+
+    def models(self) -> Dict[str, Dict[str, Any]]:
+        """Installed models by name (cached; stale data triggers a background refresh)"""
+        self._refresh_if_stale()
+        with self._lock:
+            return dict(self._models)
+
+    def names(self) -> List[str]:
+        """Installed model names, or FALLBACK_MODELS before the first successful fetch"""
+        if not self.is_loaded():
+            self._refresh_if_stale()
+            return list(FALLBACK_MODELS)
+        return sorted(self.models())
+
+    def get(self, model_name: str) -> Optional[Dict[str, Any]]:
+        return self.models().get(display_name(model_name))
+
+    def is_installed(self, model_name: str) -> bool:
+        """
+        True when the catalogue lists the model, or hasn't loaded yet and can't
+        tell. A model it doesn't list may have just been pulled, so the
+        catalogue is refetched once (at most every MISS_REFRESH_INTERVAL, and
+        not while backing off from a failed fetch) before the answer is no.
+        """
+        if not self.is_loaded() or self.get(model_name) is not None:
+            return True
+        with self._lock:
+            refetch = time.time() - self._miss_refreshed_at >= MISS_REFRESH_INTERVAL and not self._backing_off()
+            if refetch:
+                self._miss_refreshed_at = time.time()
+        if refetch:
+            logger.info(f"Model '{model_name}' not in the catalogue; refetching it")
+            self.refresh()
+        return self.get(model_name) is not None
+
+    def context_budget(self, model_name: str, default: int) -> int:
+        """Tokens of conversation to carry: half the model's context, leaving room for the answer"""
+        info = self.get(model_name)
+        if not info:
+            return default
+        return info["num_ctx"] // 2
+
+
+@st.cache_resource
+def get_model_catalog() -> ModelCatalog:
+    """Process-wide model catalogue over OLLAMA_BACKENDS, loaded once on first use"""
+    catalog = ModelCatalog([get_ollama_client(url) for url in OLLAMA_BACKENDS])
+    catalog.refresh()
+    return catalog
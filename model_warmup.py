@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from collections import deque, Counter
+from typing import Dict, Any, List, Deque, Tuple
+
+import requests
+import streamlit as st
+
+from ollama_client import OllamaClient, get_ollama_client
+from backend_pool import BackendPool, get_backend_pool
+
+logger = logging.getLogger(__name__)
+
+KEEP_ALIVE = "10m"  # how long Ollama keeps a model loaded after a request
+PINNED_KEEP_ALIVE = "2h"  # used for the most requested models
+PINNED_MODEL_COUNT = 1  # how many of the busiest models stay pinned
+TRAFFIC_WINDOW = 3600  # seconds of request history used to rank models
+WARMUP_TIMEOUT = 120  # seconds; loading a large model from disk is slow
+WARMUP_COOLDOWN = 60  # seconds before the same model is warmed again
+PIN_REFRESH_INTERVAL = 300  # seconds between keep-alive refreshes of pinned models
+
+
+class ModelWarmer:
+    """
+    Preloads models in the background and decides each request's keep_alive.
+    A model is loaded on the backend the pool would route it to, or refreshed
+    where it is already loaded; a backend busy with other requests is left
+    alone, since loading there would evict a model they are using. The busiest
+    models of the last TRAFFIC_WINDOW get a longer keep_alive and are
+    periodically refreshed, so they stay resident through quiet periods.
+    """
+
+    def __init__(self, pool: BackendPool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._uses: Deque[Tuple[float, str]] = deque()
+        self._warming: set = set()  # (backend URL, model)
+        self._last_warmed: Dict[Tuple[str, str], float] = {}
+        self._refresher = None
+
+    def start(self):
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._refresh_pins, name="model-pin-refresher", daemon=True)
+        self._refresher.start()
+
+    def record_use(self, model_name: str):
+        now = time.time()
+        with self._lock:
+            self._uses.append((now, model_name))
+            self._trim(now)
+
+    def _trim(self, now: float):
+        while self._uses and now - self._uses[0][0] > TRAFFIC_WINDOW:
+            self._uses.popleft()
+
+    def pinned_models(self) -> List[str]:
+        """Most requested models within the traffic window"""
+        with self._lock:
+            self._trim(time.time())
+            counts = Counter(model_name for _, model_name in self._uses)
+        return [model_name for model_name, _ in counts.most_common(PINNED_MODEL_COUNT)]
+
+    def keep_alive_for(self, model_name: str) -> str:
+        return PINNED_KEEP_ALIVE if model_name in self.pinned_models() else KEEP_ALIVE
+
+    def targets(self, model_name: str) -> List[str]:
+        """Backends that already have the model loaded, else the one the pool would pick if it is idle"""
+        loaded = [url for url in self.pool.urls if self.pool.has_loaded(url, model_name)]
+        if loaded:
+            return loaded
+        preferred = self.pool.preferred(model_name)
+        return [preferred] if self.pool.is_idle(preferred) else []
+
+    def warm_up(self, model_name: str):
+        """Load a model in the background on its target backends, unless it was warmed there recently"""
+        for url in self.targets(model_name):
+            client = get_ollama_client(url)
+            key = (client.base_url, model_name)
+            with self._lock:
+                recently = time.time() - self._last_warmed.get(key, 0) < WARMUP_COOLDOWN
+                if key in self._warming or recently:
+                    continue
+                self._warming.add(key)
+            threading.Thread(
+                target=self._load, args=(client, model_name), name=f"warmup-{model_name}", daemon=True
+            ).start()
+
+    def _load(self, client: OllamaClient, model_name: str):
+        started = time.time()
+        try:
+            # A generate request without a prompt only loads the model
+            response = client.post(
+                "generate",
+                {"model": model_name, "keep_alive": self.keep_alive_for(model_name)},
+                timeout=WARMUP_TIMEOUT
+            )
+            if response.status_code == 200:
+                logger.info(f"Model '{model_name}' warmed up on {client.base_url} in {time.time() - started:.2f}s")
+            elif response.status_code == 404:
+                logger.debug(f"Model '{model_name}' is not installed on {client.base_url}; not warming it there")
+            else:
+                logger.warning(f"Warm-up of '{model_name}' on {client.base_url} returned status {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Warm-up of '{model_name}' on {client.base_url} failed: {e}")
+        finally:
+            with self._lock:
+                self._warming.discard((client.base_url, model_name))
+                self._last_warmed[(client.base_url, model_name)] = time.time()
+
+    def _refresh_pins(self):
+        while True:
+            time.sleep(PIN_REFRESH_INTERVAL)
+            for model_name in self.pinned_models():
+                self.warm_up(model_name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            warming = sorted({model_name for _, model_name in self._warming})
+        return {"pinned": self.pinned_models(), "warming": warming}
+
+
+@st.cache_resource
+def get_model_warmer() -> ModelWarmer:
+    """Process-wide model warmer over the backend pool, shared by every session"""
+    warmer = ModelWarmer(get_backend_pool())
+    warmer.start()
+    return warmer
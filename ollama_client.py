@@ -0,0 +1,74 @@
+import logging
+import os
+from typing import Optional, Dict, Any, Union, Tuple
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Add default constants
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")  # env override, e.g. a stub server
+# Comma-separated URLs that generations are spread across and whose models form
+# the catalogue; embeddings stay on OLLAMA_BASE_URL, so it should be one of them
+OLLAMA_BACKENDS = [url.strip() for url in os.environ.get("OLLAMA_BACKENDS", OLLAMA_BASE_URL).split(",") if url.strip()]
+POOL_SIZE = 10  # keep-alive connections held open to Ollama
+DEFAULT_TIMEOUT = 30  # seconds, for endpoints without an explicit entry below
+ENDPOINT_TIMEOUTS = {
+    "tags": 5,
+    "ps": 5,
+    "show": 10,
+    "generate": 30,
+    "chat": 30,
+    "embeddings": 10,
+}
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class OllamaClient:
+    """
+    Thread-safe Ollama HTTP client backed by a keep-alive connection pool.
+    One instance is shared by every Streamlit session in the process.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, pool_size: int = POOL_SIZE,
+                 timeouts: Optional[Dict[str, Timeout]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeouts = {**ENDPOINT_TIMEOUTS, **(timeouts or {})}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        logger.info(f"Created Ollama client for {self.base_url} (pool size {pool_size})")
+
+    def url(self, endpoint: str) -> str:
+        """Full URL of an /api endpoint"""
+        return f"{self.base_url}/api/{endpoint}"
+
+    def timeout_for(self, endpoint: str) -> Timeout:
+        """Configured timeout for an endpoint"""
+        return self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+
+    def get(self, endpoint: str, **kwargs: Any) -> requests.Response:
+        """GET an /api endpoint through the shared pool"""
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        return self.session.get(self.url(endpoint), **kwargs)
+
+    def post(self, endpoint: str, payload: Dict[str, Any], **kwargs: Any) -> requests.Response:
+        """POST a JSON payload to an /api endpoint through the shared pool"""
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        return self.session.post(self.url(endpoint), json=payload, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+
+@st.cache_resource
+def get_ollama_client(base_url: str = OLLAMA_BASE_URL, pool_size: int = POOL_SIZE) -> OllamaClient:
+    """Process-wide Ollama client shared across sessions and reruns"""
+    return OllamaClient(base_url, pool_size)
@@ -0,0 +1,747 @@
+import functools
+import json
+import logging
+import math
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, Any, Callable, List
+
+import requests
+import streamlit as st
+
+from log_pipeline import LazyJson
+from ollama_client import OLLAMA_BASE_URL
+from backend_pool import get_backend_pool
+from adaptive_timeout import get_adaptive_timeouts
+from admission import Admission, AdmissionRejected, get_admission_control
+from circuit_breaker import get_circuit_breakers
+from response_cache import cache_key, get_response_cache
+from semantic_cache import get_semantic_cache
+from scheduler import QUEUE_TIMEOUT, GenerationCancelled, QueueTimeout, get_scheduler
+from single_flight import SharedCancel, get_single_flight
+from model_warmup import get_model_warmer
+from model_catalog import get_model_catalog
+from metrics import get_metrics
+from conversation import CONTEXT_TOKEN_BUDGET, build_window_prompt, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Request path shared by the Streamlit UIs and the benchmarks; importing it runs no UI code
+REQUEST_TIMEOUT = 30  # seconds per attempt until latencies are known for the model and prompt length, and for cold models
+SEND_DEADLINE = 90  # seconds for a whole request: queue wait, attempts and backoff
+MIN_ATTEMPT_TIME = 2  # seconds; with less left before the deadline no new attempt starts
+MAX_RETRIES = 3
+MAX_BACKOFF = 2  # seconds, cap on the jittered wait between retries
+OLLAMA_STAT_FIELDS = (  # timing fields of Ollama's final chunk, passed on in "stats"
+    "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration", "load_duration", "total_duration"
+)
+WIRE_STREAM = True  # generations are streamed from Ollama whatever the caller asked for
+GENERATION_WORKERS = 32  # threads running generations for UI sessions; the scheduler bounds what reaches Ollama
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request deadline passes while the answer is still streaming"""
+
+
+def log_user_interaction(action: str, details: Dict[str, Any] = None):
+    """Log user interactions for monitoring and debugging"""
+    try:
+        log_entry = {
+            "timestamp": datetime.now().isoformat(),
+            "action": action,
+            "details": details or {}
+        }
+        # Serialized on the logging thread; the JSONL event log gets the fields as-is
+        logger.info("User Interaction: %s", LazyJson(log_entry), extra={"event": log_entry})
+    except Exception as e:
+        logger.error(f"Failed to log user interaction: {e}")
+
+
+def check_ollama_connection() -> tuple[bool, str]:
+    """Check if any Ollama backend is available (cached by the background health monitors, no network I/O)"""
+    is_connected, message, _ = get_backend_pool().status()
+    return is_connected, message
+
+
+def validate_input(prompt: str) -> tuple[bool, str]:
+    """Validate user input"""
+    if not prompt or not prompt.strip():
+        return False, "Empty message"
+    
+    if len(prompt) > 10000:  # Reasonable limit
+        return False, "Message too long (max 10,000 characters)"
+    
+    # Check for potentially harmful content (basic filtering)
+    harmful_patterns = ['<script', '<?php', 'javascript:', 'eval(']
+    prompt_lower = prompt.lower()
+    for pattern in harmful_patterns:
+        if pattern in prompt_lower:
+            logger.warning(f"Potentially harmful input detected: {pattern}")
+            return False, "Input contains potentially harmful content"
+    
+    return True, "Valid"
+
+
+def read_ollama_stream(response: requests.Response, on_token: Optional[Callable[[str], None]],
+                       cancel: Optional[threading.Event] = None,
+                       deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Consume Ollama's NDJSON stream, passing each token to on_token (if given) as it arrives.
+    Returns the accumulated text and the final (done) chunk. Raises
+    GenerationCancelled as soon as cancel is set, and DeadlineExceeded once
+    deadline (a time.time() value) has passed.
+    """
+    parts = []
+    final_chunk = {}
+    for line in response.iter_lines():
+        if not line:
+            continue
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise ValueError(chunk["error"])
+        token = chunk.get("response", "")
+        if token:
+            parts.append(token)
+            if on_token:
+                on_token(token)
+        if cancel is not None and cancel.is_set():
+            raise GenerationCancelled("Stopped mid-answer")
+        if chunk.get("done"):
+            final_chunk = chunk
+            break
+        if deadline is not None and time.time() > deadline:
+            raise DeadlineExceeded("Request deadline passed mid-answer")
+    return {"text": "".join(parts), "final_chunk": final_chunk}
+
+
+def stream_interrupted_result(error: Exception, model_name: str, partial_text: str, timeout: float) -> Dict[str, Any]:
+    """Classify a failure that happened after part of the answer was streamed"""
+    if isinstance(error, requests.exceptions.Timeout):
+        error_type = "timeout_error"
+        error_message = f"Ollama stopped responding for {timeout:.0f} seconds mid-answer."
+    elif isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        error_type = "connection_error"
+        error_message = "Lost connection to Ollama service mid-answer."
+    elif isinstance(error, json.JSONDecodeError):
+        error_type = "json_error"
+        error_message = "Failed to parse response from Ollama service"
+    else:
+        error_type = "server_error"
+        error_message = f"Ollama aborted the answer: {error}"
+    logger.error(f"Ollama stream for '{model_name}' interrupted: {error_type} - {error}")
+    return {
+        "success": False,
+        "error_type": error_type,
+        "error_message": error_message,
+        "response": partial_text
+    }
+
+
+def cancelled_result(model_name: str, partial_text: str, session_id: str) -> Dict[str, Any]:
+    """The caller stopped the generation; whatever was streamed so far is kept"""
+    logger.info(f"Generation for '{model_name}' stopped by the user after {len(partial_text)} characters")
+    log_user_interaction("ollama_cancelled", {
+        "model": model_name,
+        "partial_length": len(partial_text),
+        "session_id": session_id
+    })
+    return {
+        "success": False,
+        "error_type": "cancelled",
+        "error_message": "Generation stopped",
+        "response": partial_text,
+        "truncated": True
+    }
+
+
+def backoff_delay(attempt: int) -> float:
+    """Capped, jittered exponential backoff so retries stay short and don't synchronize"""
+    return random.uniform(0.5, 1.0) * min(MAX_BACKOFF, 0.25 * 2 ** attempt)
+
+
+def deadline_result(model_name: str, elapsed: float) -> Dict[str, Any]:
+    """Too little of the request's deadline is left for another attempt"""
+    logger.error(f"Giving up on '{model_name}' after {elapsed:.1f}s, the request deadline leaves no time to retry")
+    return {
+        "success": False,
+        "error_type": "timeout_error",
+        "error_message": f"No answer from Ollama within {elapsed:.0f} seconds. Please try again.",
+        "response": None
+    }
+
+
+def deadline_cut_result(model_name: str, partial_text: str, elapsed: float) -> Dict[str, Any]:
+    """The deadline passed while the answer was streaming; the text so far is kept"""
+    logger.error(f"Cut off the answer from '{model_name}' at the request deadline after {elapsed:.1f}s")
+    return {
+        "success": False,
+        "error_type": "timeout_error",
+        "error_message": f"The answer took longer than {elapsed:.0f} seconds and was cut off.",
+        "response": partial_text
+    }
+
+
+def rejected_result(model_name: str, session_id: str, rejection: AdmissionRejected) -> Dict[str, Any]:
+    """Admission control turned the request away; tell the caller when to come back"""
+    retry_after = max(1, math.ceil(rejection.retry_after))
+    log_user_interaction("ollama_rejected", {
+        "model": model_name,
+        "reason": rejection.reason,
+        "retry_after": retry_after,
+        "session_id": session_id
+    })
+    if rejection.reason == "rate_limited":
+        error_message = f"You're sending messages faster than the assistant can answer. Please retry in {retry_after} s."
+    else:
+        error_message = f"The assistant is busy, retry in {retry_after} s."
+    return {
+        "success": False,
+        "error_type": rejection.reason,
+        "error_message": error_message,
+        "response": None,
+        "retry_after": retry_after
+    }
+
+
+def settle_admission(admission: Admission, result: Optional[Dict[str, Any]]):
+    """Correct the admission charge to what the request made Ollama do"""
+    result = result or {}
+    stats = result.get("stats")
+    if result.get("cached") or result.get("coalesced"):
+        used_tokens, output_tokens = 0, None
+    elif stats:
+        output_tokens = stats.get("eval_count") or 0
+        used_tokens = (stats.get("prompt_eval_count") or 0) + output_tokens
+    elif result.get("response"):
+        # Stopped or interrupted mid-answer; only the text streamed so far is known
+        output_tokens = None
+        used_tokens = admission.prompt_tokens + estimate_tokens(result["response"])
+    else:
+        used_tokens, output_tokens = 0, None
+    get_admission_control().settle(admission, used_tokens, output_tokens)
+
+
+def circuit_open_result(model_name: str, retry_after: float) -> Dict[str, Any]:
+    """Fail fast while the circuit for this backend/model is open"""
+    logger.warning(f"Circuit open for '{model_name}', failing fast (retry in {retry_after:.0f}s)")
+    return {
+        "success": False,
+        "error_type": "circuit_open",
+        "error_message": f"Ollama is recovering from repeated errors. Please retry in {retry_after:.0f} seconds.",
+        "response": None
+    }
+
+
+def generate_response(prompt: str, model_name: str, temp: float,
+                      on_token: Optional[Callable[[str], None]] = None,
+                      context: Optional[List[int]] = None,
+                      history: Optional[List[Dict[str, Any]]] = None,
+                      session_id: str = "default",
+                      on_queue: Optional[Callable[[int], None]] = None,
+                      cancel: Optional[threading.Event] = None,
+                      deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Validate, serve from cache or generate one answer; see query_ollama"""
+    stream = on_token is not None
+    streamed_parts = []
+    first_token_time = None
+
+    def track_token(token: str):
+        nonlocal first_token_time
+        if first_token_time is None:
+            first_token_time = time.time()
+        streamed_parts.append(token)
+        if stream:
+            on_token(token)
+
+    start_time = time.time()
+    if deadline is None:
+        deadline = start_time + SEND_DEADLINE
+    metrics = get_metrics()
+    
+    # Log the request
+    log_user_interaction("ollama_request", {
+        "model": model_name,
+        "temperature": temp,
+        "prompt_length": len(prompt),
+        "stream": stream,
+        "session_id": session_id
+    })
+    
+    # Validate input
+    is_valid, validation_message = validate_input(prompt)
+    if not is_valid:
+        logger.warning(f"Input validation failed: {validation_message}")
+        return {
+            "success": False,
+            "error_type": "validation_error",
+            "error_message": f"Input validation failed: {validation_message}",
+            "response": None
+        }
+    
+    # Don't send requests for models that aren't installed
+    catalog = get_model_catalog()
+    if not catalog.is_installed(model_name):
+        logger.error(f"Model '{model_name}' not found")
+        return {
+            "success": False,
+            "error_type": "model_error",
+            "error_message": f"Model '{model_name}' not found. Please check if the model is installed.",
+            "response": None
+        }
+    context_budget = catalog.context_budget(model_name, CONTEXT_TOKEN_BUDGET)
+    
+    # Earlier turns change the answer, so only stateless prompts are cached
+    is_follow_up = bool(context or history)
+    warmer = get_model_warmer()
+    # Always streamed from Ollama, even when the caller wants the whole answer:
+    # closing an abandoned response then stops the generation at its first token
+    # instead of letting Ollama finish an answer nobody will read
+    payload = {
+        "model": model_name,
+        "prompt": prompt,
+        "temperature": temp,
+        "stream": WIRE_STREAM,
+        "keep_alive": warmer.keep_alive_for(model_name)
+    }
+    if context:
+        payload["context"] = context
+    elif history:
+        payload["prompt"] = build_window_prompt(history, prompt, context_budget)
+    
+    # Serve repeated questions from the response cache
+    cache = get_response_cache()
+    use_cache = cache.is_cacheable(temp) and not is_follow_up
+    if use_cache:
+        cached_response = cache.get(model_name, temp, prompt)
+        if cached_response is not None:
+            if stream:
+                on_token(cached_response)
+            log_user_interaction("ollama_cache_hit", {
+                "model": model_name,
+                "response_time": round(time.time() - start_time, 4),
+                "response_length": len(cached_response)
+            })
+            return {
+                "success": True,
+                "response": cached_response,
+                "error_type": None,
+                "error_message": None,
+                "cached": True
+            }
+    
+    # Check Ollama connection first
+    is_connected, connection_status = check_ollama_connection()
+    if not is_connected:
+        return {
+            "success": False,
+            "error_type": "connection_error",
+            "error_message": connection_status,
+            "response": None
+        }
+    
+    # Reuse an answer to a paraphrase of this prompt when one is close enough
+    prompt_embedding = None
+    if use_cache:
+        semantic_response, prompt_embedding = get_semantic_cache(OLLAMA_BASE_URL).lookup(model_name, prompt)
+        if semantic_response is not None:
+            if stream:
+                on_token(semantic_response)
+            cache.put(model_name, temp, prompt, semantic_response)
+            log_user_interaction("ollama_semantic_cache_hit", {
+                "model": model_name,
+                "response_time": round(time.time() - start_time, 4),
+                "response_length": len(semantic_response)
+            })
+            return {
+                "success": True,
+                "response": semantic_response,
+                "error_type": None,
+                "error_message": None,
+                "cached": True
+            }
+    
+    # Wait for a generation slot from the shared scheduler
+    scheduler = get_scheduler()
+    try:
+        ticket = scheduler.acquire(
+            session_id, model_name, on_queue, timeout=min(QUEUE_TIMEOUT, max(0.0, deadline - time.time())), cancel=cancel
+        )
+    except GenerationCancelled:
+        return cancelled_result(model_name, "", session_id)
+    except QueueTimeout as e:
+        logger.error(f"Queue timeout for '{model_name}': {e}")
+        return {
+            "success": False,
+            "error_type": "timeout_error",
+            "error_message": "The assistant is busy serving other members. Please try again in a moment.",
+            "response": None
+        }
+    
+    try:
+        # Inside the try, so a failing callback still gives the slot back
+        if on_queue:
+            on_queue(0)
+        warmer.record_use(model_name)
+        metrics.observe("ollama_queue_wait_seconds", model_name, ticket.queue_wait)
+        metrics.inc("ollama_requests_total", model=model_name)
+    
+        # Retry logic, guarded by the shared circuit breakers; retries prefer a backend not tried yet.
+        # Each attempt gets a timeout learned from past latencies, cut to what is left of the deadline.
+        # With the response streamed, the read timeout bounds the wait for each chunk, so the
+        # latencies learned are the waits for the first chunk, whatever mode the caller asked for.
+        breakers = get_circuit_breakers()
+        pool = get_backend_pool()
+        timeouts = get_adaptive_timeouts()
+        prompt_length = len(payload["prompt"])
+        tried = set()
+        timed_out_after = 0.0
+        for attempt in range(MAX_RETRIES):
+            if cancel is not None and cancel.is_set():
+                return cancelled_result(model_name, "".join(streamed_parts), session_id)
+            # Only a failed attempt that streamed nothing to the caller gets here; start its text afresh
+            streamed_parts.clear()
+            first_token_time = None
+            remaining = deadline - time.time()
+            if remaining < max(MIN_ATTEMPT_TIME, timeouts.typical(model_name, prompt_length, WIRE_STREAM) or 0):
+                return deadline_result(model_name, time.time() - start_time)
+            backend = pool.acquire(model_name, exclude=tried)
+            tried.add(backend)
+            allowed, retry_after = breakers.allow_request(backend, model_name)
+            if not allowed:
+                pool.release(backend)
+                return circuit_open_result(model_name, retry_after)
+            learned_timeout = timeouts.timeout_for(model_name, prompt_length, WIRE_STREAM, REQUEST_TIMEOUT)
+            if not pool.has_loaded(backend, model_name):
+                learned_timeout = max(learned_timeout, REQUEST_TIMEOUT)  # room to load the model first
+            # A retry after a timeout gets twice as long, rather than being cut off at the same point
+            attempt_timeout = min(remaining, max(learned_timeout, min(timeouts.max_timeout, 2 * timed_out_after)))
+            attempt_start = time.time()
+            try:
+                logger.info(
+                    f"Ollama request attempt {attempt + 1}/{MAX_RETRIES} to {backend} (timeout {attempt_timeout:.1f}s)"
+                )
+            
+                backend, response = pool.post(
+                    backend,
+                    model_name,
+                    "generate",
+                    payload,
+                    cancel=cancel,
+                    timeout=attempt_timeout,
+                    stream=WIRE_STREAM
+                )
+            
+                # Log response status
+                logger.info(f"Ollama response status: {response.status_code}")
+            
+                if response.status_code == 200:
+                    breakers.record_success(backend, model_name)
+                    try:
+                        try:
+                            with response:
+                                stream_result = read_ollama_stream(response, track_token, cancel, deadline)
+                        except DeadlineExceeded:
+                            # Leaving the with-block closed the connection, so Ollama stops generating
+                            return deadline_cut_result(
+                                model_name, "".join(streamed_parts), time.time() - start_time
+                            )
+                        except (requests.exceptions.RequestException, ValueError) as e:
+                            # Tokens already reached the user, so a retry would duplicate them
+                            if not (stream and streamed_parts):
+                                raise
+                            return stream_interrupted_result(
+                                e, model_name, "".join(streamed_parts), attempt_timeout
+                            )
+                        response_text = stream_result["text"]
+                        response_data = stream_result["final_chunk"]
+                        response_time = time.time() - start_time
+                        # The wait the read timeout covered, less any time spent loading the model
+                        waited = (first_token_time or time.time()) - attempt_start
+                        timeouts.observe(
+                            model_name, prompt_length, WIRE_STREAM,
+                            max(0.0, waited - (response_data.get("load_duration") or 0) / 1e9)
+                        )
+                    
+                        # Log successful response
+                        log_user_interaction("ollama_response", {
+                            "model": model_name,
+                            "response_time": round(response_time, 2),
+                            "response_length": len(response_text),
+                            "attempt": attempt + 1,
+                            "stream": stream
+                        })
+                    
+                        logger.info(f"Ollama request successful in {response_time:.2f}s")
+                        metrics.observe("ollama_request_duration_seconds", model_name, response_time)
+                        if stream and first_token_time:
+                            # Non-streamed answers arrive whole, which would read as a slow first token
+                            metrics.observe(
+                                "ollama_time_to_first_token_seconds", model_name, first_token_time - start_time
+                            )
+                        metrics.record_ollama_stats(model_name, response_data)
+                        if use_cache and response_text:
+                            cache.put(model_name, temp, prompt, response_text)
+                            if prompt_embedding is not None:
+                                get_semantic_cache(OLLAMA_BASE_URL).add(model_name, prompt, response_text, prompt_embedding)
+                        return {
+                            "success": True,
+                            "response": response_text,
+                            "error_type": None,
+                            "error_message": None,
+                            "context": response_data.get("context"),
+                            "stats": {field: response_data.get(field) for field in OLLAMA_STAT_FIELDS}
+                        }
+                    
+                    except json.JSONDecodeError as e:
+                        logger.error(f"Failed to parse Ollama response JSON: {e}")
+                        return {
+                            "success": False,
+                            "error_type": "json_error",
+                            "error_message": "Failed to parse response from Ollama service",
+                            "response": None
+                        }
+            
+                elif response.status_code == 404:
+                    breakers.release(backend, model_name)
+                    logger.error(f"Model '{model_name}' not found")
+                    return {
+                        "success": False,
+                        "error_type": "model_error",
+                        "error_message": f"Model '{model_name}' not found. Please check if the model is installed.",
+                        "response": None
+                    }
+            
+                elif response.status_code == 500:
+                    logger.error("Ollama internal server error")
+                    breakers.record_model_failure(backend, model_name)
+                    if attempt < MAX_RETRIES - 1:
+                        wait_time = backoff_delay(attempt)
+                        logger.info(f"Retrying in {wait_time:.2f} seconds...")
+                        time.sleep(min(wait_time, max(0.0, deadline - time.time())))
+                        continue
+                    else:
+                        return {
+                            "success": False,
+                            "error_type": "server_error",
+                            "error_message": "Ollama service is experiencing internal errors",
+                            "response": None
+                        }
+            
+                else:
+                    breakers.release(backend, model_name)
+                    logger.error(f"Ollama API error: {response.status_code}")
+                    return {
+                        "success": False,
+                        "error_type": "api_error",
+                        "error_message": f"Ollama API returned error code: {response.status_code}",
+                        "response": None
+                    }
+                
+            except GenerationCancelled:
+                # Leaving the with-block above closed the connection, so Ollama stops generating
+                breakers.release(backend, model_name)
+                return cancelled_result(model_name, "".join(streamed_parts), session_id)
+        
+            except requests.exceptions.Timeout:
+                logger.error(f"Ollama request timeout on attempt {attempt + 1} after {attempt_timeout:.1f}s")
+                breakers.record_model_failure(backend, model_name)
+                if attempt_timeout < remaining:
+                    # Only a full timeout says something about this bucket; one cut short by the deadline does not
+                    timeouts.observe(model_name, prompt_length, WIRE_STREAM, attempt_timeout)
+                timed_out_after = attempt_timeout
+                if attempt < MAX_RETRIES - 1:
+                    continue
+                else:
+                    return {
+                        "success": False,
+                        "error_type": "timeout_error",
+                        "error_message": f"Request timed out after {attempt_timeout:.0f} seconds. Ollama may be processing a heavy request.",
+                        "response": None
+                    }
+        
+            except requests.exceptions.ConnectionError:
+                logger.error(f"Connection error on attempt {attempt + 1}")
+                breakers.record_backend_failure(backend, model_name)
+                if attempt < MAX_RETRIES - 1:
+                    time.sleep(min(backoff_delay(attempt), max(0.0, deadline - time.time())))
+                    continue
+                else:
+                    return {
+                        "success": False,
+                        "error_type": "connection_error",
+                        "error_message": "Cannot connect to Ollama service. Please ensure it's running.",
+                        "response": None
+                    }
+        
+            except Exception as e:
+                logger.error(f"Unexpected error on attempt {attempt + 1}: {e}")
+                logger.error(traceback.format_exc())
+                breakers.release(backend, model_name)
+                if attempt < MAX_RETRIES - 1:
+                    continue
+                else:
+                    return {
+                        "success": False,
+                        "error_type": "unexpected_error",
+                        "error_message": f"An unexpected error occurred: {str(e)}",
+                        "response": None
+                    }
+            finally:
+                pool.release(backend)
+    
+        return {
+            "success": False,
+            "error_type": "max_retries_exceeded",
+            "error_message": f"Failed after {MAX_RETRIES} attempts",
+            "response": None
+        }
+    finally:
+        scheduler.release(ticket)
+
+
+def record_result_metrics(model_name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Count errors by error_type and requests answered without a generation"""
+    metrics = get_metrics()
+    if result.get("error_type") == "cancelled":
+        metrics.inc("ollama_cancelled_total", model=model_name)
+    elif not result["success"]:
+        metrics.inc("ollama_errors_total", error_type=result["error_type"])
+    elif result.get("cached") or result.get("coalesced"):
+        metrics.inc("ollama_cache_hits_total", model=model_name)
+    return result
+
+
+def query_ollama(prompt: str, model_name: str, temp: float,
+                 on_token: Optional[Callable[[str], None]] = None,
+                 context: Optional[List[int]] = None,
+                 history: Optional[List[Dict[str, Any]]] = None,
+                 session_id: str = "default",
+                 on_queue: Optional[Callable[[int], None]] = None,
+                 cancel: Optional[threading.Event] = None,
+                 deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Enhanced Ollama query function with comprehensive error handling and logging
+    Returns a dictionary with success status, response, and error details
+
+    When on_token is given the request is streamed and every token is passed to
+    on_token as soon as Ollama produces it. Retries only happen while nothing has
+    been streamed yet; a failure mid-stream returns the partial text in "response".
+
+    For multi-turn conversations pass the "context" returned by the previous turn,
+    so Ollama only has to prefill the new message. Without a context, earlier
+    turns from history are sent as a token-budgeted sliding window instead.
+    Successful results carry the new "context" for the next turn, and generated
+    (not cached) ones Ollama's token counts and durations in "stats".
+
+    Generations first pass admission control: per-session and global token
+    budgets and a cap on the queue. A request turned away fails at once with
+    error_type "rate_limited" (this session) or "busy" (everyone) and a
+    "retry_after" in seconds. Admitted ones wait for a slot from the shared
+    scheduler, which serves sessions round-robin; on_queue receives the
+    caller's queue position while it waits and 0 once the slot is granted.
+
+    Identical stateless requests that arrive while one is already running attach
+    to it and receive the same token stream and result ("coalesced": True).
+
+    Setting cancel (from another thread) stops the request: it leaves the queue,
+    or its connection to Ollama is closed, which frees the generation slot. The
+    result has error_type "cancelled" and the partial answer in "response". A
+    generation shared with coalesced requests keeps running for them, while
+    new identical requests no longer attach to it.
+
+    deadline (a time.time() value, default SEND_DEADLINE from now) bounds the
+    queue wait and every attempt; no retry starts once too little of it is left.
+    Each attempt's timeout is learned from recent latencies of the model at a
+    similar prompt length. An answer still streaming when the deadline passes
+    is cut off: the result has error_type "timeout_error" and the partial
+    answer in "response".
+    """
+    try:
+        admission = get_admission_control().admit(
+            session_id, model_name, estimate_tokens(prompt), get_scheduler().snapshot()["queued"]
+        )
+    except AdmissionRejected as e:
+        return record_result_metrics(model_name, rejected_result(model_name, session_id, e))
+    result = None
+    try:
+        result = coalesced_query(
+            prompt, model_name, temp, on_token, context, history, session_id, on_queue, cancel, deadline
+        )
+        return result
+    finally:
+        settle_admission(admission, result)
+
+
+def coalesced_query(prompt: str, model_name: str, temp: float,
+                    on_token: Optional[Callable[[str], None]],
+                    context: Optional[List[int]],
+                    history: Optional[List[Dict[str, Any]]],
+                    session_id: str,
+                    on_queue: Optional[Callable[[int], None]],
+                    cancel: Optional[threading.Event],
+                    deadline: Optional[float]) -> Dict[str, Any]:
+    """Generate, or attach to an identical stateless request already in flight; see query_ollama"""
+    if context or history:
+        return record_result_metrics(
+            model_name,
+            generate_response(
+                prompt, model_name, temp, on_token, context, history, session_id, on_queue, cancel, deadline
+            )
+        )
+    
+    flights = get_single_flight()
+    flight, is_leader = flights.join(cache_key(model_name, temp, prompt))
+    if not is_leader:
+        logger.info(f"Coalescing request for '{model_name}' with an identical one in flight")
+        log_user_interaction("ollama_coalesced", {"model": model_name, "prompt_length": len(prompt)})
+        result = flight.follow(on_token, cancel)
+        if result is None:
+            flights.leave(flight)
+            result = cancelled_result(model_name, flight.partial_text(), session_id)
+        return record_result_metrics(model_name, result)
+    
+    def run_flight(on_token: Optional[Callable[[str], None]],
+                   on_queue: Optional[Callable[[int], None]],
+                   cancel: Optional[SharedCancel]) -> Dict[str, Any]:
+        result = None
+        try:
+            result = generate_response(
+                prompt, model_name, temp, on_token, context, history, session_id, on_queue, cancel, deadline
+            )
+            return result
+        finally:
+            flights.complete(flight, result or {
+                "success": False,
+                "error_type": "unexpected_error",
+                "error_message": "The shared request failed unexpectedly",
+                "response": None
+            })
+
+    if cancel is None:
+        return record_result_metrics(
+            model_name, run_flight(flight.relay(on_token) if on_token else None, on_queue, None)
+        )
+    # A leader that can be stopped runs the generation on its own thread, so it can
+    # leave while followers keep receiving the answer; queue positions only reach it while attached
+    result = flights.lead(flight, functools.partial(
+        run_flight,
+        flight.relay() if on_token else None,
+        (lambda position: on_queue(position) if flight.leader_attached else None) if on_queue else None,
+        SharedCancel(flight)
+    ), on_token, cancel)
+    if result is None:
+        result = cancelled_result(model_name, flight.partial_text(), session_id)
+    return record_result_metrics(model_name, result)
+
+
+@st.cache_resource
+def get_generation_executor() -> ThreadPoolExecutor:
+    """
+    Threads that run query_ollama for UI sessions, so the script thread stays
+    free to render tokens and to be interrupted by a Stop click
+    """
+    return ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generation")
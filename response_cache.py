@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB_PATH = "response_cache.db"
+CACHE_MAX_ENTRIES = 500  # in-memory LRU size
+CACHE_MAX_DISK_ENTRIES = 10000
+CACHE_TTL = 7 * 24 * 3600  # seconds
+CACHE_TEMPERATURE_RANGE = (0.0, 0.0)  # only deterministic answers are cached by default
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r"\s+", " ", prompt.strip().lower()).rstrip("?!. ")
+
+
+def cache_key(model_name: str, temp: float, prompt: str) -> str:
+    """Stable key for (model, temperature, normalized prompt)"""
+    raw = f"{model_name}\n{round(temp, 2)}\n{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    In-memory LRU with TTL in front of a SQLite store, so cached answers
+    survive restarts. Safe to share between sessions.
+    """
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_disk_entries: int = CACHE_MAX_DISK_ENTRIES, ttl: float = CACHE_TTL,
+                 temperature_range: Tuple[float, float] = CACHE_TEMPERATURE_RANGE):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.temperature_range = temperature_range
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "writes": 0}
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL)"
+        )
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl,))
+        self._db.commit()
+
+    def is_cacheable(self, temp: float) -> bool:
+        low, high = self.temperature_range
+        return low <= temp <= high
+
+    def get(self, model_name: str, temp: float, prompt: str) -> Optional[str]:
+        """Cached response, or None on a miss"""
+        key = cache_key(model_name, temp, prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if now - created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return response
+                del self._memory[key]
+
+            row = self._db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl:
+                self._remember(key, row[0], row[1])
+                self.stats["hits"] += 1
+                self.stats["disk_hits"] += 1
+                return row[0]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, model_name: str, temp: float, prompt: str, response: str):
+        """Store a response in memory and on disk"""
+        key = cache_key(model_name, temp, prompt)
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                    (key, model_name, response, now)
+                )
+                self.stats["writes"] += 1
+                if self.stats["writes"] % 100 == 0:
+                    self._prune_disk(now)
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to persist cached response: {e}")
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune_disk(self, now: float):
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)",
+            (self.max_disk_entries,)
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "memory_entries": len(self._memory)}
+
+
+@st.cache_resource
+def get_response_cache(db_path: str = CACHE_DB_PATH) -> ResponseCache:
+    """Process-wide response cache shared by every session"""
+    return ResponseCache(db_path)
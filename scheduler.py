@@ -0,0 +1,201 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque, Counter
+from typing import Optional, Dict, Any, Callable, Deque
+
+import streamlit as st
+
+from ollama_client import OLLAMA_BACKENDS
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_GENERATIONS = 4  # generations sent to each Ollama backend at once, across all models
+PER_MODEL_CONCURRENCY = 2  # default cap per model and backend
+MODEL_CONCURRENCY: Dict[str, int] = {}  # per-model overrides per backend, e.g. {"codellama": 1}
+MAX_SAME_MODEL_STREAK = 4  # grants in a row for one model while others wait
+QUEUE_TIMEOUT = 120  # seconds a request may wait for a slot
+CANCEL_POLL_INTERVAL = 0.1  # seconds between checks of a waiting request's cancel event
+
+
+class QueueTimeout(Exception):
+    """Raised when a request waited too long for a generation slot"""
+
+
+class GenerationCancelled(Exception):
+    """Raised when the caller stopped a request before it finished"""
+
+
+class Ticket:
+    """A queued request for one generation slot"""
+
+    _ids = itertools.count()
+
+    def __init__(self, session_id: str, model_name: str):
+        self.id = next(self._ids)
+        self.session_id = session_id
+        self.model_name = model_name
+        self.enqueued_at = time.time()
+        self.granted_at: Optional[float] = None
+
+    @property
+    def queue_wait(self) -> float:
+        return (self.granted_at or time.time()) - self.enqueued_at
+
+
+class GenerationScheduler:
+    """
+    Hands out generation slots to waiting Streamlit script threads.
+    Slots are bounded overall and per model; sessions are served round-robin so
+    one busy user cannot starve others, and requests for a model that is already
+    running are preferred to avoid Ollama swapping models in and out.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_GENERATIONS,
+                 per_model_limit: int = PER_MODEL_CONCURRENCY,
+                 model_limits: Optional[Dict[str, int]] = None,
+                 max_streak: int = MAX_SAME_MODEL_STREAK):
+        self.max_concurrent = max_concurrent
+        self.per_model_limit = per_model_limit
+        self.model_limits = dict(model_limits or MODEL_CONCURRENCY)
+        self.max_streak = max_streak
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[Ticket]] = {}  # session id -> waiting tickets
+        self._rotation: Deque[str] = deque()  # round-robin order of sessions with waiting tickets
+        self._running: Counter = Counter()  # model -> generations in flight
+        self._last_model: Optional[str] = None
+        self._streak = 0
+
+    def model_limit(self, model_name: str) -> int:
+        return self.model_limits.get(model_name, self.per_model_limit)
+
+    def acquire(self, session_id: str, model_name: str,
+                on_wait: Optional[Callable[[int], None]] = None,
+                timeout: float = QUEUE_TIMEOUT,
+                cancel: Optional[threading.Event] = None) -> Ticket:
+        """
+        Block until a slot is granted. on_wait is called with the 1-based queue
+        position whenever it changes while waiting. Setting cancel leaves the
+        queue (GenerationCancelled).
+        """
+        ticket = Ticket(session_id, model_name)
+        deadline = ticket.enqueued_at + timeout
+        last_position = None
+        with self._cond:
+            if session_id not in self._queues:
+                self._queues[session_id] = deque()
+                self._rotation.append(session_id)
+            self._queues[session_id].append(ticket)
+            self._dispatch()
+            try:
+                while ticket.granted_at is None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise QueueTimeout(f"Waited {timeout}s for a generation slot")
+                    if cancel is not None and cancel.is_set():
+                        raise GenerationCancelled("Stopped while waiting for a generation slot")
+                    position = self._position(ticket)
+                    if on_wait and position != last_position:
+                        last_position = position
+                        self._cond.release()
+                        try:
+                            on_wait(position)
+                        finally:
+                            self._cond.acquire()
+                        continue
+                    self._cond.wait(min(remaining, 1.0 if cancel is None else CANCEL_POLL_INTERVAL))
+            except BaseException:
+                # Leave the queue, or give back a slot granted while on_wait ran
+                if ticket.granted_at is None:
+                    self._remove(ticket)
+                else:
+                    self._release(ticket)
+                raise
+        if ticket.queue_wait > 0.1:
+            logger.info(f"Generation slot for '{model_name}' granted after {ticket.queue_wait:.2f}s in queue")
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Give the slot back and wake the next request"""
+        with self._cond:
+            self._release(ticket)
+
+    def _release(self, ticket: Ticket):
+        """Free a granted slot (caller holds the lock)"""
+        self._running[ticket.model_name] -= 1
+        if self._running[ticket.model_name] <= 0:
+            del self._running[ticket.model_name]
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant slots while capacity allows (caller holds the lock)"""
+        granted = False
+        while sum(self._running.values()) < self.max_concurrent:
+            ticket = self._pick_next()
+            if ticket is None:
+                break
+            self._remove(ticket)
+            self._running[ticket.model_name] += 1
+            ticket.granted_at = time.time()
+            if ticket.model_name == self._last_model:
+                self._streak += 1
+            else:
+                self._last_model = ticket.model_name
+                self._streak = 1
+            # The session just served goes to the back of the rotation
+            if ticket.session_id in self._rotation:
+                self._rotation.remove(ticket.session_id)
+                self._rotation.append(ticket.session_id)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _pick_next(self) -> Optional[Ticket]:
+        """Head of the first session in rotation, preferring models already loaded"""
+        heads = [self._queues[session_id][0] for session_id in self._rotation]
+        eligible = [t for t in heads if self._running[t.model_name] < self.model_limit(t.model_name)]
+        if not eligible:
+            return None
+        others = [t for t in eligible if t.model_name != self._last_model]
+        if self._streak >= self.max_streak and others:
+            return others[0]
+        for ticket in eligible:
+            if ticket.model_name in self._running or ticket.model_name == self._last_model:
+                return ticket
+        return eligible[0]
+
+    def _remove(self, ticket: Ticket):
+        queue = self._queues.get(ticket.session_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[ticket.session_id]
+            self._rotation.remove(ticket.session_id)
+
+    def _position(self, ticket: Ticket) -> int:
+        """Approximate place in line under round-robin service"""
+        queue = self._queues[ticket.session_id]
+        rounds_ahead = queue.index(ticket)
+        sessions_ahead = list(self._rotation).index(ticket.session_id)
+        return rounds_ahead * len(self._rotation) + sessions_ahead + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "running": dict(self._running),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "sessions_waiting": len(self._rotation)
+            }
+
+
+@st.cache_resource
+def get_scheduler() -> GenerationScheduler:
+    """Process-wide generation scheduler shared by every session, sized for every backend"""
+    backends = len(OLLAMA_BACKENDS)
+    return GenerationScheduler(
+        MAX_CONCURRENT_GENERATIONS * backends,
+        PER_MODEL_CONCURRENCY * backends,
+        {model_name: limit * backends for model_name, limit in MODEL_CONCURRENCY.items()}
+    )
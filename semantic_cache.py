@@ -0,0 +1,196 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple
+
+import numpy as np
+import requests
+import streamlit as st
+
+from ollama_client import OLLAMA_BASE_URL, OllamaClient, get_ollama_client
+from health_monitor import HEALTH_CHECK_INTERVAL
+from response_cache import normalize_prompt
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "nomic-embed-text"
+SIMILARITY_THRESHOLD = 0.92  # cosine similarity needed to reuse an answer
+SEMANTIC_MAX_ENTRIES = 2000  # rows in the index; least recently used rows are overwritten
+SEMANTIC_INDEX_PATH = "semantic_cache.npy"
+SEMANTIC_DB_PATH = "semantic_cache.db"
+EMBEDDING_RETRY_INTERVAL = HEALTH_CHECK_INTERVAL  # seconds before a missing embedding model is asked for again
+
+
+class SemanticCache:
+    """
+    Answer cache matched on prompt meaning rather than exact text.
+    Prompt embeddings live in one contiguous, memory-mapped float32 matrix of
+    unit vectors, so a lookup is a single matrix-vector product. Answers and
+    row metadata are kept in SQLite next to it.
+    """
+
+    def __init__(self, client: OllamaClient, embedding_model: str = EMBEDDING_MODEL,
+                 threshold: float = SIMILARITY_THRESHOLD, max_entries: int = SEMANTIC_MAX_ENTRIES,
+                 index_path: str = SEMANTIC_INDEX_PATH, db_path: str = SEMANTIC_DB_PATH):
+        self.client = client
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.index_path = index_path
+        self._model_missing_at: Optional[float] = None  # when the embedding model was last found missing
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._models = np.full(max_entries, -1, dtype=np.int32)  # model code per row, -1 = empty
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._model_codes: Dict[str, int] = {}
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "row INTEGER PRIMARY KEY, model TEXT, prompt TEXT, response TEXT, last_used REAL)"
+        )
+        self._db.commit()
+        self._load()
+
+    def _code(self, model_name: str) -> int:
+        if model_name not in self._model_codes:
+            self._model_codes[model_name] = len(self._model_codes)
+        return self._model_codes[model_name]
+
+    def _load(self):
+        """Map the existing index file; rows are paged in by the OS on first use"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            vectors = np.load(self.index_path, mmap_mode="r+")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable semantic index {self.index_path}: {e}")
+            return
+        if vectors.ndim != 2 or vectors.shape[0] != self.max_entries:
+            logger.info("Semantic index capacity changed, starting with an empty index")
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+            return
+        self._vectors = vectors
+        for row, model_name, last_used in self._db.execute("SELECT row, model, last_used FROM entries"):
+            self._models[row] = self._code(model_name)
+            self._last_used[row] = last_used
+        logger.info(f"Loaded semantic index with {int((self._models >= 0).sum())} entries")
+
+    def _ensure_index(self, dim: int):
+        if self._vectors is not None and self._vectors.shape[1] == dim:
+            return
+        # New index, or the embedding model changed dimension
+        self._vectors = np.lib.format.open_memmap(
+            self.index_path, mode="w+", dtype=np.float32, shape=(self.max_entries, dim)
+        )
+        self._models[:] = -1
+        self._last_used[:] = 0
+        self._db.execute("DELETE FROM entries")
+        self._db.commit()
+
+    def embed(self, prompt: str) -> Optional[np.ndarray]:
+        """
+        Unit-length embedding of the normalized prompt, or None if unavailable.
+        While the embedding model is missing, one request every
+        EMBEDDING_RETRY_INTERVAL checks whether it has been pulled since.
+        """
+        with self._lock:
+            missing_at = self._model_missing_at
+            if missing_at is not None:
+                if time.time() - missing_at < EMBEDDING_RETRY_INTERVAL:
+                    return None
+                self._model_missing_at = time.time()  # the other requests keep skipping while this one checks
+        try:
+            response = self.client.post("embeddings", {
+                "model": self.embedding_model,
+                "prompt": normalize_prompt(prompt)
+            })
+            if response.status_code == 404:
+                if missing_at is None:
+                    logger.warning(f"Embedding model '{self.embedding_model}' not installed, semantic cache disabled")
+                with self._lock:
+                    self._model_missing_at = time.time()
+                return None
+            if response.status_code != 200:
+                logger.warning(f"Embedding request failed with status {response.status_code}")
+                return None
+            if missing_at is not None:
+                with self._lock:
+                    self._model_missing_at = None
+                logger.info(f"Embedding model '{self.embedding_model}' available, semantic cache enabled")
+            vector = np.asarray(response.json()["embedding"], dtype=np.float32)
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.warning(f"Embedding request failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        if vector.ndim != 1 or norm == 0:
+            return None
+        return vector / norm
+
+    def lookup(self, model_name: str, prompt: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Find a cached answer for a similar prompt to the same model.
+        Returns (response or None, prompt embedding) so a miss can be added without re-embedding.
+        """
+        vector = self.embed(prompt)
+        if vector is None:
+            return None, None
+        with self._lock:
+            code = self._model_codes.get(model_name)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0] or code is None:
+                self.stats["misses"] += 1
+                return None, vector
+            scores = np.where(self._models == code, self._vectors @ vector, -1.0)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None, vector
+            now = time.time()
+            self._last_used[best] = now
+            row = self._db.execute("SELECT response FROM entries WHERE row = ?", (best,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None, vector
+            self._db.execute("UPDATE entries SET last_used = ? WHERE row = ?", (now, best))
+            self._db.commit()
+            self.stats["hits"] += 1
+        logger.info(f"Semantic cache hit for '{model_name}' (similarity {scores[best]:.3f})")
+        return row[0], vector
+
+    def add(self, model_name: str, prompt: str, response: str, vector: np.ndarray):
+        """Store an answer, overwriting the least recently used row when full"""
+        with self._lock:
+            self._ensure_index(vector.shape[0])
+            empty_rows = np.flatnonzero(self._models < 0)
+            row = int(empty_rows[0]) if len(empty_rows) else int(np.argmin(self._last_used))
+            now = time.time()
+            self._vectors[row] = vector
+            self._models[row] = self._code(model_name)
+            self._last_used[row] = now
+            try:
+                self._vectors.flush()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (row, model, prompt, response, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (row, model_name, prompt, response, now)
+                )
+                self._db.commit()
+            except (OSError, sqlite3.Error) as e:
+                logger.error(f"Failed to persist semantic cache entry: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "entries": int((self._models >= 0).sum()),
+                "enabled": self._model_missing_at is None
+            }
+
+
+@st.cache_resource
+def get_semantic_cache(base_url: str = OLLAMA_BASE_URL) -> SemanticCache:
+    """Process-wide semantic cache shared by every session"""
+    return SemanticCache(get_ollama_client(base_url))
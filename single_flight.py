@@ -0,0 +1,154 @@
+import logging
+import threading
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+import streamlit as st
+
+from scheduler import CANCEL_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One in-flight generation that several callers can share"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.followers = 0
+        self.leader_attached = True
+        self._cond = threading.Condition()
+        self._tokens: List[str] = []
+        self._result: Optional[Dict[str, Any]] = None
+
+    def relay(self, on_token: Optional[Callable[[str], None]] = None) -> Callable[[str], None]:
+        """Wrap the leader's token callback (if any) so followers see the same stream"""
+        def publish(token: str):
+            with self._cond:
+                self._tokens.append(token)
+                self._cond.notify_all()
+            if on_token:
+                on_token(token)
+        return publish
+
+    def finish(self, result: Dict[str, Any]):
+        with self._cond:
+            self._result = result
+            self._cond.notify_all()
+
+    def partial_text(self) -> str:
+        with self._cond:
+            return "".join(self._tokens)
+
+    def follow(self, on_token: Optional[Callable[[str], None]] = None,
+               cancel: Optional[threading.Event] = None) -> Optional[Dict[str, Any]]:
+        """
+        Replay tokens seen so far, keep streaming new ones, and return the
+        leader's result, or None once cancel is set
+        """
+        result = self.wait(on_token, cancel)
+        if result is not None:
+            result["coalesced"] = True
+        return result
+
+    def wait(self, on_token: Optional[Callable[[str], None]] = None,
+             cancel: Optional[threading.Event] = None) -> Optional[Dict[str, Any]]:
+        """follow() for the leader itself: the same result, not marked as coalesced"""
+        sent = 0
+        with self._cond:
+            while True:
+                if on_token and sent < len(self._tokens):
+                    pending = self._tokens[sent:]
+                    sent = len(self._tokens)
+                    self._cond.release()
+                    try:
+                        on_token("".join(pending))
+                    finally:
+                        self._cond.acquire()
+                    continue
+                if self._result is not None:
+                    break
+                if cancel is not None and cancel.is_set():
+                    return None
+                self._cond.wait(1.0 if cancel is None else CANCEL_POLL_INTERVAL)
+            result = dict(self._result)
+        # A non-streaming leader produced no tokens; hand over the answer in one piece
+        if on_token and sent == 0 and result.get("response"):
+            on_token(result["response"])
+        return result
+
+
+class SharedCancel:
+    """Cancel event of a flight's generation, set once the leader and every follower have left"""
+
+    def __init__(self, flight: Flight):
+        self.flight = flight
+
+    def is_set(self) -> bool:
+        return not self.flight.leader_attached and self.flight.followers == 0
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first caller for a key runs
+    the generation, later callers attach to it until it finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def join(self, key: str) -> Tuple[Flight, bool]:
+        """Returns (flight, is_leader)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.stats["followers"] += 1
+                return flight, False
+            flight = Flight(key)
+            self._flights[key] = flight
+            self.stats["leaders"] += 1
+            return flight, True
+
+    def leave(self, flight: Flight):
+        """A follower stopped waiting for the flight"""
+        with self._lock:
+            flight.followers -= 1
+
+    def lead(self, flight: Flight, generate: Callable[[], Any],
+             on_token: Optional[Callable[[str], None]], cancel: threading.Event) -> Optional[Dict[str, Any]]:
+        """
+        Run the leader's generation on its own thread, which must complete()
+        the flight, and wait for the result. Once cancel is set the leader
+        detaches and gets None: the flight takes no new followers, and the
+        generation keeps running for those already attached or stops if none are.
+        """
+        threading.Thread(target=generate, name="single-flight", daemon=True).start()
+        result = flight.wait(on_token, cancel)
+        if result is None:
+            with self._lock:
+                flight.leader_attached = False
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            logger.info(f"Leader stopped a generation shared with {flight.followers} coalesced request(s)")
+        return result
+
+    def complete(self, flight: Flight, result: Dict[str, Any]):
+        """Publish the leader's result and stop accepting followers"""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if flight.followers:
+            logger.info(f"Shared one generation with {flight.followers} coalesced request(s)")
+        flight.finish(result)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._flights)}
+
+
+@st.cache_resource
+def get_single_flight() -> SingleFlight:
+    """Process-wide single-flight group shared by every session"""
+    return SingleFlight()
@@ -0,0 +1,46 @@
+"""
+Shared setup: one stub Ollama server for the whole run. It has to be started,
+and OLLAMA_BASE_URL / OLLAMA_BACKENDS pointed at it, before any app module
+is imported, since ollama_client reads them at import time.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import streamlit.logger
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.stub_ollama import StubConfig, StubOllama  # noqa: E402
+
+STUB = StubOllama().start()
+os.environ["OLLAMA_BASE_URL"] = STUB.url
+os.environ["OLLAMA_BACKENDS"] = STUB.url
+streamlit.logger.set_log_level("error")  # silence bare-mode cache warnings
+
+TEMPERATURE = 0.9  # above the cacheable range, so every request reaches the stub
+
+
+@pytest.fixture
+def stub() -> StubOllama:
+    """The stub with default settings, fresh counters and closed circuits"""
+    from circuit_breaker import get_circuit_breakers
+
+    STUB.config = StubConfig()
+    STUB.reset_stats()
+    get_circuit_breakers.clear()
+    yield STUB
+    STUB.config = StubConfig()
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    """Poll condition until it holds or timeout seconds pass"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
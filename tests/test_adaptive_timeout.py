@@ -0,0 +1,28 @@
+from adaptive_timeout import MIN_SAMPLES, AdaptiveTimeouts
+
+
+def test_default_applies_until_enough_samples():
+    timeouts = AdaptiveTimeouts(min_timeout=1, max_timeout=60)
+    for _ in range(MIN_SAMPLES - 1):
+        timeouts.observe("llama2", 100, True, 1.0)
+    assert timeouts.timeout_for("llama2", 100, True, default=30) == 30
+    timeouts.observe("llama2", 100, True, 1.0)
+    assert timeouts.timeout_for("llama2", 100, True, default=30) == 2.0
+
+
+def test_timeout_grows_when_attempts_time_out():
+    timeouts = AdaptiveTimeouts(min_timeout=1, max_timeout=10)
+    for _ in range(MIN_SAMPLES):
+        timeouts.observe("llama2", 100, False, 1.0)
+    assert timeouts.timeout_for("llama2", 100, False, default=30) == 2.0
+
+    # Attempts that time out are recorded at their timeout, which raises the quantile
+    timeouts.observe("llama2", 100, False, 2.0)
+    assert timeouts.timeout_for("llama2", 100, False, default=30) == 4.0
+    timeouts.observe("llama2", 100, False, 4.0)
+    assert timeouts.timeout_for("llama2", 100, False, default=30) == 8.0
+    timeouts.observe("llama2", 100, False, 8.0)
+    assert timeouts.timeout_for("llama2", 100, False, default=30) == 10
+    # Other prompt lengths and modes keep their own samples
+    assert timeouts.timeout_for("llama2", 100, True, default=30) == 30
+    assert timeouts.timeout_for("llama2", 10000, False, default=30) == 30
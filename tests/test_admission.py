@@ -0,0 +1,28 @@
+import pytest
+
+from admission import EXPECTED_OUTPUT_TOKENS, AdmissionControl, AdmissionRejected
+
+
+def test_rejected_request_is_admitted_after_a_settle_refund():
+    control = AdmissionControl(session_rate=1, session_burst=500, global_rate=1000, global_burst=100000)
+    first = control.admit("member", "llama2", 100, queued=0)
+    assert first.cost == 100 + EXPECTED_OUTPUT_TOKENS
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        control.admit("member", "llama2", 100, queued=0)
+    assert rejected.value.reason == "rate_limited"
+    assert rejected.value.retry_after > 60
+    # Other sessions have their own budget
+    control.admit("other member", "llama2", 100, queued=0)
+
+    # The answer was much shorter than estimated; the difference comes back
+    control.settle(first, used_tokens=50)
+    control.admit("member", "llama2", 100, queued=0)
+    assert control.snapshot()["rejected"] == {"rate_limited": 1, "busy": 0}
+
+
+def test_full_queue_turns_requests_away():
+    control = AdmissionControl(max_queue_depth=4)
+    with pytest.raises(AdmissionRejected) as rejected:
+        control.admit("member", "llama2", 10, queued=4)
+    assert rejected.value.reason == "busy"
@@ -0,0 +1,22 @@
+import json
+
+import batch_runner
+
+
+def test_resume_skips_finished_pairs_and_drops_a_torn_line(stub, tmp_path):
+    prompts = tmp_path / "faqs.jsonl"
+    prompts.write_text("".join(
+        json.dumps({"id": item_id, "prompt": f"how many sets for {item_id}?"}) + "\n" for item_id in "abc"
+    ))
+    output = tmp_path / "answers.jsonl"
+    finished = {"id": "a", "model": "llama2", "success": True, "response": "earlier answer"}
+    # The previous run crashed while writing b
+    output.write_text(json.dumps(finished) + "\n" + '{"id": "b", "model": "lla')
+
+    batch_runner.main([str(prompts), "--output", str(output), "--models", "llama2", "--temperature", "0.9"])
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert records[0] == finished
+    assert sorted(record["id"] for record in records) == ["a", "b", "c"]
+    assert all(record["success"] for record in records)
+    assert stub.stats.get("generate") == 2
@@ -0,0 +1,25 @@
+from conftest import wait_for
+from conversation import HistoryCompactor, apply_compaction, start_compaction
+
+
+def test_summary_waits_for_a_slot_like_any_generation(stub):
+    from scheduler import get_scheduler
+
+    scheduler = get_scheduler()
+    held = [scheduler.acquire("other member", "llama2") for _ in range(scheduler.model_limit("llama2"))]
+    messages = [{"role": "user" if seq % 2 == 0 else "assistant", "content": f"message {seq}", "seq": seq}
+                for seq in range(10)]
+    pending = start_compaction(HistoryCompactor(), "llama2", messages, "member")
+    try:
+        assert wait_for(lambda: scheduler.snapshot()["queued"] == 1)
+        assert not pending["future"].done()
+    finally:
+        for ticket in held:
+            scheduler.release(ticket)
+
+    compacted = apply_compaction(messages, pending)
+    assert compacted[0]["role"] == "summary"
+    assert compacted[0]["summarized_messages"] == 4
+    assert compacted[0]["through_seq"] == 3
+    assert compacted[1:] == messages[4:]
+    assert stub.stats.get("generate") == 1
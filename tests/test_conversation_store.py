@@ -0,0 +1,49 @@
+from conversation_store import ConversationStore
+
+
+def test_two_stores_on_one_database_never_overwrite_each_other(tmp_path):
+    db_path = str(tmp_path / "conversations.db")
+    web, api = ConversationStore(db_path), ConversationStore(db_path)
+    # Both start numbering the conversation from 0
+    web_messages = [web.append("c1", "user", f"web {i}") for i in range(5)]
+    api_messages = [api.append("c1", "user", f"api {i}") for i in range(5)]
+    web.flush()
+    api.flush()
+
+    transcript = web.transcript("c1")
+    assert [message["seq"] for message in transcript] == list(range(10))
+    assert sorted(message["content"] for message in transcript) == sorted(
+        [f"web {i}" for i in range(5)] + [f"api {i}" for i in range(5)]
+    )
+    # The messages the callers hold carry the numbers they were stored under
+    stored = {message["content"]: message["seq"] for message in transcript}
+    assert all(message["seq"] == stored[message["content"]] for message in web_messages + api_messages)
+
+
+def test_truncated_flag_is_persisted(tmp_path):
+    db_path = str(tmp_path / "conversations.db")
+    store = ConversationStore(db_path)
+    store.append("c1", "user", "question")
+    store.append("c1", "assistant", "half an answer", truncated=True)
+    store.flush()
+
+    reloaded = ConversationStore(db_path).recent("c1", 10)
+    assert [message.get("truncated", False) for message in reloaded] == [False, True]
+
+
+def test_latest_summary_is_kept_per_conversation(tmp_path):
+    db_path = str(tmp_path / "conversations.db")
+    store = ConversationStore(db_path)
+    store.append("c1", "user", "question")
+    store.flush()
+    for through_seq in (3, 9):
+        store.save_summary("c1", {
+            "role": "summary", "content": f"summary to {through_seq}",
+            "summarized_messages": through_seq + 1, "through_seq": through_seq
+        })
+
+    reloaded = ConversationStore(db_path)
+    assert reloaded.summary("c1") == {
+        "role": "summary", "content": "summary to 9", "summarized_messages": 10, "through_seq": 9
+    }
+    assert reloaded.summary("c2") is None
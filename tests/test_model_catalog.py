@@ -0,0 +1,44 @@
+import threading
+import time
+
+import model_catalog
+from model_catalog import ModelCatalog
+from ollama_client import get_ollama_client
+
+
+def test_failed_fetch_backs_off_both_refresh_paths(monkeypatch):
+    catalog = ModelCatalog([get_ollama_client("http://127.0.0.1:9")])
+    fetches = []
+    monkeypatch.setattr(catalog, "_list", lambda client: fetches.append(time.time()))
+    catalog.refresh()
+    catalog._fetched_at = 0.0  # loaded long ago, so stale
+
+    for _ in range(20):
+        catalog.names()
+        assert not catalog.is_installed("mistral")
+    assert len(fetches) == 1
+
+    # Once the backoff is over, fetching resumes
+    monkeypatch.setattr(model_catalog, "FAILED_FETCH_BACKOFF", 0)
+    assert not catalog.is_installed("mistral")
+    assert len(fetches) > 1
+
+
+def test_refetch_on_a_miss_waits_for_the_running_fetch(stub):
+    catalog = ModelCatalog([get_ollama_client(stub.url)])
+    catalog.refresh()
+    release = threading.Event()
+    fetches = []
+    listed = catalog._list
+
+    def slow_list(client):
+        fetches.append(client)
+        release.wait()
+        return listed(client)
+
+    catalog._list = slow_list
+    catalog._fetched_at = 0.0
+    catalog.names()  # starts a background fetch
+    threading.Timer(0.2, release.set).start()
+    assert not catalog.is_installed("not-a-model")
+    assert len(fetches) == 1
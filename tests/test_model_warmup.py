@@ -0,0 +1,18 @@
+from backend_pool import BackendPool
+from model_warmup import ModelWarmer
+
+UNREACHABLE = "http://127.0.0.1:9"
+
+
+def test_warms_only_where_routing_would_send_the_model(stub):
+    pool = BackendPool([stub.url, UNREACHABLE])
+    warmer = ModelWarmer(pool)
+
+    # Already resident somewhere: only its keep-alive is refreshed there
+    pool._loaded[UNREACHABLE] = {"llama2"}
+    assert warmer.targets("llama2") == [UNREACHABLE]
+    # Otherwise loaded on the backend a request would be routed to
+    assert warmer.targets("mistral") == [stub.url]
+    # Not while that backend is serving other requests, which the load would slow or evict
+    pool._outstanding[stub.url] = 1
+    assert warmer.targets("mistral") == []
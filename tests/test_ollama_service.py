@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from conftest import TEMPERATURE, wait_for
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_cancel_frees_the_slot_and_closes_the_connection(stub, stream):
+    from ollama_service import query_ollama
+    from scheduler import get_scheduler
+
+    # Cancelled long before Ollama sends its response headers
+    stub.config.prefill_delay = 1.0
+    stub.config.token_delay = 0.01
+    stub.config.response_tokens = 200
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    started = time.time()
+    result = query_ollama(
+        f"cancel test {stream}", "llama2", TEMPERATURE,
+        on_token=(lambda token: None) if stream else None, cancel=cancel
+    )
+
+    assert result["error_type"] == "cancelled"
+    assert time.time() - started < 1.0
+    # The generation thread notices within a cancel poll interval and gives the slot back
+    assert wait_for(lambda: get_scheduler().snapshot()["running"] == {}, timeout=1.0)
+    # The abandoned response is closed as soon as it arrives, so the stub stops generating
+    assert wait_for(lambda: stub.stats.get("generate_aborted") == 1)
+
+
+
+def test_whole_answer_callers_learn_the_wait_for_the_first_chunk(stub, monkeypatch):
+    from adaptive_timeout import get_adaptive_timeouts
+    from ollama_service import WIRE_STREAM, query_ollama
+
+    stub.config.prefill_delay = 0.1
+    stub.config.token_delay = 0.02
+    stub.config.response_tokens = 40
+    observed = []
+    monkeypatch.setattr(get_adaptive_timeouts(), "observe", lambda *args: observed.append(args))
+    result = query_ollama(f"first chunk test {time.time()}", "llama2", TEMPERATURE)
+
+    assert result["success"]
+    # The read timeout only covers the gap between chunks, not the 0.8 s the whole answer took
+    [(model_name, _, stream, seconds)] = observed
+    assert (model_name, stream) == ("llama2", WIRE_STREAM)
+    assert 0.1 <= seconds < 0.4
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_deadline_cuts_off_an_answer_still_streaming(stub, stream):
+    from ollama_service import query_ollama
+
+    stub.config.prefill_delay = 0.05
+    stub.config.token_delay = 0.05
+    stub.config.response_tokens = 100
+    started = time.time()
+    result = query_ollama(
+        f"deadline test {stream}", "llama2", TEMPERATURE,
+        on_token=(lambda token: None) if stream else None, deadline=started + 2.5
+    )
+
+    assert result["error_type"] == "timeout_error"
+    assert 0 < len(result["response"].split()) < 100
+    assert time.time() - started < 2.7
+    assert wait_for(lambda: stub.stats.get("generate_aborted") == 1)
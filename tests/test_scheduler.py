@@ -0,0 +1,32 @@
+import pytest
+
+from scheduler import GenerationScheduler
+
+
+def test_on_wait_raising_gives_the_ticket_up():
+    scheduler = GenerationScheduler(max_concurrent=1, per_model_limit=1)
+    running = scheduler.acquire("first", "m")
+
+    def on_wait(position: int):
+        raise RuntimeError("session went away")
+
+    with pytest.raises(RuntimeError):
+        scheduler.acquire("second", "m", on_wait=on_wait)
+    assert scheduler.snapshot()["queued"] == 0
+
+    scheduler.release(running)
+    assert scheduler.snapshot() == {"running": {}, "queued": 0, "sessions_waiting": 0}
+
+
+def test_slot_granted_while_on_wait_runs_is_released():
+    scheduler = GenerationScheduler(max_concurrent=1, per_model_limit=1)
+    running = scheduler.acquire("first", "m")
+
+    def on_wait(position: int):
+        # The slot frees up, and is granted to this ticket, before on_wait fails
+        scheduler.release(running)
+        raise RuntimeError("session went away")
+
+    with pytest.raises(RuntimeError):
+        scheduler.acquire("second", "m", on_wait=on_wait)
+    assert scheduler.snapshot() == {"running": {}, "queued": 0, "sessions_waiting": 0}
@@ -0,0 +1,20 @@
+import semantic_cache
+from ollama_client import get_ollama_client
+from semantic_cache import EMBEDDING_MODEL, SemanticCache
+
+
+def test_embedding_model_pulled_later_is_picked_up(stub, tmp_path, monkeypatch):
+    cache = SemanticCache(
+        get_ollama_client(stub.url), index_path=str(tmp_path / "index.npy"), db_path=str(tmp_path / "cache.db")
+    )
+    stub.config.models = [model for model in stub.config.models if model != EMBEDDING_MODEL]
+    assert cache.embed("how many sets?") is None
+    # Not asked again until the retry interval has passed
+    assert cache.embed("how many reps?") is None
+    assert stub.stats.get("embeddings") == 1
+    assert not cache.snapshot()["enabled"]
+
+    stub.config.models.append(EMBEDDING_MODEL)
+    monkeypatch.setattr(semantic_cache, "EMBEDDING_RETRY_INTERVAL", 0)
+    assert cache.embed("how many sets?") is not None
+    assert cache.snapshot()["enabled"]
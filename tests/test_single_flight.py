@@ -0,0 +1,39 @@
+import threading
+import time
+
+from conftest import TEMPERATURE, wait_for
+
+
+def test_leader_stop_leaves_the_generation_to_its_followers(stub):
+    from ollama_service import query_ollama
+    from single_flight import get_single_flight
+
+    stub.config.prefill_delay = 0.2
+    stub.config.token_delay = 0.01
+    stub.config.response_tokens = 50
+    prompt = f"shared prompt {time.time()}"
+    leader_cancel = threading.Event()
+    results = {}
+
+    def ask(name: str, cancel=None):
+        results[name] = query_ollama(prompt, "llama2", TEMPERATURE, on_token=lambda token: None, cancel=cancel)
+
+    leader = threading.Thread(target=ask, args=("leader", leader_cancel))
+    leader.start()
+    assert wait_for(lambda: get_single_flight().snapshot()["in_flight"] == 1)
+    follower = threading.Thread(target=ask, args=("follower", threading.Event()))
+    follower.start()
+    assert wait_for(lambda: get_single_flight().snapshot()["followers"] >= 1)
+
+    stopped = time.time()
+    leader_cancel.set()
+    leader.join()
+    assert time.time() - stopped < 0.5
+    assert results["leader"]["error_type"] == "cancelled"
+    # A leader that stopped takes no new followers
+    ask("late")
+    assert results["late"]["success"] and not results["late"].get("coalesced")
+
+    follower.join()
+    assert results["follower"]["success"] and results["follower"]["coalesced"]
+    assert stub.stats.get("generate") == 2